@@ -0,0 +1,46 @@
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+
+from .hashers import hashing_slot
+from .models import Customer, UserProfile
+
+# Unique constraints on auth_user (the email one is added by migration 0017)
+DUPLICATE_MESSAGES = {
+    'auth_user_username_key': 'Username already exists',
+    'auth_user_email_uniq': 'Email already exists',
+}
+
+
+class DuplicateAccount(Exception):
+    pass
+
+
+def register_customer(username, email, password, first_name='', last_name=''):
+    """Create a user with the customer role and its Customer record in one transaction.
+
+    Nothing is checked beforehand: the unique indexes on username and email
+    decide, so concurrent signups for the same name cannot both succeed.
+    Raises DuplicateAccount with the user-facing message.
+    """
+    # Hash before the transaction so it is not held open while hashing
+    with hashing_slot():
+        password = make_password(password)
+
+    try:
+        with transaction.atomic():
+            user = User.objects.create(
+                username=User.normalize_username(username),
+                email=User.objects.normalize_email(email),
+                password=password,
+                first_name=first_name,
+                last_name=last_name,
+            )
+            UserProfile.objects.create(user=user, role='customer')
+            Customer.objects.create(user=user, first_name=first_name[:100], last_name=last_name[:100])
+    except IntegrityError as e:
+        constraint = getattr(getattr(e.__cause__, 'diag', None), 'constraint_name', None)
+        if constraint not in DUPLICATE_MESSAGES:
+            raise
+        raise DuplicateAccount(DUPLICATE_MESSAGES[constraint])
+    return user
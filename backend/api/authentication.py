@@ -0,0 +1,61 @@
+"""Login backend and token-backed users for JWT authentication.
+
+ProfileModelBackend is Django's ModelBackend with the user's profile and
+customer fetched in the same query, so issuing a token (which embeds the
+role and customer id) costs one SELECT besides the password check, which
+holds a hashing slot (api.hashers).
+
+With JWT_AUTHENTICATION=stateless, simplejwt's JWTStatelessUserAuthentication
+authenticates requests from the signed token alone and hands views a
+ClaimsUser instead of fetching the auth_user row. Its id, username, role
+and customer id come from the claims; anything else (email, names, a real
+User for a foreign key) loads the row on first use, once per request.
+
+The token is trusted until it expires, so deactivating or deleting a user
+takes effect within ACCESS_TOKEN_LIFETIME rather than immediately.
+"""
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from .hashers import hashing_slot
+
+
+class ProfileModelBackend(ModelBackend):
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = User._default_manager.select_related('profile', 'customer').get(**{User.USERNAME_FIELD: username})
+        except User.DoesNotExist:
+            # Hash anyway so unknown usernames take as long as wrong passwords (as ModelBackend does)
+            with hashing_slot():
+                User().set_password(password)
+            return None
+        with hashing_slot():
+            valid = user.check_password(password)
+        if valid and self.user_can_authenticate(user):
+            return user
+        return None
+
+
+class ClaimsUser(TokenUser):
+    @cached_property
+    def id(self):
+        return int(self.token[api_settings.USER_ID_CLAIM])
+
+    @cached_property
+    def user(self):
+        """The full User row, loaded on first access"""
+        return User.objects.get(pk=self.id)
+
+    def __getattr__(self, attr):
+        if attr in self.token:
+            return self.token[attr]
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        return getattr(self.user, attr)
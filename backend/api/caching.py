@@ -0,0 +1,130 @@
+import calendar
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+def make_etag(*parts):
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def _fresh_version():
+    # Seeded from the clock so a version lost to eviction never reuses an old number
+    return time.time_ns() // 1000
+
+
+def catalog_version():
+    """Current catalog version; changes whenever a product is written"""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, _fresh_version(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        version = _fresh_version()
+        cache.set(CATALOG_VERSION_KEY, version, timeout=None)
+        return version
+
+
+def invalidate_catalog():
+    """Bump the catalog version once the current transaction commits"""
+    transaction.on_commit(bump_catalog_version)
+
+
+class ConditionalGetMixin:
+    """ETag / Last-Modified validators for list and retrieve based on updated_at.
+
+    The validators come from one MAX(updated_at), COUNT(*) query (or the
+    catalog version), so a matching If-None-Match or If-Modified-Since is
+    answered with 304 before anything is serialized.
+    """
+    modified_field = 'updated_at'
+    # When every write bumps the catalog version, list ETags need no query at all
+    use_catalog_version = False
+
+    def list(self, request, *args, **kwargs):
+        if self.use_catalog_version:
+            etag = make_etag('list', request.get_full_path(), catalog_version())
+            last_modified = None
+        else:
+            state = (
+                self.filter_queryset(self.get_queryset())
+                .order_by()
+                .aggregate(last_modified=Max(self.modified_field), count=Count('pk'))
+            )
+            etag = make_etag('list', request.get_full_path(), state['count'], state['last_modified'])
+            last_modified = state['last_modified']
+        return self._conditional(
+            request, etag, last_modified,
+            lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        rows = (
+            self.filter_queryset(self.get_queryset())
+            .filter(**{self.lookup_field: kwargs[lookup_url_kwarg]})
+            .values_list('pk', self.modified_field)[:1]
+        )
+        if not rows:
+            return super().retrieve(request, *args, **kwargs)
+        pk, last_modified = rows[0]
+        etag = make_etag('detail', request.get_full_path(), pk, last_modified)
+        return self._conditional(
+            request, etag, last_modified,
+            lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs),
+        )
+
+    def _conditional(self, request, etag, last_modified, render):
+        timestamp = calendar.timegm(last_modified.utctimetuple()) if last_modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = render()
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+            response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+class CachedResponseMixin:
+    """Cache list and retrieve payloads under the current catalog version.
+
+    Bumping the version orphans every cached entry at once; the orphans age
+    out through CATALOG_CACHE_TIMEOUT and the backend's LRU eviction.
+    """
+    cache_prefix = None
+
+    def list(self, request, *args, **kwargs):
+        return self._cached(request, lambda: super(CachedResponseMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached(request, lambda: super(CachedResponseMixin, self).retrieve(request, *args, **kwargs))
+
+    def _cached(self, request, render):
+        # Absolute URI: paginated payloads embed absolute next/previous links
+        digest = hashlib.sha1(request.build_absolute_uri().encode()).hexdigest()
+        key = f'{self.cache_prefix}:{catalog_version()}:{digest}'
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = render()
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.CATALOG_CACHE_TIMEOUT)
+        return response
@@ -0,0 +1,82 @@
+from collections import Counter
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.db.models import Case, F, When
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from . import rollups
+from .caching import invalidate_catalog
+from .models import Invoice, InvoiceItem, Product
+
+
+class InsufficientStock(Exception):
+    def __init__(self, items):
+        super().__init__('insufficient_stock')
+        self.items = items
+
+
+class CheckoutBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'checkout_busy'
+    default_code = 'checkout_busy'
+
+
+def place_order(customer, lines):
+    """Create a completed invoice for (product_id, quantity) lines and decrement stock.
+
+    Product rows are locked in id order so concurrent checkouts of the same
+    items queue instead of deadlocking, and the lock wait is capped by
+    CHECKOUT_LOCK_TIMEOUT so a hot item cannot pile up blocked workers.
+    """
+    quantities = Counter()
+    for product_id, quantity in lines:
+        quantities[product_id] += quantity
+    product_ids = sorted(quantities)
+
+    try:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT set_config('lock_timeout', %s, true)", [settings.CHECKOUT_LOCK_TIMEOUT])
+
+            products = {
+                p.id: p
+                for p in Product.objects.select_for_update()
+                .filter(id__in=product_ids, retired_at__isnull=True)
+                .order_by('id')
+                .only('id', 'name', 'price', 'quantity')
+            }
+            missing = [pid for pid in product_ids if pid not in products]
+            if missing:
+                raise ValidationError({'items': [f'Unknown product id {pid}' for pid in missing]})
+
+            short = [
+                {'product_id': pid, 'requested': quantities[pid], 'available': products[pid].quantity}
+                for pid in product_ids
+                if products[pid].quantity < quantities[pid]
+            ]
+            if short:
+                raise InsufficientStock(short)
+
+            Product.objects.filter(id__in=product_ids).update(
+                quantity=Case(*[When(id=pid, then=F('quantity') - quantities[pid]) for pid in product_ids]),
+                updated_at=timezone.now(),
+            )
+            invalidate_catalog()
+
+            total = sum((products[pid].price * quantities[pid] for pid in product_ids), Decimal('0'))
+            invoice = Invoice.objects.create(customer=customer, total=total, status='completed')
+            with rollups.track_invoice(invoice.id):
+                InvoiceItem.objects.bulk_create([
+                    InvoiceItem(invoice=invoice, product_id=pid, quantity=quantities[pid], price=products[pid].price)
+                    for pid in product_ids
+                ])
+    except OperationalError as e:
+        if getattr(e.__cause__, 'pgcode', None) == '55P03':  # lock_not_available
+            raise CheckoutBusy()
+        raise
+
+    return invoice
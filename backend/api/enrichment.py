@@ -0,0 +1,163 @@
+"""Database-backed queue of OpenFoodFacts enrichment jobs.
+
+The API only enqueues: creating a product with an openfood_query, or
+POSTing to /enrich, inserts an EnrichmentJob and answers immediately. An
+identical request while a job is still pending or running gets that job
+back (a partial unique constraint backs this up under concurrency).
+
+Workers (manage.py enrichment_worker) claim due jobs with SELECT ... FOR
+UPDATE SKIP LOCKED and hold them under a lease, so several workers can
+run side by side and a crashed worker's jobs are picked up once the lease
+expires. A claimed batch is resolved through the shared OpenFoodFacts
+client, which fetches identical queries once and answers repeats from its
+cache. Results are written back in bulk. Failed lookups are retried with
+exponential backoff until ENRICHMENT_MAX_ATTEMPTS.
+
+enrich_now() is the synchronous counterpart used by the admin batch
+endpoint: it fans a list of lookups out at once and yields each outcome as
+it becomes available, then stores every result with one bulk_update.
+"""
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .caching import invalidate_catalog
+from .models import EnrichmentJob, Product
+from .nutrition import NUTRIENT_FIELDS, set_nutrients
+from .openfoodfacts import get_client, nutrition_summary
+
+JOB_FIELDS = ['status', 'result', 'last_error', 'run_after', 'leased_until', 'finished_at', 'updated_at']
+PRODUCT_FIELDS = ['nutritional_info', *NUTRIENT_FIELDS, 'updated_at']
+ENQUEUE_ATTEMPTS = 3
+
+
+def enqueue(product, query=''):
+    """Queue a lookup by `query`, or by the product's barcode; returns (job, created)"""
+    query = (query or '').strip()[:255]
+    barcode = '' if query else product.barcode
+    active = EnrichmentJob.objects.filter(
+        product=product, query=query, barcode=barcode, status__in=EnrichmentJob.ACTIVE_STATUSES,
+    )
+    for attempt in range(ENQUEUE_ATTEMPTS):
+        job = active.first()
+        if job is not None:
+            return job, False
+        try:
+            with transaction.atomic():
+                job = EnrichmentJob.objects.create(product=product, query=query, barcode=barcode, run_after=timezone.now())
+        except IntegrityError:
+            # A concurrent enqueue won, and its job may already have finished; look again
+            if attempt == ENQUEUE_ATTEMPTS - 1:
+                raise
+            continue
+        return job, True
+
+
+def claim(batch_size):
+    """Lease up to batch_size due jobs to this worker"""
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            EnrichmentJob.objects.select_for_update(skip_locked=True)
+            .filter(Q(status='pending', run_after__lte=now) | Q(status='running', leased_until__lt=now))
+            .order_by('id')[:batch_size]
+        )
+        EnrichmentJob.objects.filter(id__in=[job.id for job in jobs]).update(
+            status='running',
+            attempts=F('attempts') + 1,
+            leased_until=now + timedelta(seconds=settings.ENRICHMENT_LEASE),
+            updated_at=now,
+        )
+    for job in jobs:
+        job.status = 'running'
+        job.attempts += 1
+    return jobs
+
+
+def _retry_delay(attempts):
+    delay = min(settings.ENRICHMENT_RETRY_DELAY * 2 ** (attempts - 1), 3600)
+    return timedelta(seconds=random.uniform(delay / 2, delay))
+
+
+def process(jobs, client=None):
+    """Resolve claimed jobs and record their outcome; returns the number of products enriched"""
+    client = client or get_client()
+    searches = [job for job in jobs if job.query]
+    lookups = [job for job in jobs if not job.query]
+    outcomes = {}
+    for job, (_, products, error) in zip(searches, client.search_many([job.query for job in searches], page_size=1)):
+        outcomes[job.id] = (products[0] if products else None, error)
+    for job, (_, found, error) in zip(lookups, client.product_many([job.barcode for job in lookups])):
+        outcomes[job.id] = (found, error)
+
+    now = timezone.now()
+    enriched = {}
+    for job in jobs:
+        found, error = outcomes[job.id]
+        job.leased_until = None
+        job.updated_at = now
+        if error is not None:
+            job.last_error = str(error)[:1000]
+            if job.attempts >= settings.ENRICHMENT_MAX_ATTEMPTS:
+                job.status, job.finished_at = 'failed', now
+            else:
+                job.status, job.run_after = 'pending', now + _retry_delay(job.attempts)
+        elif found is None:
+            job.status, job.finished_at = 'not_found', now
+        else:
+            job.result = nutrition_summary(found)
+            job.status, job.finished_at = 'succeeded', now
+            enriched[job.product_id] = set_nutrients(Product(id=job.product_id, nutritional_info=job.result, updated_at=now))
+
+    with transaction.atomic():
+        EnrichmentJob.objects.bulk_update(jobs, JOB_FIELDS)
+        if enriched:
+            Product.objects.bulk_update(enriched.values(), PRODUCT_FIELDS)
+            invalidate_catalog()
+    return len(enriched)
+
+
+def run_once(batch_size=50, client=None):
+    """Claim and process one batch; returns how many jobs were handled"""
+    jobs = claim(batch_size)
+    if jobs:
+        process(jobs, client)
+    return len(jobs)
+
+
+def enrich_now(targets, client=None):
+    """Look up (product_id, query) pairs now; yields one result dict per pair, then a summary.
+
+    The lookups run concurrently but results are yielded in the order of
+    targets, so a slow lookup holds back the lines after it. Results are
+    written when the generator finishes or is closed, so a client that
+    disconnects mid-stream still keeps what was fetched.
+    """
+    client = client or get_client()
+    now = timezone.now()
+    enriched = {}
+    counts = {'succeeded': 0, 'not_found': 0, 'failed': 0}
+    try:
+        results = client.search_many([query for _, query in targets], page_size=1)
+        for (product_id, _), (query, products, error) in zip(targets, results):
+            item = {'id': product_id, 'query': query}
+            if error is not None:
+                item.update(status='failed', error=str(error))
+            elif not products:
+                item['status'] = 'not_found'
+            else:
+                info = nutrition_summary(products[0])
+                enriched[product_id] = set_nutrients(Product(id=product_id, nutritional_info=info, updated_at=now))
+                item.update(status='succeeded', nutritional_info=info)
+            counts[item['status']] += 1
+            yield item
+    finally:
+        if enriched:
+            with transaction.atomic():
+                Product.objects.bulk_update(enriched.values(), PRODUCT_FIELDS)
+                invalidate_catalog()
+    yield {'summary': counts}
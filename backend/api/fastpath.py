@@ -0,0 +1,115 @@
+"""Serializer-free read path for hot list endpoints.
+
+A RowMapper is compiled from a bound serializer: every output field becomes
+a values() lookup plus, where DRF does more than pass the value through
+(decimals, datetimes), that field's own to_representation. Rows are then
+fetched with .values() and mapped without instantiating serializers per
+object, which yields the same JSON as the serializer path. Endpoints opt in
+through settings.FAST_READ_ENDPOINTS.
+"""
+from django.conf import settings
+from rest_framework import serializers
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+# Fields whose to_representation returns database values unchanged
+PASSTHROUGH_FIELDS = (
+    serializers.CharField,
+    serializers.IntegerField,
+    serializers.BooleanField,
+    serializers.ChoiceField,
+    serializers.JSONField,
+    serializers.ReadOnlyField,
+    serializers.PrimaryKeyRelatedField,
+)
+
+
+class UnsupportedField(Exception):
+    """Raised when a serializer cannot be expressed as values() lookups"""
+
+
+class RowMapper:
+    def __init__(self, serializer, model):
+        self.model = model
+        self.columns = ['pk']
+        self.plan = []
+        self.nested = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if field.source == '*' or isinstance(field, (serializers.SerializerMethodField, serializers.HyperlinkedRelatedField)):
+                raise UnsupportedField(name)
+            if isinstance(field, serializers.ListSerializer):
+                self._add_nested(name, field)
+                continue
+            if isinstance(field, serializers.BaseSerializer) or isinstance(field, serializers.ManyRelatedField):
+                raise UnsupportedField(name)
+
+            lookup = field.source.replace('.', '__')
+            convert = None if isinstance(field, PASSTHROUGH_FIELDS) else field.to_representation
+            self.columns.append(lookup)
+            self.plan.append((name, lookup, convert))
+
+    def _add_nested(self, name, field):
+        if not isinstance(field.child, serializers.ModelSerializer):
+            raise UnsupportedField(name)
+        relation = self.model._meta.get_field(field.source)
+        if not relation.one_to_many:
+            raise UnsupportedField(name)
+        child_model = relation.related_model
+        self.nested.append((name, relation.field, RowMapper(field.child, child_model)))
+        self.plan.append((name, None, None))
+
+    def map(self, rows):
+        rows = list(rows)
+        children = {}
+        for name, fk, mapper in self.nested:
+            grouped = {row['pk']: [] for row in rows}
+            child_rows = (
+                mapper.model.objects.filter(**{f'{fk.name}__in': list(grouped)})
+                .order_by('pk')
+                .values(fk.attname, *mapper.columns)
+            )
+            for child_row in child_rows:
+                grouped[child_row[fk.attname]].append(child_row)
+            children[name] = {pk: mapper.map(group) for pk, group in grouped.items()}
+
+        mapped = []
+        for row in rows:
+            out = {}
+            for name, lookup, convert in self.plan:
+                if lookup is None:
+                    out[name] = children[name][row['pk']]
+                    continue
+                value = row[lookup]
+                out[name] = value if value is None or convert is None else convert(value)
+            mapped.append(out)
+        return mapped
+
+
+class FastListMixin:
+    """Serve list() from values() rows when the endpoint is enabled in settings"""
+    fast_read_name = None
+
+    def list(self, request, *args, **kwargs):
+        if self.fast_read_name not in settings.FAST_READ_ENDPOINTS:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            mapper = RowMapper(self.get_serializer(), queryset.model)
+        except UnsupportedField:
+            return super().list(request, *args, **kwargs)
+
+        columns = list(mapper.columns)
+        paginator = self.paginator
+        ordering = paginator.get_ordering(request, queryset, self) if isinstance(paginator, CursorPagination) else ()
+        for field in ordering:
+            column = field.lstrip('-')
+            if column not in columns:
+                columns.append(column)
+        rows = queryset.select_related(None).prefetch_related(None).values(*columns)
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(mapper.map(page))
+        return Response(mapper.map(rows))
@@ -0,0 +1,105 @@
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db.models import F, Q
+from rest_framework.exceptions import ValidationError
+
+from .nutrition import NUTRIENT_PARAMS
+
+NUTRITION_SCORES = {'A', 'B', 'C', 'D', 'E'}
+TRUE_VALUES = {'1', 'true', 'yes'}
+FALSE_VALUES = {'0', 'false', 'no'}
+
+
+def _decimal_param(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise ValidationError({name: 'A valid number is required.'})
+
+
+def nutrient_ordering(params):
+    """Cursor ordering for ?ordering=<nutrient> or -<nutrient>, or None when not ordering by a nutrient"""
+    ordering = (params.get('ordering') or '').strip()
+    if not ordering:
+        return None
+    field = NUTRIENT_PARAMS.get(ordering.lstrip('-'))
+    if field is None:
+        raise ValidationError({'ordering': f'Expected one of {", ".join(NUTRIENT_PARAMS)}, optionally prefixed with -.'})
+    descending = ordering.startswith('-')
+    return (f'-{field}', '-id') if descending else (field, 'id')
+
+
+def filter_products(queryset, params):
+    """Apply the catalog query parameters to a Product queryset.
+
+    Supported parameters: search (name/brand/barcode substring), category,
+    nutrition_score (comma separated, e.g. A,B), min_price, max_price,
+    in_stock (true/false), and min_<nutrient>/max_<nutrient> per 100g for
+    kcal, fat, carbs, sugars, protein, salt and fiber. Ordering by a
+    nutrient leaves out products where it is unknown.
+    """
+    search = (params.get('search') or '').strip()
+    if search:
+        queryset = queryset.filter(
+            Q(name__icontains=search) | Q(brand__icontains=search) | Q(barcode__icontains=search)
+        )
+
+    category = params.get('category')
+    if category:
+        queryset = queryset.filter(category=category)
+
+    scores = params.get('nutrition_score')
+    if scores:
+        scores = {s.strip().upper() for s in scores.split(',') if s.strip()}
+        if not scores <= NUTRITION_SCORES:
+            raise ValidationError({'nutrition_score': 'Expected a comma separated list of A-E.'})
+        queryset = queryset.filter(nutrition_score__in=scores)
+
+    min_price = _decimal_param(params, 'min_price')
+    if min_price is not None:
+        queryset = queryset.filter(price__gte=min_price)
+    max_price = _decimal_param(params, 'max_price')
+    if max_price is not None:
+        queryset = queryset.filter(price__lte=max_price)
+
+    in_stock = (params.get('in_stock') or '').lower()
+    if in_stock in TRUE_VALUES:
+        queryset = queryset.filter(quantity__gt=0)
+    elif in_stock in FALSE_VALUES:
+        queryset = queryset.filter(quantity__lte=0)
+    elif in_stock:
+        raise ValidationError({'in_stock': 'Expected true or false.'})
+
+    for param, field in NUTRIENT_PARAMS.items():
+        minimum = _decimal_param(params, f'min_{param}')
+        if minimum is not None:
+            queryset = queryset.filter(**{f'{field}__gte': minimum})
+        maximum = _decimal_param(params, f'max_{param}')
+        if maximum is not None:
+            queryset = queryset.filter(**{f'{field}__lte': maximum})
+
+    ordering = nutrient_ordering(params)
+    if ordering:
+        # Cursor positions cannot point at NULL
+        queryset = queryset.filter(**{f'{ordering[0].lstrip("-")}__isnull': False})
+
+    return queryset
+
+
+def search_products(queryset, query):
+    """Rank products against a free-text query.
+
+    Matches either the weighted full-text vector or, for misspellings, a
+    trigram word similarity on the name. Both predicates are GIN-indexed.
+    """
+    ts_query = SearchQuery(query, config='simple', search_type='websearch')
+    return (
+        queryset
+        .filter(Q(search_vector=ts_query) | Q(name__trigram_word_similar=query))
+        .annotate(rank=SearchRank(F('search_vector'), ts_query) + TrigramWordSimilarity(query, 'name'))
+        .order_by('-rank', '-id')
+    )
@@ -0,0 +1,91 @@
+"""Password hashers with costs taken from settings, and a bound on concurrent hashing.
+
+PASSWORD_HASHER picks the hasher used for new passwords: pbkdf2 (Django's
+default), scrypt (memory-hard, from the standard library) or argon2
+(memory-hard, needs argon2-cffi). The other hashers stay listed so
+existing hashes keep verifying, and Django rehashes a password with the
+current hasher and cost on the user's next login.
+
+Hashing is deliberately slow, so a login storm can take every worker
+thread. Login and registration take a hashing slot first: at most
+PASSWORD_HASH_CONCURRENCY hashes run at once per process, and a request
+that cannot get a slot within PASSWORD_HASH_WAIT seconds is answered 503
+instead of queueing. With gthread workers the remaining threads keep
+serving other endpoints. hashlib and argon2-cffi release the GIL while
+hashing, so the slots can use that many cores.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, PBKDF2PasswordHasher, ScryptPasswordHasher
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return settings.PBKDF2_ITERATIONS or PBKDF2PasswordHasher.iterations
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return settings.SCRYPT_WORK_FACTOR or ScryptPasswordHasher.work_factor
+
+    @property
+    def block_size(self):
+        return settings.SCRYPT_BLOCK_SIZE or ScryptPasswordHasher.block_size
+
+    @property
+    def parallelism(self):
+        return settings.SCRYPT_PARALLELISM or ScryptPasswordHasher.parallelism
+
+    # Only a ceiling (OpenSSL allocates 128 * n * r bytes); its 32 MiB default rejects n=2**15, r=8 and
+    # stored hashes made with a higher cost than the current one
+    maxmem = 1024 ** 3
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return settings.ARGON2_TIME_COST or Argon2PasswordHasher.time_cost
+
+    @property
+    def memory_cost(self):
+        return settings.ARGON2_MEMORY_COST or Argon2PasswordHasher.memory_cost
+
+    @property
+    def parallelism(self):
+        return settings.ARGON2_PARALLELISM or Argon2PasswordHasher.parallelism
+
+
+class HashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'auth_busy'
+    default_code = 'auth_busy'
+
+
+_slots = None
+_slots_lock = threading.Lock()
+
+
+def _semaphore():
+    global _slots
+    with _slots_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(settings.PASSWORD_HASH_CONCURRENCY)
+        return _slots
+
+
+@contextmanager
+def hashing_slot():
+    """Hold one of the process's hashing slots; raises HashingBusy after PASSWORD_HASH_WAIT seconds"""
+    slots = _semaphore()
+    if not slots.acquire(timeout=settings.PASSWORD_HASH_WAIT):
+        raise HashingBusy()
+    try:
+        yield
+    finally:
+        slots.release()
@@ -0,0 +1,131 @@
+"""Batched, idempotent product writes shared by the import commands.
+
+ProductWriter buffers unsaved Product instances and upserts them by
+barcode. Each flush is one transaction holding one SELECT of the buffered
+barcodes' content hashes and at most one INSERT ... ON CONFLICT DO UPDATE,
+so an import costs a constant number of round-trips per batch. Rows whose
+catalog fields hash the same as the stored row are not written at all,
+which makes a re-import a no-op reported as "unchanged". Price and stock
+are only set when a product is first inserted so that re-importing never
+resets them.
+
+In sync mode every row the writer is given, unchanged ones included, is
+stamped with the feed it came from (sync_source) and the time the sync
+started (last_seen_at). retire_missing() soft-retires the live products of
+that same feed with an older stamp instead of deleting them, so invoice
+lines keep pointing at their product, and products created by an admin or
+by another feed are never touched. Unchanged rows cost one extra UPDATE
+per batch for the stamp.
+"""
+import hashlib
+import json
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from .caching import invalidate_catalog
+from .models import Product
+from .nutrition import NUTRIENT_FIELDS, set_nutrients
+
+CATALOG_FIELDS = ['name', 'brand', 'picture', 'category', 'nutrition_score', 'nutritional_info']
+
+
+def content_hash(values):
+    """Stable hash of a {field: value} mapping of catalog fields"""
+    encoded = json.dumps(values, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class ProductWriter:
+    def __init__(self, batch_size=500, update_fields=CATALOG_FIELDS, sync=False, source=''):
+        if sync and not source:
+            raise ValueError('a sync writer needs the name of its source feed')
+        self.batch_size = batch_size
+        self.update_fields = list(update_fields)
+        # The nutrient columns are derived from nutritional_info and written with it
+        self.derived_fields = NUTRIENT_FIELDS if 'nutritional_info' in self.update_fields else []
+        self.sync = sync
+        self.source = source
+        self.started = timezone.now() if sync else None
+        self.buffer = {}
+        self.counts = Counter(inserted=0, updated=0, unchanged=0)
+        if sync:
+            self.counts['retired'] = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+
+    def add(self, product):
+        product.content_hash = content_hash({field: getattr(product, field) for field in self.update_fields})
+        product.retired_at = None
+        if self.sync:
+            product.sync_source, product.last_seen_at = self.source, self.started
+        if self.derived_fields:
+            set_nutrients(product)
+        # A barcode seen twice in one batch keeps its last row
+        self.buffer[product.barcode] = product
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        batch, self.buffer = self.buffer, {}
+        with transaction.atomic():
+            current = {
+                barcode: (stored_hash, retired_at)
+                for barcode, stored_hash, retired_at in Product.objects.filter(barcode__in=batch)
+                .values_list('barcode', 'content_hash', 'retired_at')
+            }
+            writes, unchanged = [], []
+            for barcode, product in batch.items():
+                stored = current.get(barcode)
+                if stored is None:
+                    self.counts['inserted'] += 1
+                elif stored == (product.content_hash, None):
+                    self.counts['unchanged'] += 1
+                    unchanged.append(barcode)
+                    continue
+                else:
+                    self.counts['updated'] += 1
+                writes.append(product)
+
+            if writes:
+                sync_fields = ['sync_source', 'last_seen_at'] if self.sync else []
+                Product.objects.bulk_create(
+                    writes,
+                    update_conflicts=True,
+                    unique_fields=['barcode'],
+                    update_fields=[
+                        *self.update_fields, *self.derived_fields, 'content_hash', 'retired_at', *sync_fields, 'updated_at',
+                    ],
+                )
+                invalidate_catalog()
+            if self.sync and unchanged:
+                # Not a catalog change, so updated_at and the cache are left alone
+                Product.objects.filter(barcode__in=unchanged).update(sync_source=self.source, last_seen_at=self.started)
+
+    def retire_missing(self, queryset=None):
+        """Soft-retire live products of this writer's source (in `queryset`) that this sync did not see"""
+        if not self.sync:
+            raise RuntimeError('retire_missing() needs a writer created with sync=True')
+        self.flush()
+        queryset = Product.objects.all() if queryset is None else queryset
+        now = timezone.now()
+        with transaction.atomic():
+            retired = (
+                queryset.filter(retired_at__isnull=True, sync_source=self.source, last_seen_at__lt=self.started)
+                .update(retired_at=now, updated_at=now)
+            )
+            if retired:
+                invalidate_catalog()
+        self.counts['retired'] += retired
+        return retired
+
+    def summary(self):
+        return ', '.join(f'{count} {name}' for name, count in self.counts.items())
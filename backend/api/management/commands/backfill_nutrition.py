@@ -1,7 +1,18 @@
+import os
+import time
+
+from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from api.caching import invalidate_catalog
 from api.models import Product
-import requests
-import time
+from api.nutrition import NUTRIENT_FIELDS, set_nutrients
+from api.openfoodfacts import OpenFoodFactsClient, ResponseCache, get_client, nutrition_summary
+
+MISSING_NUTRITION = Q(nutritional_info__isnull=True) | Q(nutritional_info={})
 
 
 class Command(BaseCommand):
@@ -9,53 +20,101 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('--limit', type=int, default=0, help='Limit number of products to process (0 = all)')
-        parser.add_argument('--delay', type=float, default=1.0, help='Delay seconds between requests to avoid rate limits')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Products selected, fetched and written per round')
+        parser.add_argument('--workers', type=int, default=0, help='Concurrent requests (default OPENFOODFACTS_CONCURRENCY)')
+        parser.add_argument('--checkpoint', default=str(settings.BASE_DIR / '.backfill_nutrition.checkpoint'),
+                            help='File recording the last processed product id')
+        parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and start from the first product')
 
     def handle(self, *args, **options):
-        limit = options.get('limit', 0) or None
-        delay = options.get('delay', 1.0)
+        checkpoint = options['checkpoint']
+        last_id = 0 if options['restart'] else self._read_checkpoint(checkpoint)
+        limit = options['limit'] or None
+        chunk_size = options['chunk_size']
+        if options['workers']:
+            cache = ResponseCache.from_settings() if settings.OPENFOODFACTS_CACHE_MAX_ENTRIES else None
+            client = OpenFoodFactsClient(concurrency=options['workers'], cache=cache)
+        else:
+            client = get_client()
 
-        qs = Product.objects.all()
-        # We'll filter in Python so we support both null and empty dict
-        targets = [p for p in qs if not p.nutritional_info]
+        targets = Product.objects.filter(MISSING_NUTRITION)
+        total = targets.filter(id__gt=last_id).count()
         if limit:
-            targets = targets[:limit]
-
-        total = len(targets)
-        self.stdout.write(self.style.NOTICE(f'Found {total} products to backfill'))
-
-        for idx, product in enumerate(targets, start=1):
-            query = None
-            # prefer product name else brand
-            if product.name and product.name.strip():
-                query = product.name
-            elif product.brand:
-                query = product.brand
-            else:
-                self.stdout.write(f'[{idx}/{total}] Skipping product id={product.id} (no name)')
-                continue
-
-            try:
-                resp = requests.get('https://world.openfoodfacts.org/cgi/search.pl', params={
-                    'search_terms': query,
-                    'search_simple': 1,
-                    'json': 1,
-                    'page_size': 1
-                }, timeout=15)
-                resp.raise_for_status()
-                data = resp.json()
-                products = data.get('products') or []
-                if not products:
-                    self.stdout.write(f'[{idx}/{total}] No OF result for "{query}"')
+            total = min(total, limit)
+        resumed = f' (resuming after id={last_id})' if last_id else ''
+        self.stdout.write(self.style.NOTICE(f'Found {total} products to backfill{resumed}'))
+
+        started = time.monotonic()
+        processed = filled = not_found = failed = 0
+        while processed < total:
+            # Keyset pagination: each chunk is an index range scan on the primary key
+            chunk = list(
+                targets.filter(id__gt=last_id).order_by('id')
+                .values_list('id', 'name', 'brand')[:min(chunk_size, total - processed)]
+            )
+            if not chunk:
+                break
+
+            queries = []
+            for product_id, name, brand in chunk:
+                # prefer product name else brand
+                query = (name or '').strip() or (brand or '').strip()
+                if query:
+                    queries.append((product_id, query))
                 else:
-                    p = products[0]
-                    nutr = {'nutriments': p.get('nutriments', {}), 'serving_size': p.get('serving_size'), 'product_name': p.get('product_name')}
-                    product.nutritional_info = nutr
-                    product.save(update_fields=['nutritional_info'])
-                    self.stdout.write(self.style.SUCCESS(f'[{idx}/{total}] Backfilled product id={product.id} from "{query}"'))
-            except Exception as e:
-                self.stdout.write(self.style.WARNING(f'[{idx}/{total}] Error fetching "{query}": {e}'))
+                    self.stdout.write(f'Skipping product id={product_id} (no name)')
 
-            time.sleep(delay)
+            now = timezone.now()
+            updates = []
+            results = client.search_many([query for _, query in queries], page_size=1)
+            for (product_id, _), (query, products, error) in zip(queries, results):
+                if error:
+                    failed += 1
+                    self.stdout.write(self.style.WARNING(f'Error fetching "{query}" for id={product_id}: {error}'))
+                elif not products:
+                    not_found += 1
+                else:
+                    updates.append(set_nutrients(Product(id=product_id, nutritional_info=nutrition_summary(products[0]), updated_at=now)))
+
+            with transaction.atomic():
+                Product.objects.bulk_update(updates, ['nutritional_info', *NUTRIENT_FIELDS, 'updated_at'], batch_size=chunk_size)
+                if updates:
+                    invalidate_catalog()
+
+            filled += len(updates)
+            processed += len(chunk)
+            last_id = chunk[-1][0]
+            self._write_checkpoint(checkpoint, last_id)
+            rate = processed / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(
+                f'[{processed}/{total}] {filled} backfilled, {not_found} without result, '
+                f'{failed} errors, {rate:.1f} products/s (last id={last_id})'
+            )
 
+        if processed >= total and not limit:
+            # Finished: the next run starts over and picks up newly added products
+            self._clear_checkpoint(checkpoint)
+        if failed:
+            self.stdout.write(self.style.WARNING(f'{failed} lookups failed; rerun with --restart to retry them'))
         self.stdout.write(self.style.SUCCESS('Backfill complete'))
+        client.wait()
+        self.stdout.write(f'OpenFoodFacts: {client.summary()}')
+
+    def _read_checkpoint(self, path):
+        try:
+            with open(path) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _write_checkpoint(self, path, last_id):
+        # Write then rename so an interrupted run never leaves a truncated checkpoint
+        with open(f'{path}.tmp', 'w') as f:
+            f.write(str(last_id))
+        os.replace(f'{path}.tmp', path)
+
+    def _clear_checkpoint(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
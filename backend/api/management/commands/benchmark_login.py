@@ -0,0 +1,64 @@
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import get_hasher
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+
+from api.models import UserProfile
+from api.serializers import CustomTokenObtainPairSerializer
+
+
+class Command(BaseCommand):
+    help = 'Measure login (token issue) throughput against the configured database and password hasher'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=50, help='Logins to time')
+        parser.add_argument('--concurrency', type=int, default=1, help='Logins run at once (threads)')
+
+    def handle(self, *args, **options):
+        logins, concurrency = options['logins'], max(options['concurrency'], 1)
+        username, password = f'benchmark-{uuid.uuid4().hex[:12]}', uuid.uuid4().hex
+        user = User.objects.create_user(username=username, password=password)
+        UserProfile.objects.create(user=user, role='customer')
+        hasher = get_hasher()
+        params = {key: value for key, value in hasher.safe_summary(user.password).items() if key not in ('salt', 'hash')}
+        self.stdout.write(f"🔐 Timing {logins} logins, {concurrency} at a time ({params})...")
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                self._login(username, password)  # also warms up connections and imports
+            shares = [logins // concurrency + (i < logins % concurrency) for i in range(concurrency)]
+            started = time.perf_counter()
+            if concurrency == 1:
+                self._run(logins, username, password)
+            else:
+                with ThreadPoolExecutor(concurrency) as pool:
+                    list(pool.map(lambda share: self._run(share, username, password, thread=True), shares))
+            elapsed = time.perf_counter() - started
+        finally:
+            user.delete()
+
+        rate = logins / elapsed
+        cores = min(concurrency, os.cpu_count() or 1)
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {rate:.1f} logins/s ({rate / cores:.1f} per core over {cores}), "
+            f"{elapsed / logins * concurrency * 1000:.1f} ms per login, {len(queries)} queries per login"
+        ))
+
+    def _run(self, count, username, password, thread=False):
+        try:
+            for _ in range(count):
+                self._login(username, password)
+        finally:
+            if thread:
+                # Each thread opened its own database connection
+                connections.close_all()
+
+    def _login(self, username, password):
+        serializer = CustomTokenObtainPairSerializer(data={'username': username, 'password': password})
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api import enrichment
+
+
+class Command(BaseCommand):
+    help = 'Process queued OpenFoodFacts enrichment jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help='Jobs claimed per round')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once no job is due instead of polling')
+
+    def handle(self, *args, **options):
+        self.stdout.write("🧪 Enrichment worker started")
+        handled = 0
+        try:
+            while True:
+                close_old_connections()
+                count = enrichment.run_once(options['batch_size'])
+                handled += count
+                if count:
+                    self.stdout.write(f"  ✅ Processed {count} jobs ({handled} total)")
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"✅ Worker stopped after {handled} jobs"))
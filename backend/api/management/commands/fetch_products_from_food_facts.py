@@ -1,9 +1,10 @@
-import requests
 import random
 from decimal import Decimal
 from django.core.management.base import BaseCommand
 from django.db import IntegrityError
+from api.importing import ProductWriter
 from api.models import Product
+from api.openfoodfacts import OpenFoodFactsError, get_client
 
 class Command(BaseCommand):
     help = 'Fetch products from Open Food Facts API and add them to database'
@@ -29,30 +30,22 @@ class Command(BaseCommand):
         self.stdout.write(self.style.SUCCESS(f'🔍 Fetching {count} products from Open Food Facts API...'))
         self.stdout.write(f'📂 Category: {category}\n')
         
-        base_url = 'https://world.openfoodfacts.org/cgi/search.pl'
-        
-        params = {
-            'search_terms': category,
-            'page_size': count,
-            'json': 1,
-            'fields': 'code,product_name,brands,image_url,categories,nutrition_grade_fr,nutriments'
-        }
-        
+        client = get_client()
         try:
-            response = requests.get(base_url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-        except requests.exceptions.RequestException as e:
+            products = client.search(
+                category,
+                page_size=count,
+                fields='code,product_name,brands,image_url,categories,nutrition_grade_fr,nutriments',
+            )
+        except OpenFoodFactsError as e:
             self.stdout.write(self.style.ERROR(f'❌ Error fetching from API: {e}'))
             return
         
-        products = data.get('products', [])
-        
         if not products:
             self.stdout.write(self.style.WARNING('⚠️  No products found for this search'))
             return
         
-        added_count = 0
+        writer = ProductWriter()
         skipped_count = 0
         
         for idx, product_data in enumerate(products[:count], 1):
@@ -88,40 +81,40 @@ class Command(BaseCommand):
                     'salt_g': nutriments.get('salt_100g'),
                 }
                 
-                # Create or update product
-                product, created = Product.objects.get_or_create(
+                # Insert, or update the catalog fields of an existing barcode
+                product = Product(
                     barcode=barcode,
-                    defaults={
-                        'name': name,
-                        'brand': brand,
-                        'picture': image,
-                        'category': category_str[:255],  # Limit to 255 chars
-                        'nutrition_score': nutrition_grade,
-                        'price': price,
-                        'quantity': random.randint(10, 100),
-                        'nutritional_info': nutritional_info,
-                    }
+                    name=name,
+                    brand=brand,
+                    picture=image,
+                    category=category_str[:255],  # Limit to 255 chars
+                    nutrition_score=nutrition_grade,
+                    price=price,
+                    quantity=random.randint(10, 100),
+                    nutritional_info=nutritional_info,
                 )
+                writer.add(product)
                 
-                if created:
-                    added_count += 1
-                    status = '✅'
-                    self.stdout.write(f'{status} [{idx}/{len(products[:count])}] {name}')
-                    self.stdout.write(f'   Brand: {brand}')
-                    self.stdout.write(f'   Score: {nutrition_grade or "N/A"} | Price: ${price} | Qty: {product.quantity}')
-                    if nutriments:
-                        self.stdout.write(f'   Nutrition: {nutriments.get("energy-kcal_100g", "N/A")} kcal, '
-                                        f'{nutriments.get("proteins_100g", "N/A")}g protein')
-                    self.stdout.write('')
-                else:
-                    skipped_count += 1
+                status = '✅'
+                self.stdout.write(f'{status} [{idx}/{len(products[:count])}] {name}')
+                self.stdout.write(f'   Brand: {brand}')
+                self.stdout.write(f'   Score: {nutrition_grade or "N/A"} | Price: ${price} | Qty: {product.quantity}')
+                if nutriments:
+                    self.stdout.write(f'   Nutrition: {nutriments.get("energy-kcal_100g", "N/A")} kcal, '
+                                    f'{nutriments.get("proteins_100g", "N/A")}g protein')
+                self.stdout.write('')
             
             except Exception as e:
                 self.stdout.write(self.style.WARNING(f'⚠️  Error processing product: {e}'))
                 skipped_count += 1
                 continue
         
+        writer.flush()
         self.stdout.write(self.style.SUCCESS(f'\n✨ Process Complete!'))
-        self.stdout.write(self.style.SUCCESS(f'✅ Added: {added_count} products'))
+        self.stdout.write(self.style.SUCCESS(f'✅ Added: {writer.counts["inserted"]} products'))
+        self.stdout.write(self.style.SUCCESS(f'🔄 Updated: {writer.counts["updated"]} products'))
+        self.stdout.write(f'➖ Unchanged: {writer.counts["unchanged"]} products')
         self.stdout.write(self.style.WARNING(f'⏭️  Skipped: {skipped_count} products'))
         self.stdout.write(self.style.SUCCESS(f'📊 Total in database: {Product.objects.count()} products'))
+        client.wait()
+        self.stdout.write(f'📊 OpenFoodFacts: {client.summary()}')
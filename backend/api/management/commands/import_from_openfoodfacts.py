@@ -1,20 +1,20 @@
 from django.core.management.base import BaseCommand
+from api.importing import ProductWriter
 from api.models import Product
-import requests
+from api.nutrition import imported_nutrients
+from api.openfoodfacts import get_client
 from decimal import Decimal
-import time
-import json
 
 class Command(BaseCommand):
     help = 'Import real food products from Open Food Facts API with complete nutrition data'
+    FIELDS = 'code,name,brands,image_front_url,image_front_small_url,nutriscore_grade,nutriments,quantity,energy-kcal_100g,fat_100g,carbohydrates_100g,sugars_100g,proteins_100g,salt_100g,fiber_100g'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sync', action='store_true', help='Soft-retire products that this import no longer lists')
 
     def handle(self, *args, **options):
         self.stdout.write("🍎 Importing products from Open Food Facts...\n")
         
-        # Delete all existing products first
-        Product.objects.all().delete()
-        self.stdout.write("✅ Cleared existing products\n")
-        
         # Search queries for each category
         searches = {
             'Fruits & Vegetables': ['apple', 'banana', 'carrot', 'tomato', 'lettuce', 'orange'],
@@ -29,127 +29,92 @@ class Command(BaseCommand):
             'Condiments/Sauces/Spices': ['tomato sauce', 'soy sauce', 'salt', 'pepper', 'mustard'],
         }
         
-        products_created = 0
+        client = get_client()
+        writer = ProductWriter(sync=options['sync'], source='import_from_openfoodfacts')
+        failed = False
         
         for category, search_terms in searches.items():
             self.stdout.write(f"\n📦 Category: {category}")
-            
-            for search_term in search_terms:
-                try:
-                    products = self._fetch_products(search_term)
-                    
-                    for product_data in products[:1]:  # Get 1 product per search term
-                        if self._create_product(product_data, category):
-                            products_created += 1
-                            self.stdout.write(f"  ✅ {product_data['name']}")
-                        
-                        time.sleep(0.3)  # Rate limiting
-                        
-                except Exception as e:
-                    self.stdout.write(f"  ⚠️  Error with {search_term}: {str(e)}")
+
+            results = client.search_many(search_terms, page_size=5, fields=self.FIELDS, action='process')
+            for search_term, products, error in results:
+                if error:
+                    failed = True
+                    self.stdout.write(f"  ⚠️  Error with {search_term}: {error}")
                     continue
+
+                for product_data in self._usable(products)[:1]:  # Get 1 product per search term
+                    product = self._build_product(product_data, category)
+                    if product:
+                        writer.add(product)
+                        self.stdout.write(f"  ✅ {product.name}")
         
-        self.stdout.write(self.style.SUCCESS(f"\n✅ Import complete! Created {products_created} products"))
+        writer.flush()
+        if options['sync']:
+            # A failed search would otherwise retire everything it used to return
+            if failed:
+                self.stdout.write(self.style.WARNING("⚠️  Some searches failed, not retiring missing products"))
+            else:
+                writer.retire_missing()
+        self.stdout.write(self.style.SUCCESS(f"\n✅ Import complete! {writer.summary()}"))
+        client.wait()
+        self.stdout.write(f"📊 OpenFoodFacts: {client.summary()}")
 
-    def _fetch_products(self, search_term):
-        """Fetch products from Open Food Facts API"""
-        url = 'https://world.openfoodfacts.org/cgi/search.pl'
-        params = {
-            'search_terms': search_term,
-            'search_simple': 1,
-            'json': 1,
-            'page_size': 5,
-            'action': 'process',
-            'fields': 'code,name,brands,image_front_url,image_front_small_url,nutriscore_grade,nutriments,quantity,energy-kcal_100g,fat_100g,carbohydrates_100g,sugars_100g,proteins_100g,salt_100g,fiber_100g'
-        }
+    def _usable(self, products):
+        """Keep products with a name, an image and some nutrition data"""
+        filtered = []
+        for p in products:
+            name = p.get('name', '').strip()
+            image = p.get('image_front_url') or p.get('image_front_small_url')
+            nutriments = p.get('nutriments', {})
+            
+            # Must have name, image, and some nutrition data
+            if name and image and nutriments:
+                filtered.append(p)
         
-        try:
-            response = requests.get(url, params=params, timeout=15)
-            response.raise_for_status()
-            data = response.json()
-            
-            products = data.get('products', [])
-            
-            # Filter to ensure we have necessary data
-            filtered = []
-            for p in products:
-                name = p.get('name', '').strip()
-                image = p.get('image_front_url') or p.get('image_front_small_url')
-                nutriments = p.get('nutriments', {})
-                
-                # Must have name, image, and some nutrition data
-                if name and image and nutriments:
-                    filtered.append(p)
-            
-            return filtered[:3]  # Return top 3 results
-            
-        except Exception as e:
-            print(f'Error fetching: {e}')
-            return []
+        return filtered[:3]  # Return top 3 results
 
-    def _create_product(self, product_data, category):
-        """Create product with complete nutrition data per 100g"""
-        try:
-            name = product_data.get('name', '').strip()
-            if not name or len(name) > 255:
-                return False
-            
-            barcode = product_data.get('code', '')
-            
-            # Check if already exists
-            if barcode and Product.objects.filter(barcode=barcode).exists():
-                return False
-            
-            brand = product_data.get('brands', '').strip()
-            if len(brand) > 255:
-                brand = brand[:150]
-            
-            # Get image (prefer larger version)
-            image_url = product_data.get('image_front_url', '')
-            if not image_url:
-                image_url = product_data.get('image_front_small_url', '')
-            
-            # Get nutrition score (A-E)
-            nutrition_score = product_data.get('nutriscore_grade', 'C').upper()
-            if nutrition_score not in ['A', 'B', 'C', 'D', 'E']:
-                nutrition_score = 'C'
-            
-            nutriments = product_data.get('nutriments', {})
-            
-            # Extract per 100g nutrition values
-            nutritional_info = {
-                'energy_kcal_100g': nutriments.get('energy-kcal_100g') or nutriments.get('energy_kcal_100g') or 0,
-                'energy_kj_100g': nutriments.get('energy-kj_100g') or nutriments.get('energy_kj_100g') or 0,
-                'fat_100g': nutriments.get('fat_100g') or 0,
-                'carbohydrates_100g': nutriments.get('carbohydrates_100g') or 0,
-                'sugars_100g': nutriments.get('sugars_100g') or 0,
-                'proteins_100g': nutriments.get('proteins_100g') or 0,
-                'salt_100g': nutriments.get('salt_100g') or 0,
-                'fiber_100g': nutriments.get('fiber_100g') or 0,
-                'sodium_100g': nutriments.get('sodium_100g') or 0,
-            }
-            
-            # Determine price based on category
-            price = self._get_price(category)
-            
-            # Create product
-            Product.objects.create(
-                name=name,
-                price=price,
-                brand=brand,
-                picture=image_url,
-                category=category,
-                nutrition_score=nutrition_score,
-                barcode=barcode if barcode else f'EAN-{name[:20].upper()}',
-                quantity=50,
-                nutritional_info=nutritional_info
-            )
-            
-            return True
-            
-        except Exception as e:
-            print(f'Error creating product: {e}')
-            return False
+    def _build_product(self, product_data, category):
+        """Build an unsaved product with complete nutrition data per 100g"""
+        name = product_data.get('name', '').strip()
+        if not name or len(name) > 255:
+            return None
+        
+        barcode = product_data.get('code', '')
+        
+        brand = product_data.get('brands', '').strip()
+        if len(brand) > 255:
+            brand = brand[:150]
+        
+        # Get image (prefer larger version)
+        image_url = product_data.get('image_front_url', '')
+        if not image_url:
+            image_url = product_data.get('image_front_small_url', '')
+        
+        # Get nutrition score (A-E)
+        nutrition_score = product_data.get('nutriscore_grade', 'C').upper()
+        if nutrition_score not in ['A', 'B', 'C', 'D', 'E']:
+            nutrition_score = 'C'
+        
+        nutriments = product_data.get('nutriments', {})
+        
+        # Extract per 100g nutrition values
+        nutritional_info = imported_nutrients(nutriments)
+        
+        # Determine price based on category
+        price = self._get_price(category)
+        
+        return Product(
+            name=name,
+            price=price,
+            brand=brand,
+            picture=image_url,
+            category=category,
+            nutrition_score=nutrition_score,
+            barcode=barcode if barcode else f'EAN-{name[:20].upper()}',
+            quantity=50,
+            nutritional_info=nutritional_info
+        )
 
     def _get_price(self, category):
         """Get realistic price for category"""
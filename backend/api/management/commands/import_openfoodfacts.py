@@ -1,21 +1,20 @@
 from django.core.management.base import BaseCommand
+from api.importing import ProductWriter
 from api.models import Product
-import requests
+from api.nutrition import imported_nutrients
+from api.openfoodfacts import get_client
 from decimal import Decimal
-import time
 
 class Command(BaseCommand):
     help = 'Import real food products from Open Food Facts API'
+    FIELDS = 'code,name,brands,image_front_url,nutriscore_grade,nutriments,quantity'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sync', action='store_true', help='Soft-retire products that this import no longer lists')
 
     def handle(self, *args, **options):
         self.stdout.write("🍎 Starting Open Food Facts import...\n")
         
-        # First, delete all existing products
-        count = Product.objects.count()
-        self.stdout.write(f"🗑️  Deleting {count} existing products...")
-        Product.objects.all().delete()
-        self.stdout.write(self.style.SUCCESS("✅ All products deleted"))
-        
         # Categories and search terms
         categories = {
             'Fruits & Vegetables': ['apple', 'banana', 'carrot', 'tomato', 'lettuce'],
@@ -30,110 +29,75 @@ class Command(BaseCommand):
             'Condiments/Sauces/Spices': ['tomato sauce', 'soy sauce', 'salt', 'pepper'],
         }
         
-        products_created = 0
-        
+        client = get_client()
+        writer = ProductWriter(sync=options['sync'], source='import_openfoodfacts')
+        failed = False
+
         for category, search_terms in categories.items():
             self.stdout.write(f"\n📦 Category: {category}")
-            
-            for search_term in search_terms:
-                try:
-                    products = self._fetch_from_openfoodfacts(search_term)
-                    
-                    for product_data in products[:2]:  # Get 2 products per search term
-                        created = self._create_product(product_data, category)
-                        if created:
-                            products_created += 1
-                            self.stdout.write(f"  ✅ {product_data['name']}")
-                        
-                        time.sleep(0.5)  # Rate limiting
-                    
-                except Exception as e:
-                    self.stdout.write(f"  ⚠️  Error fetching {search_term}: {str(e)}")
+
+            results = client.search_many(search_terms, page_size=20, fields=self.FIELDS)
+            for search_term, products, error in results:
+                if error:
+                    failed = True
+                    self.stdout.write(f"  ⚠️  Error fetching {search_term}: {error}")
                     continue
-        
-        self.stdout.write(self.style.SUCCESS(f"\n✅ Import completed! Created {products_created} products"))
 
-    def _fetch_from_openfoodfacts(self, search_term):
-        """Fetch products from Open Food Facts API"""
-        url = 'https://world.openfoodfacts.org/cgi/search.pl'
-        params = {
-            'search_terms': search_term,
-            'search_simple': 1,
-            'json': 1,
-            'page_size': 20,
-            'fields': 'code,name,brands,image_front_url,nutriscore_grade,nutriments,quantity'
-        }
+                # Keep products that have the necessary data
+                products = [p for p in products if p.get('name') and p.get('image_front_url')]
+                for product_data in products[:2]:  # Get 2 products per search term
+                    product = self._build_product(product_data, category)
+                    if product:
+                        writer.add(product)
+                        self.stdout.write(f"  ✅ {product.name}")
         
-        try:
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            products = data.get('products', [])
-            
-            # Filter products that have necessary data
-            filtered = []
-            for p in products:
-                if p.get('name') and p.get('image_front_url'):
-                    filtered.append(p)
-            
-            return filtered
-        except Exception as e:
-            print(f'Error fetching from OpenFoodFacts: {e}')
-            return []
+        writer.flush()
+        if options['sync']:
+            # A failed search would otherwise retire everything it used to return
+            if failed:
+                self.stdout.write(self.style.WARNING("⚠️  Some searches failed, not retiring missing products"))
+            else:
+                writer.retire_missing()
+        self.stdout.write(self.style.SUCCESS(f"\n✅ Import completed! {writer.summary()}"))
+        client.wait()
+        self.stdout.write(f"📊 OpenFoodFacts: {client.summary()}")
 
-    def _create_product(self, product_data, category):
-        """Create a product from OpenFoodFacts data"""
-        try:
-            name = product_data.get('name', '').strip()
-            if not name or len(name) > 255:
-                return False
-            
-            barcode = product_data.get('code', '')
-            
-            # Check if product already exists
-            if barcode and Product.objects.filter(barcode=barcode).exists():
-                return False
-            
-            brand = product_data.get('brands', '').strip()
-            if len(brand) > 255:
-                brand = brand[:255]
-            
-            image_url = product_data.get('image_front_url', '')
-            
-            # Nutrition score (A-E)
-            nutrition_score = product_data.get('nutriscore_grade', 'C').upper()
-            if nutrition_score not in ['A', 'B', 'C', 'D', 'E']:
-                nutrition_score = 'C'
-            
-            # Get nutritional info
-            nutriments = product_data.get('nutriments', {})
-            
-            # Generate a realistic price based on category
-            price = self._generate_price(category)
-            
-            product = Product.objects.create(
-                name=name,
-                price=price,
-                brand=brand,
-                picture=image_url,
-                category=category,
-                nutrition_score=nutrition_score,
-                barcode=barcode if barcode else f'OFF-{name[:10].upper()}',
-                quantity=50,  # Default quantity
-                nutritional_info={
-                    'energy': nutriments.get('energy_kcal', 0),
-                    'fat': nutriments.get('fat', 0),
-                    'carbohydrates': nutriments.get('carbohydrates', 0),
-                    'protein': nutriments.get('protein', 0),
-                    'salt': nutriments.get('salt', 0),
-                    'sugar': nutriments.get('sugars', 0)
-                }
-            )
-            
-            return True
-        except Exception as e:
-            print(f'Error creating product: {e}')
-            return False
+    def _build_product(self, product_data, category):
+        """Build an unsaved product from OpenFoodFacts data"""
+        name = product_data.get('name', '').strip()
+        if not name or len(name) > 255:
+            return None
+        
+        barcode = product_data.get('code', '')
+        
+        brand = product_data.get('brands', '').strip()
+        if len(brand) > 255:
+            brand = brand[:255]
+        
+        image_url = product_data.get('image_front_url', '')
+        
+        # Nutrition score (A-E)
+        nutrition_score = product_data.get('nutriscore_grade', 'C').upper()
+        if nutrition_score not in ['A', 'B', 'C', 'D', 'E']:
+            nutrition_score = 'C'
+        
+        # Get nutritional info
+        nutriments = product_data.get('nutriments', {})
+        
+        # Generate a realistic price based on category
+        price = self._generate_price(category)
+        
+        return Product(
+            name=name,
+            price=price,
+            brand=brand,
+            picture=image_url,
+            category=category,
+            nutrition_score=nutrition_score,
+            barcode=barcode if barcode else f'OFF-{name[:10].upper()}',
+            quantity=50,  # Default quantity
+            nutritional_info=imported_nutrients(nutriments)
+        )
 
     def _generate_price(self, category):
         """Generate realistic prices based on category"""
@@ -0,0 +1,175 @@
+import gzip
+import json
+import os
+import time
+from decimal import Decimal
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from api.importing import ProductWriter
+from api.models import Product
+
+NUTRISCORES = {'A', 'B', 'C', 'D', 'E'}
+DEFAULT_PRICE = Decimal('5.99')
+DEFAULT_QUANTITY = 50
+NUTRIENTS = {
+    'energy_kcal_100g': ('energy-kcal_100g', 'energy_kcal_100g'),
+    'energy_kj_100g': ('energy-kj_100g', 'energy_kj_100g'),
+    'fat_100g': ('fat_100g',),
+    'carbohydrates_100g': ('carbohydrates_100g',),
+    'sugars_100g': ('sugars_100g',),
+    'proteins_100g': ('proteins_100g',),
+    'salt_100g': ('salt_100g',),
+    'fiber_100g': ('fiber_100g',),
+    'sodium_100g': ('sodium_100g',),
+}
+
+
+def read_lines(path, offset=0):
+    """Yield (offset after the line, raw line) from a plain or gzip file.
+
+    Offsets count decompressed bytes, so a gzip input resumes by
+    decompressing up to the offset without parsing what it skips.
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        if offset:
+            f.seek(offset)
+        for line in f:
+            offset += len(line)
+            yield offset, line
+
+
+def parse_jsonl(lines, errors):
+    for offset, line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield offset, json.loads(line)
+        except ValueError:
+            errors['malformed'] += 1
+
+
+def parse_csv(lines, header, errors):
+    """The CSV export is tab-separated without quoting; nutriments are flat *_100g columns"""
+    for offset, line in lines:
+        values = line.decode('utf-8', errors='replace').rstrip('\r\n').split('\t')
+        if len(values) != len(header):
+            errors['malformed'] += 1
+            continue
+        row = dict(zip(header, values))
+        row['nutriments'] = {key: value for key, value in row.items() if key.endswith('_100g') and value}
+        yield offset, row
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_product(row):
+    """Map an export row to an unsaved Product, or None if it lacks the essentials"""
+    name = (row.get('product_name') or '').strip()
+    barcode = str(row.get('code') or '').strip()
+    if not name or len(name) > 255 or not barcode or len(barcode) > 100:
+        return None
+
+    nutrition_score = (row.get('nutriscore_grade') or 'C').upper()
+    if nutrition_score not in NUTRISCORES:
+        nutrition_score = 'C'
+
+    # A nutrient the export does not give is left out rather than stored as 0,
+    # so it reads as unknown and the kJ and sodium fallbacks still apply
+    nutriments = row.get('nutriments') or {}
+    nutritional_info = {}
+    for key, names in NUTRIENTS.items():
+        value = next((number for number in (_number(nutriments.get(name)) for name in names) if number is not None), None)
+        if value is not None:
+            nutritional_info[key] = value
+
+    picture = row.get('image_front_url') or row.get('image_url') or ''
+    return Product(
+        name=name,
+        brand=(row.get('brands') or '').strip()[:255],
+        barcode=barcode,
+        picture=picture if len(picture) <= 200 else '',
+        category=(row.get('categories') or '').split(',')[0].strip()[:255],
+        nutrition_score=nutrition_score,
+        price=DEFAULT_PRICE,
+        quantity=DEFAULT_QUANTITY,
+        nutritional_info=nutritional_info,
+    )
+
+
+def batched(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = 'Stream products from a local OpenFoodFacts JSONL or CSV export (optionally gzip-compressed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Export file, e.g. openfoodfacts-products.jsonl.gz or en.openfoodfacts.org.products.csv.gz')
+        parser.add_argument('--format', choices=['jsonl', 'csv'], help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--offset', type=int, default=0, help='Resume from this (decompressed) byte offset')
+        parser.add_argument('--checkpoint', help='File to record the offset of the last committed batch in')
+        parser.add_argument('--limit', type=int, default=0, help='Stop after this many rows (0 = all)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if '.csv' in path else 'jsonl')
+        offset = options['offset']
+        checkpoint = options['checkpoint']
+        if not offset and checkpoint:
+            try:
+                with open(checkpoint) as f:
+                    offset = int(f.read().strip() or 0)
+            except FileNotFoundError:
+                pass
+
+        if not os.path.isfile(path):
+            raise CommandError(f'{path} does not exist')
+
+        errors = {'malformed': 0}
+        if fmt == 'csv':
+            lines = read_lines(path)
+            header_end, header = next(lines, (0, b''))
+            lines.close()
+            header = header.decode('utf-8').rstrip('\r\n').split('\t')
+            rows = parse_csv(read_lines(path, max(offset, header_end)), header, errors)
+        else:
+            rows = parse_jsonl(read_lines(path, offset), errors)
+        if options['limit']:
+            rows = islice(rows, options['limit'])
+
+        self.stdout.write(f"🍎 Importing {path} ({fmt}) from offset {offset}...")
+        started = time.monotonic()
+        read = skipped = 0
+        writer = ProductWriter(batch_size=options['batch_size'])
+        for batch in batched(rows, options['batch_size']):
+            for _, row in batch:
+                product = to_product(row)
+                if product is None:
+                    skipped += 1
+                else:
+                    writer.add(product)
+            # Flush on the batch boundary so the checkpoint only covers committed rows
+            writer.flush()
+
+            read += len(batch)
+            offset = batch[-1][0]
+            if checkpoint:
+                with open(checkpoint, 'w') as f:
+                    f.write(str(offset))
+            rate = read / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(f"  📦 {read:,} rows read ({writer.summary()}), {rate:,.0f} rows/s, offset {offset}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"\n✅ Import complete! {read:,} rows ({writer.summary()}), {skipped:,} skipped, "
+            f"{errors['malformed']:,} malformed. Resume offset: {offset}"
+        ))
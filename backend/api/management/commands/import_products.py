@@ -1,17 +1,17 @@
 from django.core.management.base import BaseCommand
+from api.importing import ProductWriter
 from api.models import Product
 from decimal import Decimal
 
 class Command(BaseCommand):
     help = 'Import products with real images and nutrition data'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--sync', action='store_true', help='Soft-retire products that this import no longer lists')
+
     def handle(self, *args, **options):
         self.stdout.write("🍎 Starting product import...\n")
         
-        # Delete existing products
-        Product.objects.all().delete()
-        self.stdout.write("✅ Deleted existing products\n")
-        
         # Real products with images from Wikimedia Commons and nutritional data
         products = [
             # Fruits & Vegetables
@@ -500,20 +500,23 @@ class Command(BaseCommand):
             },
         ]
         
-        # Create products
-        for product_data in products:
-            barcode = f'EAN-{product_data["name"][:10].upper()}'
-            Product.objects.create(
-                name=product_data['name'],
-                brand=product_data['brand'],
-                category=product_data['category'],
-                price=Decimal(str(product_data['price'])),
-                nutrition_score=product_data['nutrition_score'],
-                picture=product_data['picture'],
-                nutritional_info=product_data['nutritional_info'],
-                barcode=barcode,
-                quantity=50
-            )
-            self.stdout.write(f"✅ {product_data['name']}")
+        # Upsert products by barcode
+        with ProductWriter(sync=options['sync'], source='import_products') as writer:
+            for product_data in products:
+                barcode = f'EAN-{product_data["name"][:10].upper()}'
+                writer.add(Product(
+                    name=product_data['name'],
+                    brand=product_data['brand'],
+                    category=product_data['category'],
+                    price=Decimal(str(product_data['price'])),
+                    nutrition_score=product_data['nutrition_score'],
+                    picture=product_data['picture'],
+                    nutritional_info=product_data['nutritional_info'],
+                    barcode=barcode,
+                    quantity=50
+                ))
+                self.stdout.write(f"✅ {product_data['name']}")
         
-        self.stdout.write(self.style.SUCCESS(f"\n✅ Import completed! Created {len(products)} products"))
+        if options['sync']:
+            writer.retire_missing()
+        self.stdout.write(self.style.SUCCESS(f"\n✅ Import completed! {writer.summary()}"))
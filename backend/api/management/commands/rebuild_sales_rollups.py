@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from api import rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily and monthly sales rollup tables from the invoice history'
+
+    def handle(self, *args, **options):
+        self.stdout.write("📊 Rebuilding sales rollups...")
+        count = rollups.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"✅ Rebuilt {count} rollup rows"))
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:23
+
+from django.db import migrations, models
+from django.db.models import F
+from django.utils import timezone
+
+
+def backfill_product_created_at(apps, schema_editor):
+    # Cursor pagination cannot encode a NULL position, so give legacy rows a timestamp
+    Product = apps.get_model('api', 'Product')
+    Product.objects.filter(created_at__isnull=True, updated_at__isnull=False).update(created_at=F('updated_at'))
+    Product.objects.filter(created_at__isnull=True).update(created_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_alter_invoice_options_alter_invoice_status_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_product_created_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['-created_at', '-id'], name='invoice_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-created_at', '-id'], name='product_created_id_idx'),
+        ),
+    ]
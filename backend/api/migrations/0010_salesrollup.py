@@ -0,0 +1,88 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:27
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, DateField, F, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+
+# A frozen copy of api.rollups.rebuild() as it was when this migration was written
+EXCLUDED_STATUSES = ['cancelled']
+PERIODS = (
+    ('day', TruncDate),
+    ('month', lambda field: TruncMonth(field, output_field=DateField())),
+)
+
+
+def _accumulate(rows, queryset, period, dimension, key_field, **annotations):
+    fields = ['start'] + ([key_field] if key_field else [])
+    for row in queryset.values(*fields).annotate(**annotations).order_by():
+        key = '' if not key_field else str(row[key_field])
+        entry = rows[(period, row['start'], dimension, key)]
+        entry[0] += row.get('revenue') or Decimal('0')
+        entry[1] += row.get('units') or 0
+        entry[2] += row.get('invoices') or 0
+
+
+def build_rollups(apps, schema_editor):
+    Invoice = apps.get_model('api', 'Invoice')
+    InvoiceItem = apps.get_model('api', 'InvoiceItem')
+    SalesRollup = apps.get_model('api', 'SalesRollup')
+    invoices = Invoice.objects.exclude(status__in=EXCLUDED_STATUSES)
+    items = InvoiceItem.objects.exclude(invoice__status__in=EXCLUDED_STATUSES)
+
+    rows = defaultdict(lambda: [Decimal('0'), 0, 0])
+    for period, trunc in PERIODS:
+        period_invoices = invoices.annotate(start=trunc('created_at'))
+        period_items = items.annotate(start=trunc('invoice__created_at'))
+        priced_items = period_items.filter(product__isnull=False)
+
+        _accumulate(rows, period_invoices, period, 'total', None, revenue=Sum('total'), invoices=Count('id'))
+        _accumulate(rows, period_items, period, 'total', None, units=Sum('quantity'))
+        _accumulate(rows, period_invoices, period, 'customer', 'customer_id', revenue=Sum('total'), invoices=Count('id'))
+        _accumulate(rows, period_items, period, 'customer', 'invoice__customer_id', units=Sum('quantity'))
+        for dimension, key_field in (('product', 'product_id'), ('category', 'product__category')):
+            _accumulate(
+                rows, priced_items, period, dimension, key_field,
+                revenue=Sum(F('price') * F('quantity')), units=Sum('quantity'), invoices=Count('invoice_id', distinct=True),
+            )
+
+    SalesRollup.objects.bulk_create(
+        [
+            SalesRollup(
+                period=period, period_start=start, dimension=dimension, key=key,
+                revenue=revenue, units=units, invoice_count=count,
+            )
+            for (period, start, dimension, key), (revenue, units, count) in rows.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_product_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Day'), ('month', 'Month')], max_length=10)),
+                ('period_start', models.DateField()),
+                ('dimension', models.CharField(choices=[('total', 'Total'), ('product', 'Product'), ('category', 'Category'), ('customer', 'Customer')], max_length=20)),
+                ('key', models.CharField(blank=True, max_length=255)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('units', models.BigIntegerField(default=0)),
+                ('invoice_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['period', 'period_start', 'dimension', 'key'],
+                'constraints': [models.UniqueConstraint(fields=('period', 'dimension', 'period_start', 'key'), name='sales_rollup_unique')],
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
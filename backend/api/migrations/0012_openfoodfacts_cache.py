@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_product_updated_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OpenFoodFactsCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('kind', models.CharField(choices=[('search', 'Search'), ('product', 'Product')], max_length=10)),
+                ('query', models.CharField(max_length=255)),
+                ('payload', models.JSONField()),
+                ('fetched_at', models.DateTimeField()),
+                ('last_used_at', models.DateTimeField()),
+                ('hits', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['last_used_at'], name='off_cache_last_used_idx')],
+            },
+        ),
+    ]
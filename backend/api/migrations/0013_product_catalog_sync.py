@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:44
+
+import hashlib
+import json
+
+from django.db import migrations, models
+
+# Frozen copies of api.importing.CATALOG_FIELDS and content_hash() as they were when this migration was written
+CATALOG_FIELDS = ['name', 'brand', 'picture', 'category', 'nutrition_score', 'nutritional_info']
+BATCH_SIZE = 2000
+
+
+def content_hash(values):
+    encoded = json.dumps(values, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def hash_existing_products(apps, schema_editor):
+    Product = apps.get_model('api', 'Product')
+    rows = Product.objects.order_by('pk').values('pk', *CATALOG_FIELDS).iterator(chunk_size=BATCH_SIZE)
+    batch = []
+    for row in rows:
+        pk = row.pop('pk')
+        batch.append(Product(pk=pk, content_hash=content_hash(row)))
+        if len(batch) >= BATCH_SIZE:
+            Product.objects.bulk_update(batch, ['content_hash'])
+            batch = []
+    if batch:
+        Product.objects.bulk_update(batch, ['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_openfoodfacts_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='retired_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(hash_existing_products, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,166 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:52
+
+import math
+
+from django.db import migrations, models
+
+# A frozen copy of api.nutrition.canonical_nutrients() as it was when this migration was written
+NUTRIENT_FIELDS = [
+    'energy_kcal_100g',
+    'fat_100g',
+    'carbohydrates_100g',
+    'sugars_100g',
+    'proteins_100g',
+    'salt_100g',
+    'fiber_100g',
+]
+FLAT_KEYS = {
+    'energy_kcal_100g': ('energy_kcal_100g', 'energy-kcal_100g', 'energy_kcal', 'energy'),
+    'fat_100g': ('fat_100g', 'fat_g', 'fat'),
+    'carbohydrates_100g': ('carbohydrates_100g', 'carbs_g', 'carbohydrates'),
+    'sugars_100g': ('sugars_100g', 'sugar_g', 'sugars', 'sugar'),
+    'proteins_100g': ('proteins_100g', 'protein_g', 'proteins', 'protein'),
+    'salt_100g': ('salt_100g', 'salt_g', 'salt'),
+    'fiber_100g': ('fiber_100g', 'fiber_g', 'fiber'),
+}
+NUTRIMENT_KEYS = {
+    'energy_kcal_100g': ('energy-kcal_100g', 'energy-kcal'),
+    'fat_100g': ('fat_100g', 'fat'),
+    'carbohydrates_100g': ('carbohydrates_100g', 'carbohydrates'),
+    'sugars_100g': ('sugars_100g', 'sugars'),
+    'proteins_100g': ('proteins_100g', 'proteins'),
+    'salt_100g': ('salt_100g', 'salt'),
+    'fiber_100g': ('fiber_100g', 'fiber'),
+}
+KJ_PER_KCAL = 4.184
+SALT_PER_SODIUM = 2.5
+BATCH_SIZE = 2000
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) and number >= 0 else None
+
+
+def _first(source, keys):
+    for key in keys:
+        number = _number(source.get(key))
+        if number is not None:
+            return number
+    return None
+
+
+def _lookup(info, nutriments, flat_keys, nutriment_keys):
+    value = _first(info, flat_keys)
+    return value if value is not None else _first(nutriments, nutriment_keys)
+
+
+def canonical_nutrients(info):
+    info = info if isinstance(info, dict) else {}
+    nutriments = info.get('nutriments')
+    nutriments = nutriments if isinstance(nutriments, dict) else {}
+
+    values = {field: _lookup(info, nutriments, FLAT_KEYS[field], NUTRIMENT_KEYS[field]) for field in NUTRIENT_FIELDS}
+
+    if values['energy_kcal_100g'] is None:
+        kj = _lookup(info, nutriments, ('energy_kj_100g', 'energy-kj_100g'), ('energy-kj_100g', 'energy_100g'))
+        if kj is not None:
+            values['energy_kcal_100g'] = round(kj / KJ_PER_KCAL, 1)
+    if values['salt_100g'] is None:
+        sodium = _lookup(info, nutriments, ('sodium_100g', 'sodium'), ('sodium_100g', 'sodium'))
+        if sodium is not None:
+            values['salt_100g'] = round(sodium * SALT_PER_SODIUM, 3)
+    return values
+
+
+def canonicalize_nutrition(apps, schema_editor):
+    Product = apps.get_model('api', 'Product')
+    rows = Product.objects.order_by('pk').values_list('pk', 'nutritional_info').iterator(chunk_size=BATCH_SIZE)
+    batch = []
+    for pk, info in rows:
+        batch.append(Product(pk=pk, **canonical_nutrients(info)))
+        if len(batch) >= BATCH_SIZE:
+            Product.objects.bulk_update(batch, NUTRIENT_FIELDS)
+            batch = []
+    if batch:
+        Product.objects.bulk_update(batch, NUTRIENT_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_enrichment_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='carbohydrates_100g',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='energy_kcal_100g',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='fat_100g',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='fiber_100g',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='proteins_100g',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='salt_100g',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='sugars_100g',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        # Fill the columns before indexing them
+        migrations.RunPython(canonicalize_nutrition, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['energy_kcal_100g'], name='product_energy_kcal_100g_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['fat_100g'], name='product_fat_100g_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['carbohydrates_100g'], name='product_carbohydrates_100g_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['sugars_100g'], name='product_sugars_100g_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['proteins_100g'], name='product_proteins_100g_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['salt_100g'], name='product_salt_100g_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['fiber_100g'], name='product_fiber_100g_idx'),
+        ),
+    ]
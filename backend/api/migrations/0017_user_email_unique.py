@@ -0,0 +1,33 @@
+from django.db import migrations
+from django.db.models import Count
+
+
+def check_duplicate_emails(apps, schema_editor):
+    # Which account keeps a shared address is for an admin to decide, not the migration
+    User = apps.get_model('auth', 'User')
+    duplicates = list(
+        User.objects.exclude(email='').values('email').annotate(users=Count('id')).filter(users__gt=1)
+        .order_by('email').values_list('email', flat=True)[:20]
+    )
+    if duplicates:
+        raise RuntimeError(
+            'Cannot make auth_user emails unique: several users share these addresses '
+            f"({', '.join(duplicates)}). Change or blank the email of all but one user for each and migrate again."
+        )
+
+
+class Migration(migrations.Migration):
+    """Unique (non-blank) emails for auth_user, which registration relies on instead of a pre-check"""
+
+    dependencies = [
+        ('api', '0016_product_nutrient_category_indexes'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_emails, migrations.RunPython.noop),
+        migrations.RunSQL(
+            "CREATE UNIQUE INDEX auth_user_email_uniq ON auth_user (email) WHERE email <> ''",
+            'DROP INDEX auth_user_email_uniq',
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def link_registered_customers(apps, schema_editor):
+    # Until now a user acted as the Customer sharing its id
+    Customer = apps.get_model('api', 'Customer')
+    User = apps.get_model('auth', 'User')
+    users = User.objects.exclude(profile__role='admin').values('id')
+    Customer.objects.filter(id__in=users).update(user_id=F('id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_user_email_unique'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='user',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='customer', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(link_registered_customers, migrations.RunPython.noop),
+    ]
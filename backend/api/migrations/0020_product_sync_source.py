@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_product_last_seen_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='sync_source',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+    ]
@@ -1,4 +1,9 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
+from django.db.models.functions import Upper
+
+from .nutrition import NUTRIENT_FIELDS, NUTRIENT_PARAMS, set_nutrients
 
 class Product(models.Model):
     name = models.CharField(max_length=255)
@@ -7,6 +12,14 @@ class Product(models.Model):
     picture = models.URLField(blank=True)
     category = models.CharField(max_length=255, blank=True)
     nutritional_info = models.JSONField(blank=True, null=True)
+    # Per-100g values canonicalized from nutritional_info (api.nutrition); null when unknown
+    energy_kcal_100g = models.FloatField(null=True, blank=True)
+    fat_100g = models.FloatField(null=True, blank=True)
+    carbohydrates_100g = models.FloatField(null=True, blank=True)
+    sugars_100g = models.FloatField(null=True, blank=True)
+    proteins_100g = models.FloatField(null=True, blank=True)
+    salt_100g = models.FloatField(null=True, blank=True)
+    fiber_100g = models.FloatField(null=True, blank=True)
     nutrition_score = models.CharField(max_length=1, blank=True, choices=[
         ('A', 'A - Excellent'),
         ('B', 'B - Good'),
@@ -18,12 +31,55 @@ class Product(models.Model):
     quantity = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True, null=True)
     updated_at = models.DateTimeField(auto_now=True, null=True)
+    # Catalog sync (api.importing): hash of the imported fields, the feed that last listed it and when,
+    # and when that feed stopped listing it
+    content_hash = models.CharField(max_length=64, blank=True)
+    sync_source = models.CharField(max_length=50, blank=True)
+    last_seen_at = models.DateTimeField(null=True, blank=True)
+    retired_at = models.DateTimeField(null=True, blank=True)
+    # Maintained by PostgreSQL; name outranks brand, which outranks category
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector('name', weight='A', config='simple')
+            + SearchVector('brand', weight='B', config='simple')
+            + SearchVector('category', weight='C', config='simple')
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
 
     def __str__(self):
         return f"{self.name} ({self.nutrition_score or 'N/A'})"
 
+    def save(self, *args, **kwargs):
+        if 'nutritional_info' not in self.get_deferred_fields():
+            set_nutrients(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'nutritional_info' in update_fields:
+            kwargs['update_fields'] = {*update_fields, *NUTRIENT_FIELDS}
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='product_created_id_idx'),
+            models.Index(fields=['category', '-created_at'], name='product_category_idx'),
+            models.Index(fields=['nutrition_score', '-created_at'], name='product_score_idx'),
+            models.Index(fields=['price'], name='product_price_idx'),
+            models.Index(fields=['updated_at'], name='product_updated_idx'),
+            models.Index(fields=['-created_at'], condition=models.Q(quantity__gt=0), name='product_in_stock_idx'),
+            GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
+            # Nutrient range filters; several ranges combine as a BitmapAnd
+            *[models.Index(fields=[field], name=f'product_{field}_idx') for field in NUTRIENT_FIELDS],
+            # The same filters or ordering within one category (the storefront's health filters)
+            *[models.Index(fields=['category', field], name=f'product_cat_{param}_idx') for param, field in NUTRIENT_PARAMS.items()],
+            # Typo-tolerant matching (name %> query)
+            GinIndex(OpClass('name', name='gin_trgm_ops'), name='product_name_trgm_idx'),
+            # Substring search (UPPER(col) LIKE UPPER('%query%')) from filter_products
+            GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='product_name_upper_trgm_idx'),
+            GinIndex(OpClass(Upper('brand'), name='gin_trgm_ops'), name='product_brand_upper_trgm_idx'),
+            GinIndex(OpClass(Upper('barcode'), name='gin_trgm_ops'), name='product_barcode_upper_trgm_idx'),
+        ]
 
 class Customer(models.Model):
     first_name = models.CharField(max_length=100)
@@ -33,6 +89,8 @@ class Customer(models.Model):
     city = models.CharField(max_length=100, blank=True)
     zip_code = models.CharField(max_length=20, blank=True)
     country = models.CharField(max_length=100, blank=True)
+    # The login of a self-registered customer; customers created by an admin have none
+    user = models.OneToOneField('auth.User', null=True, blank=True, on_delete=models.SET_NULL, related_name='customer')
 
 class Invoice(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='invoices')
@@ -50,6 +108,9 @@ class Invoice(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='invoice_created_id_idx'),
+        ]
 
 class InvoiceItem(models.Model):
     invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='items')
@@ -61,6 +122,108 @@ class InvoiceItem(models.Model):
         return f"{self.product.name} x {self.quantity}"
 
 
+class SalesRollup(models.Model):
+    """Pre-aggregated sales per day or month, maintained by api.rollups"""
+    PERIOD_CHOICES = [
+        ('day', 'Day'),
+        ('month', 'Month'),
+    ]
+    DIMENSION_CHOICES = [
+        ('total', 'Total'),
+        ('product', 'Product'),
+        ('category', 'Category'),
+        ('customer', 'Customer'),
+    ]
+
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    dimension = models.CharField(max_length=20, choices=DIMENSION_CHOICES)
+    # Product/customer id or category name; empty for the total dimension
+    key = models.CharField(max_length=255, blank=True)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units = models.BigIntegerField(default=0)
+    invoice_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.period} {self.period_start} {self.dimension}={self.key}: ${self.revenue}"
+
+    class Meta:
+        ordering = ['period', 'period_start', 'dimension', 'key']
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'dimension', 'period_start', 'key'], name='sales_rollup_unique'),
+        ]
+
+
+class OpenFoodFactsCacheEntry(models.Model):
+    """A cached OpenFoodFacts response, maintained by api.openfoodfacts"""
+    KIND_CHOICES = [
+        ('search', 'Search'),
+        ('product', 'Product'),
+    ]
+
+    # sha256 of the normalized query (or barcode) and request parameters
+    key = models.CharField(max_length=64, unique=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    query = models.CharField(max_length=255)
+    payload = models.JSONField()
+    fetched_at = models.DateTimeField()
+    last_used_at = models.DateTimeField()
+    hits = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.kind} {self.query!r} ({self.hits} hits)"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['last_used_at'], name='off_cache_last_used_idx'),
+        ]
+
+
+class EnrichmentJob(models.Model):
+    """A queued OpenFoodFacts lookup for one product, processed by api.enrichment"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('not_found', 'Not found'),
+        ('failed', 'Failed'),
+    ]
+    ACTIVE_STATUSES = ['pending', 'running']
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='enrichment_jobs')
+    # Either a search query or, when empty, a lookup of the product's barcode
+    query = models.CharField(max_length=255, blank=True)
+    barcode = models.CharField(max_length=100, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField()
+    # A running job whose lease has expired belongs to a worker that died and is picked up again
+    leased_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    result = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Job #{self.id} for product {self.product_id}: {self.status}"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['run_after', 'id'], condition=models.Q(status='pending'), name='enrichment_job_due_idx'),
+            models.Index(fields=['-created_at', '-id'], name='enrichment_job_created_idx'),
+        ]
+        constraints = [
+            # Enqueueing the same lookup again while one is in flight reuses that job
+            models.UniqueConstraint(
+                fields=['product', 'query', 'barcode'],
+                condition=models.Q(status__in=['pending', 'running']),
+                name='enrichment_job_active_unique',
+            ),
+        ]
+
+
 from django.contrib.auth.models import User as DjangoUser
 
 # Extend Django's built-in User with a role field
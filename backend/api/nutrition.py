@@ -0,0 +1,135 @@
+"""Canonical per-100g nutrients derived from Product.nutritional_info.
+
+The importers never agreed on a shape for nutritional_info: the seed data
+uses {'energy': 52, 'protein': 0.3}, the OpenFoodFacts importers use
+{'energy_kcal_100g': ..., 'proteins_100g': ...} or {'energy_kcal': ...,
+'protein_g': ...}, and enrichment stores the raw {'nutriments': {...}}.
+The blob is kept as-is for display, and the core nutrients are copied into
+typed, indexed Product columns so range filters are index scans.
+
+Flat keys are read first, then the nested OpenFoodFacts nutriments. Only
+the explicit kcal keys count as energy there, because the bare OFF
+'energy' nutriment is in kJ; kJ is converted when no kcal value exists,
+and salt is derived from sodium the way OpenFoodFacts does.
+"""
+import math
+
+NUTRIENT_FIELDS = [
+    'energy_kcal_100g',
+    'fat_100g',
+    'carbohydrates_100g',
+    'sugars_100g',
+    'proteins_100g',
+    'salt_100g',
+    'fiber_100g',
+]
+# Short names used by the catalog filters (?min_protein=20&ordering=-protein)
+NUTRIENT_PARAMS = {
+    'kcal': 'energy_kcal_100g',
+    'fat': 'fat_100g',
+    'carbs': 'carbohydrates_100g',
+    'sugars': 'sugars_100g',
+    'protein': 'proteins_100g',
+    'salt': 'salt_100g',
+    'fiber': 'fiber_100g',
+}
+
+# Keys accepted at the top level of nutritional_info, in order of preference
+FLAT_KEYS = {
+    'energy_kcal_100g': ('energy_kcal_100g', 'energy-kcal_100g', 'energy_kcal', 'energy'),
+    'fat_100g': ('fat_100g', 'fat_g', 'fat'),
+    'carbohydrates_100g': ('carbohydrates_100g', 'carbs_g', 'carbohydrates'),
+    'sugars_100g': ('sugars_100g', 'sugar_g', 'sugars', 'sugar'),
+    'proteins_100g': ('proteins_100g', 'protein_g', 'proteins', 'protein'),
+    'salt_100g': ('salt_100g', 'salt_g', 'salt'),
+    'fiber_100g': ('fiber_100g', 'fiber_g', 'fiber'),
+}
+# Keys of an OpenFoodFacts 'nutriments' object
+NUTRIMENT_KEYS = {
+    'energy_kcal_100g': ('energy-kcal_100g', 'energy-kcal'),
+    'fat_100g': ('fat_100g', 'fat'),
+    'carbohydrates_100g': ('carbohydrates_100g', 'carbohydrates'),
+    'sugars_100g': ('sugars_100g', 'sugars'),
+    'proteins_100g': ('proteins_100g', 'proteins'),
+    'salt_100g': ('salt_100g', 'salt'),
+    'fiber_100g': ('fiber_100g', 'fiber'),
+}
+# nutritional_info keys the OpenFoodFacts importers store -> nutriment names, in order of preference
+IMPORTED_NUTRIMENTS = {
+    'energy_kcal_100g': ('energy-kcal_100g', 'energy_kcal_100g'),
+    'energy_kj_100g': ('energy-kj_100g', 'energy_kj_100g'),
+    'fat_100g': ('fat_100g',),
+    'carbohydrates_100g': ('carbohydrates_100g',),
+    'sugars_100g': ('sugars_100g',),
+    'proteins_100g': ('proteins_100g',),
+    'salt_100g': ('salt_100g',),
+    'sodium_100g': ('sodium_100g',),
+    'fiber_100g': ('fiber_100g',),
+}
+KJ_PER_KCAL = 4.184
+SALT_PER_SODIUM = 2.5
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) and number >= 0 else None
+
+
+def _first(source, keys):
+    for key in keys:
+        number = _number(source.get(key))
+        if number is not None:
+            return number
+    return None
+
+
+def _lookup(info, nutriments, flat_keys, nutriment_keys):
+    value = _first(info, flat_keys)
+    return value if value is not None else _first(nutriments, nutriment_keys)
+
+
+def imported_nutrients(nutriments):
+    """The per-100g values an OpenFoodFacts nutriments object gives, keyed for nutritional_info.
+
+    Missing or unparsable nutrients are left out rather than stored as 0, so
+    they stay unknown and the kJ and sodium fallbacks still apply.
+    """
+    nutriments = nutriments if isinstance(nutriments, dict) else {}
+    info = {}
+    for key, names in IMPORTED_NUTRIMENTS.items():
+        value = _first(nutriments, names)
+        if value is not None:
+            info[key] = value
+    return info
+
+
+def canonical_nutrients(info):
+    """Map a nutritional_info blob of any known shape to {field: float or None}"""
+    info = info if isinstance(info, dict) else {}
+    nutriments = info.get('nutriments')
+    nutriments = nutriments if isinstance(nutriments, dict) else {}
+
+    values = {field: _lookup(info, nutriments, FLAT_KEYS[field], NUTRIMENT_KEYS[field]) for field in NUTRIENT_FIELDS}
+
+    if values['energy_kcal_100g'] is None:
+        kj = _lookup(info, nutriments, ('energy_kj_100g', 'energy-kj_100g'), ('energy-kj_100g', 'energy_100g'))
+        if kj is not None:
+            values['energy_kcal_100g'] = round(kj / KJ_PER_KCAL, 1)
+    if values['salt_100g'] is None:
+        sodium = _lookup(info, nutriments, ('sodium_100g', 'sodium'), ('sodium_100g', 'sodium'))
+        if sodium is not None:
+            values['salt_100g'] = round(sodium * SALT_PER_SODIUM, 3)
+    return values
+
+
+def set_nutrients(product):
+    """Copy the canonical nutrients of product.nutritional_info onto its columns; returns the product"""
+    for field, value in canonical_nutrients(product.nutritional_info).items():
+        setattr(product, field, value)
+    return product
+
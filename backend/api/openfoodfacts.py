@@ -0,0 +1,368 @@
+"""Shared OpenFoodFacts client.
+
+Every importer and the product enrichment endpoints go through one pooled
+requests.Session. Outgoing calls are paced by a token bucket shared by all
+threads, capped by a semaphore, and retried with exponential backoff plus
+full jitter on connection errors, 429 and 5xx. search_many() fans a list of
+queries out over a thread pool so an import is bounded by the rate limit
+rather than by round-trip latency.
+
+Responses are persisted in OpenFoodFactsCacheEntry, keyed on the normalized
+query (or barcode) and request parameters. Lookups are answered from the
+cache first: fresh entries are returned as is, stale ones are returned
+immediately and refreshed in the background (stale-while-revalidate), and
+entries past the stale window or beyond the size bound are evicted least
+recently used first. Eviction runs once every cull_every stored entries
+rather than on each write, so the table can exceed its bound by that much.
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from .models import OpenFoodFactsCacheEntry
+
+SEARCH_PATH = '/cgi/search.pl'
+PRODUCT_PATH = '/api/v2/product/{barcode}.json'
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30.0
+
+# label is what the caller asked for; key identifies the response in the cache
+Lookup = namedtuple('Lookup', 'key kind label query path params')
+Cached = namedtuple('Cached', 'payload stale')
+
+
+class OpenFoodFactsError(Exception):
+    """Raised when OpenFoodFacts cannot be reached or answers with an error"""
+
+
+class TokenBucket:
+    """Allow `rate` acquisitions per second with bursts of up to `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def normalize_query(terms):
+    return ' '.join(str(terms).casefold().split())
+
+
+def _lookup(kind, label, query, path, params):
+    digest = hashlib.sha256(json.dumps([kind, query, params], sort_keys=True).encode()).hexdigest()
+    return Lookup(digest, kind, label, query, path, params)
+
+
+class ResponseCache:
+    """OpenFoodFacts payloads persisted in OpenFoodFactsCacheEntry"""
+
+    def __init__(self, ttl, stale_ttl, max_entries, cull_every=None):
+        self.ttl = timedelta(seconds=ttl)
+        self.expiry = timedelta(seconds=ttl + stale_ttl)
+        self.max_entries = max_entries
+        self.cull_every = cull_every or max(max_entries // 100, 1)
+        self.unculled = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            settings.OPENFOODFACTS_CACHE_TTL,
+            settings.OPENFOODFACTS_CACHE_STALE_TTL,
+            settings.OPENFOODFACTS_CACHE_MAX_ENTRIES,
+        )
+
+    def get_many(self, keys):
+        """Return {key: Cached} for usable entries and mark them as used"""
+        now = timezone.now()
+        rows = OpenFoodFactsCacheEntry.objects.filter(key__in=keys, fetched_at__gte=now - self.expiry)
+        found = {
+            key: Cached(payload, fetched_at < now - self.ttl)
+            for key, payload, fetched_at in rows.values_list('key', 'payload', 'fetched_at')
+        }
+        if found:
+            OpenFoodFactsCacheEntry.objects.filter(key__in=found).update(hits=F('hits') + 1, last_used_at=now)
+        return found
+
+    def set_many(self, items):
+        """Store (lookup, payload) pairs; returns how many entries were evicted"""
+        now = timezone.now()
+        entries = {
+            lookup.key: OpenFoodFactsCacheEntry(
+                key=lookup.key, kind=lookup.kind, query=lookup.query[:255], payload=payload,
+                fetched_at=now, last_used_at=now,
+            )
+            for lookup, payload in items
+        }
+        OpenFoodFactsCacheEntry.objects.bulk_create(
+            entries.values(),
+            update_conflicts=True,
+            unique_fields=['key'],
+            update_fields=['payload', 'fetched_at', 'last_used_at'],
+        )
+        with self.lock:
+            self.unculled += len(entries)
+            due = self.unculled >= self.cull_every
+            if due:
+                self.unculled = 0
+        return self.cull(now) if due else 0
+
+    def cull(self, now=None):
+        now = now or timezone.now()
+        evicted, _ = OpenFoodFactsCacheEntry.objects.filter(fetched_at__lt=now - self.expiry).delete()
+        excess = OpenFoodFactsCacheEntry.objects.count() - self.max_entries
+        if excess > 0:
+            # Trim a further tenth so a full cache is not culled on every write
+            victims = OpenFoodFactsCacheEntry.objects.order_by('last_used_at').values_list('pk', flat=True)
+            victims = list(victims[:excess + self.max_entries // 10])
+            evicted += OpenFoodFactsCacheEntry.objects.filter(pk__in=victims).delete()[0]
+        return evicted
+
+
+class OpenFoodFactsClient:
+    def __init__(self, base_url=None, rate=None, burst=None, concurrency=None, retries=None, timeout=None, cache=None):
+        self.base_url = (base_url or settings.OPENFOODFACTS_BASE_URL).rstrip('/')
+        self.concurrency = max(concurrency or settings.OPENFOODFACTS_CONCURRENCY, 1)
+        self.retries = settings.OPENFOODFACTS_RETRIES if retries is None else retries
+        self.timeout = timeout or settings.OPENFOODFACTS_TIMEOUT
+        self.cache = cache
+        self.bucket = TokenBucket(
+            settings.OPENFOODFACTS_RATE_LIMIT if rate is None else rate,
+            burst or settings.OPENFOODFACTS_BURST,
+        )
+        self.slots = threading.BoundedSemaphore(self.concurrency)
+        self.pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='openfoodfacts')
+        self.stats = Counter()
+        self.lock = threading.Lock()
+        self.revalidating = set()
+        # Futures each calling thread is still waiting on, for wait()
+        self.local = threading.local()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['User-Agent'] = 'TrinityGrocery/1.0'
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.stats[name] += n
+
+    def summary(self):
+        stats = self.stats
+        return (
+            f"{stats['requests']} requests, {stats['hits']} cache hits "
+            f"({stats['stale']} stale), {stats['misses']} misses, {stats['evicted']} evicted"
+        )
+
+    def get(self, path, params=None, missing_ok=False):
+        """GET a JSON document, retrying transient failures"""
+        url = f'{self.base_url}{path}'
+        for attempt in range(self.retries + 1):
+            retry_after = None
+            self.bucket.acquire()
+            self.count('requests')
+            try:
+                with self.slots:
+                    response = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            except requests.RequestException as e:
+                raise OpenFoodFactsError(f'{url}: {e}') from e
+            else:
+                if missing_ok and response.status_code == 404:
+                    return {}
+                if response.status_code not in RETRY_STATUSES:
+                    try:
+                        response.raise_for_status()
+                        return response.json()
+                    except (requests.HTTPError, ValueError) as e:
+                        raise OpenFoodFactsError(f'{url}: {e}') from e
+                error = f'HTTP {response.status_code}'
+                retry_after = response.headers.get('Retry-After')
+            if attempt < self.retries:
+                time.sleep(self._backoff(attempt, retry_after))
+        raise OpenFoodFactsError(f'{url} failed after {self.retries + 1} attempts: {error}')
+
+    def _backoff(self, attempt, retry_after=None):
+        delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+        try:
+            return max(delay, float(retry_after))
+        except (TypeError, ValueError):
+            return delay
+
+    def _load(self, lookup):
+        if lookup.kind == 'product':
+            document = self.get(lookup.path, missing_ok=True)
+            return {'product': document.get('product') if document.get('status') == 1 else None}
+        return {'products': self.get(lookup.path, lookup.params).get('products') or []}
+
+    def _resolve(self, lookups):
+        """Yield (lookup, payload, error) in order, consulting the cache before the network"""
+        cached = self.cache.get_many({lookup.key for lookup in lookups}) if self.cache else {}
+        pending = {}
+        for lookup in lookups:
+            if lookup.key not in cached and lookup.key not in pending:
+                pending[lookup.key] = self._track(self.pool.submit(self._load, lookup))
+        self.count('hits', sum(lookup.key in cached for lookup in lookups))
+        self.count('misses', len(pending))
+        self._revalidate([lookup for lookup in lookups if lookup.key in cached and cached[lookup.key].stale])
+
+        fetched = {}
+        try:
+            for lookup in lookups:
+                if lookup.key in cached:
+                    yield lookup, cached[lookup.key].payload, None
+                    continue
+                try:
+                    fetched[lookup.key] = (lookup, pending[lookup.key].result())
+                except OpenFoodFactsError as e:
+                    yield lookup, None, e
+                except Exception as e:
+                    # e.g. a payload of an unexpected shape; callers only handle OpenFoodFactsError
+                    error = OpenFoodFactsError(f'{lookup.path}: {e!r}')
+                    error.__cause__ = e
+                    yield lookup, None, error
+                else:
+                    yield lookup, fetched[lookup.key][1], None
+        finally:
+            if self.cache and fetched:
+                self.count('evicted', self.cache.set_many(fetched.values()))
+
+    def _revalidate(self, lookups):
+        with self.lock:
+            lookups = list({lookup.key: lookup for lookup in lookups if lookup.key not in self.revalidating}.values())
+            self.revalidating.update(lookup.key for lookup in lookups)
+        if lookups:
+            self.count('stale', len(lookups))
+            self._track(self.pool.submit(self._refresh, lookups))
+
+    def _refresh(self, lookups):
+        try:
+            fresh = []
+            for lookup in lookups:
+                try:
+                    fresh.append((lookup, self._load(lookup)))
+                except Exception:
+                    pass  # keep serving the stale entry until it expires
+            if fresh:
+                self.count('evicted', self.cache.set_many(fresh))
+        finally:
+            with self.lock:
+                self.revalidating.difference_update(lookup.key for lookup in lookups)
+            connection.close()
+
+    def _track(self, future):
+        if not hasattr(self.local, 'futures'):
+            self.local.futures = set()
+        futures = self.local.futures
+        with self.lock:
+            futures.add(future)
+
+        def untrack(done):
+            with self.lock:
+                futures.discard(done)
+        future.add_done_callback(untrack)
+        return future
+
+    def wait(self):
+        """Block until the fetches and background revalidations this thread queued have finished.
+
+        The pool is shared by the whole process, so other callers' work is not waited for.
+        """
+        with self.lock:
+            futures = list(getattr(self.local, 'futures', ()))
+        wait_futures(futures)
+
+    def _search_lookup(self, terms, page_size=20, fields=None, **params):
+        params = {'search_terms': terms, 'search_simple': 1, 'json': 1, 'page_size': page_size, **params}
+        if fields:
+            params['fields'] = fields
+        query = normalize_query(terms)
+        return _lookup('search', terms, query, SEARCH_PATH, {**params, 'search_terms': query})
+
+    def search(self, terms, page_size=20, fields=None, **params):
+        """Return the products matching a full-text search"""
+        [(_, payload, error)] = list(self._resolve([self._search_lookup(terms, page_size, fields, **params)]))
+        if error:
+            raise error
+        return payload['products']
+
+    def first(self, terms, **params):
+        products = self.search(terms, page_size=1, **params)
+        return products[0] if products else None
+
+    def search_many(self, queries, **params):
+        """Run searches concurrently; yields (query, products, error) in input order"""
+        lookups = [self._search_lookup(query, **params) for query in queries]
+        for lookup, payload, error in self._resolve(lookups):
+            yield lookup.label, payload['products'] if payload else [], error
+
+    def _product_lookup(self, barcode):
+        barcode = str(barcode).strip()
+        path = PRODUCT_PATH.format(barcode=requests.utils.quote(barcode, safe=''))
+        return _lookup('product', barcode, barcode, path, {})
+
+    def product(self, barcode):
+        """Return the product with this barcode, or None if OpenFoodFacts does not know it"""
+        [(_, payload, error)] = list(self._resolve([self._product_lookup(barcode)]))
+        if error:
+            raise error
+        return payload['product']
+
+    def product_many(self, barcodes):
+        """Look barcodes up concurrently; yields (barcode, product or None, error) in input order"""
+        for lookup, payload, error in self._resolve([self._product_lookup(barcode) for barcode in barcodes]):
+            yield lookup.label, payload['product'] if payload else None, error
+
+
+def nutrition_summary(product):
+    """The subset of an OpenFoodFacts product stored in Product.nutritional_info"""
+    return {
+        'nutriments': product.get('nutriments', {}),
+        'serving_size': product.get('serving_size'),
+        'product_name': product.get('product_name'),
+    }
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Process-wide client, so every caller shares one pool, one rate limit and the cache"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            cache = ResponseCache.from_settings() if settings.OPENFOODFACTS_CACHE_MAX_ENTRIES else None
+            _client = OpenFoodFactsClient(cache=cache)
+        return _client
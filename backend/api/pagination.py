@@ -0,0 +1,22 @@
+from rest_framework.pagination import CursorPagination
+
+from .filters import nutrient_ordering
+
+
+class CreatedAtCursorPagination(CursorPagination):
+    """Keyset pagination on the model's -created_at ordering with an id tie-breaker"""
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class IdCursorPagination(CreatedAtCursorPagination):
+    """Keyset pagination for models without a created_at column"""
+    ordering = ('-id',)
+
+
+class ProductCursorPagination(CreatedAtCursorPagination):
+    """Newest first, or by a nutrient when the request asks for ?ordering=<nutrient>"""
+
+    def get_ordering(self, request, queryset, view):
+        return nutrient_ordering(request.query_params) or super().get_ordering(request, queryset, view)
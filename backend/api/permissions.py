@@ -0,0 +1,10 @@
+from rest_framework import permissions
+
+from .roles import request_role
+
+
+class IsAdminRole(permissions.BasePermission):
+    """Allow access only to users whose profile has the admin role"""
+
+    def has_permission(self, request, view):
+        return request_role(request) == 'admin'
@@ -0,0 +1,82 @@
+"""Request-scoped resolution of the caller's role and customer record.
+
+Access tokens carry the role and linked customer id that
+CustomTokenObtainPairSerializer read at login, so for token-authenticated
+requests they cost nothing. Other requests (sessions, force_authenticate
+in tests, tokens minted before the claims existed) fall back to cached
+lookups that are invalidated whenever the profile or customer is saved or
+deleted. A change therefore applies at once to the fallback, and for
+token holders at their next login or refresh (CustomTokenRefreshSerializer
+re-reads the claims rather than copying them from the refresh token), so
+within ACCESS_TOKEN_LIFETIME.
+
+The result is stored on the request, so permissions and views that ask
+again in the same request do not repeat the work.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Customer, UserProfile
+
+ROLES = {role for role, _ in UserProfile.ROLE_CHOICES}
+NO_PROFILE = ''
+NO_CUSTOMER = 0
+
+
+def _cache_key(user_id):
+    return f'user:{user_id}:role'
+
+
+def _customer_cache_key(user_id):
+    return f'user:{user_id}:customer'
+
+
+def cached_role(user_id):
+    """The profile role of user_id, or NO_PROFILE when the user has no profile"""
+    key = _cache_key(user_id)
+    role = cache.get(key)
+    if role is None:
+        role = UserProfile.objects.filter(user_id=user_id).values_list('role', flat=True).first() or NO_PROFILE
+        cache.set(key, role, settings.ROLE_CACHE_TIMEOUT)
+    return role
+
+
+def cached_customer_id(user_id):
+    """Id of the Customer linked to user_id, or NO_CUSTOMER when there is none"""
+    key = _customer_cache_key(user_id)
+    customer_id = cache.get(key)
+    if customer_id is None:
+        customer_id = Customer.objects.filter(user_id=user_id).values_list('id', flat=True).first() or NO_CUSTOMER
+        cache.set(key, customer_id, settings.ROLE_CACHE_TIMEOUT)
+    return customer_id
+
+
+def invalidate_role(user_id):
+    """Forget the cached role and customer of user_id once the current transaction commits"""
+    transaction.on_commit(lambda: cache.delete_many([_cache_key(user_id), _customer_cache_key(user_id)]))
+
+
+def request_role(request):
+    """Role of request.user ('admin', 'customer'), NO_PROFILE, or None when anonymous"""
+    if hasattr(request, 'role'):
+        return request.role
+    user = request.user
+    if not user or not user.is_authenticated:
+        role = None
+    else:
+        claim = request.auth.get('role') if hasattr(request.auth, 'get') else None
+        role = claim if claim in ROLES or claim == NO_PROFILE else cached_role(user.pk)
+    request.role = role
+    return role
+
+
+def request_customer_id(request):
+    """Id of the Customer linked to a customer-role caller, or None"""
+    if request_role(request) != 'customer':
+        return None
+    if not hasattr(request, 'customer_id'):
+        claim = request.auth.get('customer_id') if hasattr(request.auth, 'get') else None
+        customer_id = claim if isinstance(claim, int) else cached_customer_id(request.user.pk)
+        request.customer_id = customer_id or None
+    return request.customer_id
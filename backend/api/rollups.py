@@ -0,0 +1,230 @@
+"""Incremental maintenance of the SalesRollup table.
+
+Every write that touches an invoice (the invoice row itself or one of its
+items) is bracketed by begin()/end(). begin() snapshots what the invoice
+currently contributes to the rollups, end() recomputes it and applies the
+difference, so the cost of a write depends on the size of one invoice and
+never on the size of the sales history. Cancelled invoices contribute
+nothing. rebuild() recomputes the whole table from scratch.
+
+Inside a transaction begin() locks the invoice row before taking the
+snapshot, so concurrent writes to one invoice apply their deltas one after
+the other instead of both starting from the same snapshot. Writes outside a
+transaction get no lock, so anything writing invoices should run in one.
+
+Snapshots are kept per database transaction. A write that raises between
+begin() and end() leaves its snapshot behind; the next begin() in another
+transaction starts from a clean slate instead of reusing it. Outside a
+transaction every begin() starts afresh, so brackets only nest inside one.
+
+Deleting a product sets InvoiceItem.product to NULL with a bulk UPDATE that
+sends no item signals; the Product delete signals bracket every invoice
+holding the product instead (see invoices_with_product).
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, DateField, F, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from .models import Invoice, InvoiceItem, SalesRollup
+
+EXCLUDED_STATUSES = ['cancelled']
+PERIODS = (
+    ('day', TruncDate),
+    ('month', lambda field: TruncMonth(field, output_field=DateField())),
+)
+
+_local = threading.local()
+
+
+def _snapshots():
+    if not hasattr(_local, 'snapshots'):
+        _local.snapshots = {}
+    return _local.snapshots
+
+
+def _lock(invoice_id):
+    """Lock the invoice row until commit and return the id of the current transaction"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT txid_current(), EXISTS (SELECT 1 FROM {Invoice._meta.db_table} WHERE id = %s FOR UPDATE)',
+            [invoice_id],
+        )
+        return cursor.fetchone()[0]
+
+
+def _period_starts(created_at):
+    day = timezone.localtime(created_at).date() if timezone.is_aware(created_at) else created_at.date()
+    return (('day', day), ('month', day.replace(day=1)))
+
+
+def invoice_contributions(invoice_id):
+    """Return {(period, period_start, dimension, key): [revenue, units, invoices]} for one stored invoice"""
+    invoice = (
+        Invoice.objects.filter(pk=invoice_id)
+        .exclude(status__in=EXCLUDED_STATUSES)
+        .values('created_at', 'customer_id', 'total')
+        .first()
+    )
+    if invoice is None:
+        return {}
+
+    lines = list(
+        InvoiceItem.objects.filter(invoice_id=invoice_id).order_by()
+        .values('product_id', 'product__category')
+        .annotate(revenue=Sum(F('price') * F('quantity')), units=Sum('quantity'))
+    )
+    units = sum(line['units'] or 0 for line in lines)
+
+    per_key = {
+        ('total', ''): [invoice['total'], units],
+        ('customer', str(invoice['customer_id'])): [invoice['total'], units],
+    }
+    for line in lines:
+        if line['product_id'] is None:
+            continue
+        for key in (('product', str(line['product_id'])), ('category', line['product__category'])):
+            entry = per_key.setdefault(key, [Decimal('0'), 0])
+            entry[0] += line['revenue'] or Decimal('0')
+            entry[1] += line['units'] or 0
+
+    contributions = {}
+    for period, start in _period_starts(invoice['created_at']):
+        for (dimension, key), (revenue, line_units) in per_key.items():
+            contributions[(period, start, dimension, key)] = [revenue, line_units, 1]
+    return contributions
+
+
+def apply_delta(old, new):
+    """Add new - old to the rollup rows with race-free increments"""
+    rows = []
+    for key in sorted(set(old) | set(new)):
+        before = old.get(key, (Decimal('0'), 0, 0))
+        after = new.get(key, (Decimal('0'), 0, 0))
+        delta = [a - b for a, b in zip(after, before)]
+        if any(delta):
+            rows.append((*key, *delta))
+    if not rows:
+        return
+
+    table = SalesRollup._meta.db_table
+    sql = (
+        f'INSERT INTO {table} (period, period_start, dimension, key, revenue, units, invoice_count) '
+        'VALUES (%s, %s, %s, %s, %s, %s, %s) '
+        'ON CONFLICT (period, dimension, period_start, key) DO UPDATE SET '
+        f'revenue = {table}.revenue + EXCLUDED.revenue, '
+        f'units = {table}.units + EXCLUDED.units, '
+        f'invoice_count = {table}.invoice_count + EXCLUDED.invoice_count'
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def invoices_with_product(product_id):
+    """Ids of the invoices with a line for product_id, in lock order"""
+    return list(
+        InvoiceItem.objects.filter(product_id=product_id)
+        .order_by('invoice_id').values_list('invoice_id', flat=True).distinct()
+    )
+
+
+def begin(invoice_id):
+    """Snapshot an invoice's contribution before it is written"""
+    # Held until commit, so a concurrent write snapshots after this one is applied
+    transaction_id = _lock(invoice_id) if connection.in_atomic_block else None
+    if transaction_id is None or transaction_id != getattr(_local, 'transaction_id', None):
+        # Whatever is left over belongs to a transaction that has ended
+        _local.snapshots = {}
+        _local.transaction_id = transaction_id
+    snapshots = _snapshots()
+    entry = snapshots.get(invoice_id)
+    if entry is None:
+        entry = snapshots[invoice_id] = [invoice_contributions(invoice_id), 0]
+    entry[1] += 1
+
+
+def end(invoice_id):
+    """Apply the change since begin(); an invoice without a snapshot is treated as new"""
+    snapshots = _snapshots()
+    entry = snapshots.get(invoice_id) or [{}, 1]
+    new = invoice_contributions(invoice_id)
+    apply_delta(entry[0], new)
+    entry[0] = new
+    entry[1] -= 1
+    if entry[1] <= 0:
+        snapshots.pop(invoice_id, None)
+
+
+def discard(invoice_id):
+    _snapshots().pop(invoice_id, None)
+
+
+@contextmanager
+def track_invoice(invoice_id):
+    """Keep rollups in sync for writes that bypass model signals (bulk_create, update())"""
+    begin(invoice_id)
+    try:
+        yield
+    except Exception:
+        discard(invoice_id)
+        raise
+    end(invoice_id)
+
+
+def _accumulate(rows, queryset, period, dimension, key_field, revenue=None, units=None, invoices=None):
+    annotations = {}
+    if revenue:
+        annotations['revenue'] = revenue
+    if units:
+        annotations['units'] = units
+    if invoices:
+        annotations['invoices'] = invoices
+    fields = ['start'] + ([key_field] if key_field else [])
+    for row in queryset.values(*fields).annotate(**annotations).order_by():
+        key = '' if not key_field else str(row[key_field])
+        entry = rows[(period, row['start'], dimension, key)]
+        entry[0] += row.get('revenue') or Decimal('0')
+        entry[1] += row.get('units') or 0
+        entry[2] += row.get('invoices') or 0
+
+
+def rebuild():
+    """Recompute every rollup row from the invoice history; returns the row count"""
+    invoices = Invoice.objects.exclude(status__in=EXCLUDED_STATUSES)
+    items = InvoiceItem.objects.exclude(invoice__status__in=EXCLUDED_STATUSES)
+    line_revenue = Sum(F('price') * F('quantity'))
+
+    rows = defaultdict(lambda: [Decimal('0'), 0, 0])
+    for period, trunc in PERIODS:
+        period_invoices = invoices.annotate(start=trunc('created_at'))
+        period_items = items.annotate(start=trunc('invoice__created_at'))
+        priced_items = period_items.filter(product__isnull=False)
+
+        _accumulate(rows, period_invoices, period, 'total', None, revenue=Sum('total'), invoices=Count('id'))
+        _accumulate(rows, period_items, period, 'total', None, units=Sum('quantity'))
+        _accumulate(rows, period_invoices, period, 'customer', 'customer_id', revenue=Sum('total'), invoices=Count('id'))
+        _accumulate(rows, period_items, period, 'customer', 'invoice__customer_id', units=Sum('quantity'))
+        for dimension, key_field in (('product', 'product_id'), ('category', 'product__category')):
+            _accumulate(
+                rows, priced_items, period, dimension, key_field,
+                revenue=line_revenue, units=Sum('quantity'), invoices=Count('invoice_id', distinct=True),
+            )
+
+    with transaction.atomic():
+        SalesRollup.objects.all().delete()
+        SalesRollup.objects.bulk_create(
+            [
+                SalesRollup(
+                    period=period, period_start=start, dimension=dimension, key=key,
+                    revenue=revenue, units=units, invoice_count=count,
+                )
+                for (period, start, dimension, key), (revenue, units, count) in rows.items()
+            ],
+            batch_size=1000,
+        )
+    return len(rows)
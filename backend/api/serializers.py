@@ -1,19 +1,79 @@
 from rest_framework import serializers
-from .models import Product, Customer, Invoice, InvoiceItem, UserProfile
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from .models import Product, Customer, EnrichmentJob, Invoice, InvoiceItem, UserProfile
+from .roles import NO_CUSTOMER, NO_PROFILE
+from .nutrition import NUTRIENT_FIELDS
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 from django.contrib.auth.models import User
 
+def query_param_list(request, name):
+    """Parse a comma separated query parameter such as ?fields=id,name into a set"""
+    if request is None:
+        return set()
+    value = request.query_params.get(name, '')
+    return {part.strip() for part in value.split(',') if part.strip()}
+
+class DynamicFieldsMixin:
+    """Limit the top-level serializer of a request to ?fields=a,b when given"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = query_param_list(kwargs.get('context', {}).get('request'), 'fields')
+        if requested:
+            for name in set(self.fields) - requested:
+                self.fields.pop(name)
+
+def user_role(user):
+    """Profile role of a user, 'customer' when it has no profile"""
+    try:
+        return user.profile.role
+    except UserProfile.DoesNotExist:
+        return 'customer'
+
+def user_customer_id(user):
+    """Id of the Customer linked to a user, NO_CUSTOMER when it has none"""
+    try:
+        return user.customer.id
+    except Customer.DoesNotExist:
+        return NO_CUSTOMER
+
+def set_user_claims(token, user):
+    """Write the role, customer id and username claims read by api.roles and ClaimsUser"""
+    # Without a profile the claim is NO_PROFILE, which is what the fallback in api.roles resolves to
+    token['role'] = user.profile.role if hasattr(user, 'profile') else NO_PROFILE
+    token['customer_id'] = user_customer_id(user)
+    token['username'] = user.username
+    return token
+
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     @classmethod
     def get_token(cls, user):
-        token = super().get_token(user)
+        # The login backend fetched the profile and customer with the user, so this needs no query
+        return set_user_claims(super().get_token(user), user)
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        data['role'] = user_role(self.user)
+        data['username'] = self.user.username
+        return data
+
+class CustomTokenRefreshSerializer(TokenRefreshSerializer):
+    def validate(self, attrs):
+        """Re-read the claims on refresh; simplejwt would copy them from the refresh token unchanged"""
         try:
-            profile = UserProfile.objects.get(user=user)
-            token['role'] = profile.role
-        except UserProfile.DoesNotExist:
-            token['role'] = 'customer'
-        token['username'] = user.username
-        return token
+            data = super().validate(attrs)
+            access = AccessToken(data['access'])
+            user = User.objects.select_related('profile', 'customer').get(
+                **{jwt_settings.USER_ID_FIELD: access[jwt_settings.USER_ID_CLAIM]}
+            )
+        except User.DoesNotExist:
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+        data['access'] = str(set_user_claims(access, user))
+        if 'refresh' in data:
+            data['refresh'] = str(set_user_claims(RefreshToken(data['refresh']), user))
+        return data
 
 class UserSerializer(serializers.ModelSerializer):
     role = serializers.SerializerMethodField()
@@ -23,33 +83,79 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'email', 'first_name', 'last_name', 'role']
     
     def get_role(self, obj):
-        try:
-            return obj.profile.role
-        except UserProfile.DoesNotExist:
-            return 'customer'
+        return user_role(obj)
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Product
-        fields = '__all__'
+        exclude = ['search_vector', 'content_hash', 'sync_source', 'last_seen_at']
+        # The nutrient columns are derived from nutritional_info on save
+        read_only_fields = ['retired_at', *NUTRIENT_FIELDS]
 
-class CustomerSerializer(serializers.ModelSerializer):
+class EnrichmentJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = EnrichmentJob
+        fields = ['id', 'product', 'query', 'barcode', 'status', 'attempts', 'last_error', 'result', 'run_after', 'created_at', 'finished_at']
+        read_only_fields = fields
+
+class CustomerSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Customer
         fields = '__all__'
+        # Linked at registration; relinking would hand one login another customer's invoices
+        read_only_fields = ['user']
 
 class InvoiceItemSerializer(serializers.ModelSerializer):
-    product = ProductSerializer(read_only=True)
-    product_id = serializers.IntegerField(write_only=True)
+    product_id = serializers.IntegerField()
+    product_name = serializers.CharField(source='product.name', read_only=True, default=None)
     
     class Meta:
         model = InvoiceItem
-        fields = ['id', 'product', 'product_id', 'quantity', 'price']
+        fields = ['id', 'product_id', 'product_name', 'quantity', 'price']
 
-class InvoiceSerializer(serializers.ModelSerializer):
+class ExpandedInvoiceItemSerializer(InvoiceItemSerializer):
+    product = ProductSerializer(read_only=True)
+
+    class Meta(InvoiceItemSerializer.Meta):
+        fields = ['id', 'product', 'product_id', 'product_name', 'quantity', 'price']
+
+class InvoiceSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     items = InvoiceItemSerializer(many=True, read_only=True)
     customer_name = serializers.CharField(source='customer.first_name', read_only=True)
     
     class Meta:
         model = Invoice
         fields = ['id', 'customer', 'customer_name', 'total', 'status', 'created_at', 'updated_at', 'items']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # ?expand=product embeds the full product in every line item
+        if 'items' in self.fields and 'product' in query_param_list(kwargs.get('context', {}).get('request'), 'expand'):
+            self.fields['items'] = ExpandedInvoiceItemSerializer(many=True, read_only=True)
+
+
+class CheckoutItemSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, max_value=10000)
+
+class CheckoutSerializer(serializers.Serializer):
+    customer = serializers.PrimaryKeyRelatedField(queryset=Customer.objects.all(), required=False)
+    items = CheckoutItemSerializer(many=True, allow_empty=False)
+
+
+class EnrichBatchItemSerializer(serializers.Serializer):
+    id = serializers.IntegerField(min_value=1)
+    query = serializers.CharField(max_length=255, required=False, allow_blank=True)
+
+class EnrichBatchSerializer(serializers.Serializer):
+    """Products to enrich: explicit ids, ids with their own queries, or a whole category"""
+    MAX_PRODUCTS = 1000
+
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, max_length=MAX_PRODUCTS)
+    items = EnrichBatchItemSerializer(many=True, required=False, max_length=MAX_PRODUCTS)
+    category = serializers.CharField(max_length=255, required=False)
+
+    def validate(self, attrs):
+        if not (attrs.get('ids') or attrs.get('items') or attrs.get('category')):
+            raise serializers.ValidationError('Provide ids, items or category.')
+        return attrs
@@ -0,0 +1,76 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import rollups
+from .caching import invalidate_catalog
+from .models import Customer, Invoice, InvoiceItem, Product, UserProfile
+from .roles import invalidate_role
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    invalidate_catalog()
+
+
+@receiver(pre_delete, sender=Product)
+def product_pre_delete(sender, instance, **kwargs):
+    # The delete sets InvoiceItem.product to NULL with a bulk UPDATE, which sends no item signals
+    instance._rollup_invoices = rollups.invoices_with_product(instance.pk)
+    for invoice_id in instance._rollup_invoices:
+        rollups.begin(invoice_id)
+
+
+@receiver(post_delete, sender=Product)
+def product_post_delete(sender, instance, **kwargs):
+    for invoice_id in getattr(instance, '_rollup_invoices', ()):
+        rollups.end(invoice_id)
+
+
+@receiver(pre_save, sender=Invoice)
+def invoice_pre_save(sender, instance, raw=False, **kwargs):
+    if instance.pk and not raw:
+        rollups.begin(instance.pk)
+
+
+@receiver(post_save, sender=Invoice)
+def invoice_post_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        rollups.end(instance.pk)
+
+
+@receiver(pre_delete, sender=Invoice)
+def invoice_pre_delete(sender, instance, **kwargs):
+    rollups.begin(instance.pk)
+
+
+@receiver(post_delete, sender=Invoice)
+def invoice_post_delete(sender, instance, **kwargs):
+    rollups.end(instance.pk)
+
+
+@receiver(pre_save, sender=InvoiceItem)
+@receiver(pre_delete, sender=InvoiceItem)
+def invoice_item_pre_write(sender, instance, raw=False, **kwargs):
+    if instance.invoice_id and not raw:
+        rollups.begin(instance.invoice_id)
+
+
+@receiver(post_save, sender=InvoiceItem)
+@receiver(post_delete, sender=InvoiceItem)
+def invoice_item_post_write(sender, instance, raw=False, **kwargs):
+    if instance.invoice_id and not raw:
+        rollups.end(instance.invoice_id)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def profile_changed(sender, instance, **kwargs):
+    invalidate_role(instance.user_id)
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+def customer_changed(sender, instance, **kwargs):
+    if instance.user_id:
+        invalidate_role(instance.user_id)
@@ -0,0 +1,79 @@
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+
+from .models import Customer, Invoice, Product
+
+INVOICE_STATUSES = [choice for choice, _ in Invoice._meta.get_field('status').choices]
+INVENTORY_VALUE = ExpressionWrapper(F('price') * F('quantity'), output_field=DecimalField(max_digits=20, decimal_places=2))
+
+
+def _money(value):
+    return str((value or Decimal('0')).quantize(Decimal('0.01')))
+
+
+def dashboard_stats(low_stock_threshold=10):
+    """Compute the admin dashboard KPIs with database aggregates"""
+    by_status = {status: {'count': 0, 'revenue': Decimal('0')} for status in INVOICE_STATUSES}
+    for row in Invoice.objects.order_by().values('status').annotate(count=Count('id'), revenue=Sum('total')):
+        by_status[row['status']] = {'count': row['count'], 'revenue': row['revenue'] or Decimal('0')}
+
+    invoice_count = sum(row['count'] for row in by_status.values())
+    total_revenue = sum((row['revenue'] for row in by_status.values()), Decimal('0'))
+
+    # Retired products are no longer sold, so they are left out of the catalog KPIs
+    live = Product.objects.filter(retired_at__isnull=True)
+    products = live.aggregate(
+        count=Count('id'),
+        inventory_value=Sum(INVENTORY_VALUE),
+        low_stock=Count('id', filter=Q(quantity__gt=0, quantity__lte=low_stock_threshold)),
+        out_of_stock=Count('id', filter=Q(quantity__lte=0)),
+    )
+
+    categories = (
+        live.order_by()
+        .values('category')
+        .annotate(products=Count('id'), units=Sum('quantity'), inventory_value=Sum(INVENTORY_VALUE))
+        .order_by('-inventory_value', 'category')
+    )
+
+    top_products = (
+        live.annotate(inventory_value=INVENTORY_VALUE)
+        .order_by('-inventory_value', '-id')
+        .values('id', 'name', 'price', 'quantity', 'inventory_value')[:5]
+    )
+
+    return {
+        'invoices': {
+            'count': invoice_count,
+            'total_revenue': _money(total_revenue),
+            'average_amount': _money(total_revenue / invoice_count if invoice_count else None),
+            'by_status': {
+                status: {'count': row['count'], 'revenue': _money(row['revenue'])}
+                for status, row in by_status.items()
+            },
+        },
+        'products': {
+            'count': products['count'],
+            'inventory_value': _money(products['inventory_value']),
+            'low_stock': products['low_stock'],
+            'out_of_stock': products['out_of_stock'],
+            'low_stock_threshold': low_stock_threshold,
+        },
+        'customers': {
+            'count': Customer.objects.count(),
+        },
+        'categories': [
+            {
+                'category': row['category'],
+                'products': row['products'],
+                'quantity': row['units'] or 0,
+                'inventory_value': _money(row['inventory_value']),
+            }
+            for row in categories
+        ],
+        'top_products': [
+            {**row, 'price': _money(row['price']), 'inventory_value': _money(row['inventory_value'])}
+            for row in top_products
+        ],
+    }
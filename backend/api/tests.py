@@ -1,7 +1,40 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
 from rest_framework.test import APIClient
-from .models import Product
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.auth.models import User
+from . import enrichment, hashers, rollups
+from .authentication import ClaimsUser
+from .checkout import InsufficientStock, place_order
+from .hashers import TunedPBKDF2PasswordHasher
+from .importing import ProductWriter
+from .nutrition import canonical_nutrients, imported_nutrients
+from .models import Product, Customer, EnrichmentJob, Invoice, InvoiceItem, OpenFoodFactsCacheEntry, SalesRollup, UserProfile
+from .openfoodfacts import OpenFoodFactsClient, OpenFoodFactsError, ResponseCache
+from .roles import NO_PROFILE
+from .views import InvoiceViewSet
 
 class ProductAPITest(TestCase):
     def setUp(self):
@@ -13,3 +46,1032 @@ class ProductAPITest(TestCase):
         # list endpoint requires auth; ensure 401 for anonymous
         resp = self.client.get('/api/products/')
         self.assertEqual(resp.status_code, 401)
+
+
+class PaginationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='admin', password='pass')
+        UserProfile.objects.create(user=self.user, role='admin')
+        self.client.force_authenticate(self.user)
+
+    def test_product_list_is_cursor_paginated(self):
+        for i in range(5):
+            Product.objects.create(name=f'P{i}', price='1.00', barcode=f'B{i}')
+        resp = self.client.get('/api/products/', {'page_size': 2})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.data['results']), 2)
+        self.assertIsNotNone(resp.data['next'])
+
+        seen = [p['id'] for p in resp.data['results']]
+        while resp.data['next']:
+            resp = self.client.get(resp.data['next'])
+            seen += [p['id'] for p in resp.data['results']]
+        self.assertEqual(sorted(seen), sorted(Product.objects.values_list('id', flat=True)))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_customer_list_is_cursor_paginated(self):
+        for i in range(3):
+            Customer.objects.create(first_name=f'C{i}', last_name='Test')
+        resp = self.client.get('/api/customers/', {'page_size': 2})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([c['first_name'] for c in resp.data['results']], ['C2', 'C1'])
+
+
+class ProductFilterTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='admin', password='pass')
+        self.client.force_authenticate(self.user)
+        Product.objects.create(name='Greek Yogurt', brand='Fage', category='Dairy', nutrition_score='A', price='3.50', quantity=10, barcode='111')
+        Product.objects.create(name='Cheddar', brand='Kerrygold', category='Dairy', nutrition_score='D', price='6.00', quantity=0, barcode='222')
+        Product.objects.create(name='Cola', brand='Fizz', category='Beverages', nutrition_score='E', price='1.20', quantity=5, barcode='333')
+
+    def names(self, **params):
+        resp = self.client.get('/api/products/', params)
+        self.assertEqual(resp.status_code, 200)
+        return sorted(p['name'] for p in resp.data['results'])
+
+    def test_filters(self):
+        self.assertEqual(self.names(search='kerry'), ['Cheddar'])
+        self.assertEqual(self.names(search='333'), ['Cola'])
+        self.assertEqual(self.names(category='Dairy'), ['Cheddar', 'Greek Yogurt'])
+        self.assertEqual(self.names(nutrition_score='a,e'), ['Cola', 'Greek Yogurt'])
+        self.assertEqual(self.names(min_price='2', max_price='5'), ['Greek Yogurt'])
+        self.assertEqual(self.names(in_stock='true', category='Dairy'), ['Greek Yogurt'])
+
+    def test_categories(self):
+        Product.objects.create(name='Water', price='0.50', barcode='555')
+        Product.objects.create(name='Old Soup', category='Soups', price='2.00', barcode='666', retired_at=timezone.now())
+        resp = self.client.get('/api/products/categories/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data, ['Beverages', 'Dairy'])
+
+    def test_nutrient_filters_and_ordering(self):
+        Product.objects.filter(barcode='111').update(proteins_100g=10, sugars_100g=4)
+        Product.objects.filter(barcode='222').update(proteins_100g=25, sugars_100g=0.5)
+        Product.objects.filter(barcode='333').update(proteins_100g=0, sugars_100g=10.6)
+        self.assertEqual(self.names(min_protein='20', max_sugars='5'), ['Cheddar'])
+        self.assertEqual(self.names(category='Dairy', max_sugars='5'), ['Cheddar', 'Greek Yogurt'])
+
+        for fast_read in (set(), {'products'}):
+            with self.settings(FAST_READ_ENDPOINTS=fast_read):
+                cache.clear()
+                names, params = [], {'ordering': '-protein', 'page_size': 2, 'fields': 'name'}
+                url = '/api/products/'
+                while url:
+                    resp = self.client.get(url, params)
+                    names += [p['name'] for p in resp.data['results']]
+                    url, params = resp.data['next'], None
+                self.assertEqual(names, ['Cheddar', 'Greek Yogurt', 'Cola'])
+
+        # products without the nutrient are left out of a nutrient ordering
+        Product.objects.create(name='Water', price='0.50', barcode='555')
+        cache.clear()
+        self.assertNotIn('Water', self.names(ordering='sugars'))
+        self.assertEqual(self.client.get('/api/products/', {'ordering': 'vitamins'}).status_code, 400)
+
+    def test_invalid_filter_is_rejected(self):
+        resp = self.client.get('/api/products/', {'min_price': 'cheap'})
+        self.assertEqual(resp.status_code, 400)
+        resp = self.client.get('/api/products/', {'nutrition_score': 'Z'})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_ranked_search(self):
+        Product.objects.create(name='Yogurt Drink', brand='Fage', category='Beverages', price='2.00', barcode='444')
+        resp = self.client.get('/api/products/search/', {'q': 'yogurt'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.data['results']), 2)
+        self.assertNotIn('search_vector', resp.data['results'][0])
+
+        # misspelled queries still match through trigram similarity
+        resp = self.client.get('/api/products/search/', {'q': 'chedar'})
+        self.assertEqual([p['name'] for p in resp.data['results']], ['Cheddar'])
+
+        resp = self.client.get('/api/products/search/')
+        self.assertEqual(resp.status_code, 400)
+
+
+class DashboardStatsTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user(username='admin', password='pass')
+        UserProfile.objects.create(user=self.admin, role='admin')
+        customer = Customer.objects.create(first_name='Ada', last_name='Lovelace')
+        Product.objects.create(name='Milk', category='Dairy', price='2.00', quantity=10, barcode='1')
+        Product.objects.create(name='Cheese', category='Dairy', price='5.00', quantity=2, barcode='2')
+        Product.objects.create(name='Tea', category='Beverages', price='3.00', quantity=0, barcode='3')
+        # retired products stay out of every product figure
+        Product.objects.create(name='Old Milk', category='Dairy', price='9.00', quantity=50, barcode='4', retired_at=timezone.now())
+        Invoice.objects.create(customer=customer, total='10.00', status='completed')
+        Invoice.objects.create(customer=customer, total='5.50', status='pending')
+
+    def test_stats_payload(self):
+        self.client.force_authenticate(self.admin)
+        resp = self.client.get('/api/stats/', {'low_stock': 5})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['invoices']['count'], 2)
+        self.assertEqual(resp.data['invoices']['total_revenue'], '15.50')
+        self.assertEqual(resp.data['invoices']['average_amount'], '7.75')
+        self.assertEqual(resp.data['invoices']['by_status']['pending'], {'count': 1, 'revenue': '5.50'})
+        self.assertEqual(resp.data['invoices']['by_status']['cancelled'], {'count': 0, 'revenue': '0.00'})
+        self.assertEqual(resp.data['products']['count'], 3)
+        self.assertEqual(resp.data['products']['inventory_value'], '30.00')
+        self.assertEqual(resp.data['products']['low_stock'], 1)
+        self.assertEqual(resp.data['products']['out_of_stock'], 1)
+        self.assertEqual(resp.data['customers']['count'], 1)
+        self.assertEqual(resp.data['categories'][0], {'category': 'Dairy', 'products': 2, 'quantity': 12, 'inventory_value': '30.00'})
+        self.assertEqual(resp.data['top_products'][0]['name'], 'Milk')
+
+    def test_stats_requires_admin(self):
+        customer_user = User.objects.create_user(username='bob', password='pass')
+        UserProfile.objects.create(user=customer_user, role='customer')
+        self.client.force_authenticate(customer_user)
+        self.assertEqual(self.client.get('/api/stats/').status_code, 403)
+
+
+class SalesRollupTest(TestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(first_name='Ada', last_name='Lovelace')
+        self.milk = Product.objects.create(name='Milk', category='Dairy', price='2.00', quantity=10, barcode='1')
+        self.tea = Product.objects.create(name='Tea', category='Beverages', price='3.00', quantity=10, barcode='2')
+
+    def create_invoice(self, status='completed'):
+        invoice = Invoice.objects.create(customer=self.customer, total='0.00', status=status)
+        InvoiceItem.objects.create(invoice=invoice, product=self.milk, quantity=2, price='2.00')
+        InvoiceItem.objects.create(invoice=invoice, product=self.tea, quantity=1, price='3.00')
+        invoice.total = '7.00'
+        invoice.save()
+        return invoice
+
+    def snapshot(self):
+        return sorted(
+            SalesRollup.objects.exclude(revenue=0, units=0, invoice_count=0)
+            .values_list('period', 'period_start', 'dimension', 'key', 'revenue', 'units', 'invoice_count')
+        )
+
+    def assertMatchesRebuild(self):
+        incremental = self.snapshot()
+        rollups.rebuild()
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_rollups_follow_invoice_lifecycle(self):
+        invoice = self.create_invoice()
+        self.create_invoice()
+        month = SalesRollup.objects.get(period='month', dimension='category', key='Dairy')
+        self.assertEqual((month.revenue, month.units, month.invoice_count), (Decimal('8.00'), 4, 2))
+        total = SalesRollup.objects.get(period='day', dimension='total')
+        self.assertEqual((total.revenue, total.units, total.invoice_count), (Decimal('14.00'), 6, 2))
+        self.assertMatchesRebuild()
+
+        invoice.status = 'cancelled'
+        invoice.save()
+        total = SalesRollup.objects.get(period='day', dimension='total')
+        self.assertEqual((total.revenue, total.invoice_count), (Decimal('7.00'), 1))
+        self.assertMatchesRebuild()
+
+        invoice.status = 'completed'
+        invoice.save()
+        invoice.delete()
+        total = SalesRollup.objects.get(period='month', dimension='total')
+        self.assertEqual((total.revenue, total.units, total.invoice_count), (Decimal('7.00'), 3, 1))
+        self.assertMatchesRebuild()
+
+    def test_deleting_a_product_moves_its_lines_out_of_the_rollups(self):
+        self.create_invoice()
+        self.tea.delete()
+        self.assertFalse(SalesRollup.objects.filter(dimension='category', key='Beverages').exclude(invoice_count=0).exists())
+        self.assertMatchesRebuild()
+
+    def test_snapshot_locks_the_invoice_inside_a_transaction(self):
+        invoice = self.create_invoice()
+        with CaptureQueriesContext(connection) as queries, transaction.atomic():
+            invoice.status = 'pending'
+            invoice.save()
+        sql = [query['sql'] for query in queries]
+        locked = next(i for i, query in enumerate(sql) if 'FOR UPDATE' in query)
+        self.assertLess(locked, next(i for i, query in enumerate(sql) if query.startswith('UPDATE "api_invoice"')))
+        self.assertMatchesRebuild()
+
+    def test_sales_endpoint(self):
+        self.create_invoice()
+        admin = User.objects.create_user(username='admin', password='pass')
+        UserProfile.objects.create(user=admin, role='admin')
+        client = APIClient()
+        client.force_authenticate(admin)
+        resp = client.get('/api/stats/sales/', {'period': 'month', 'dimension': 'product', 'key': self.milk.id})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['results'][0]['revenue'], '4.00')
+        self.assertEqual(client.get('/api/stats/sales/', {'period': 'year'}).status_code, 400)
+        self.assertEqual(client.get('/api/stats/sales/', {'start': 'soon'}).status_code, 400)
+
+
+class CheckoutTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='ada', password='pass')
+        UserProfile.objects.create(user=self.user, role='customer')
+        self.customer = Customer.objects.create(user=self.user, first_name='Ada', last_name='Lovelace')
+        self.milk = Product.objects.create(name='Milk', category='Dairy', price='2.00', quantity=5, barcode='1')
+        self.tea = Product.objects.create(name='Tea', category='Beverages', price='3.50', quantity=1, barcode='2')
+        self.client.force_authenticate(self.user)
+
+    def test_checkout_creates_invoice_and_decrements_stock(self):
+        resp = self.client.post('/api/invoices/checkout/', {'items': [
+            {'product_id': self.tea.id, 'quantity': 1},
+            {'product_id': self.milk.id, 'quantity': 2},
+            {'product_id': self.milk.id, 'quantity': 1},
+        ]}, format='json')
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.data['total'], '9.50')
+        self.assertEqual(resp.data['customer'], self.customer.id)
+        self.assertEqual(sorted((i['product_id'], i['quantity']) for i in resp.data['items']),
+                         [(self.milk.id, 3), (self.tea.id, 1)])
+        self.milk.refresh_from_db()
+        self.tea.refresh_from_db()
+        self.assertEqual((self.milk.quantity, self.tea.quantity), (2, 0))
+        total = SalesRollup.objects.get(period='day', dimension='total')
+        self.assertEqual((total.revenue, total.units, total.invoice_count), (Decimal('9.50'), 4, 1))
+
+    def test_checkout_rejects_insufficient_stock(self):
+        resp = self.client.post('/api/invoices/checkout/', {'items': [
+            {'product_id': self.milk.id, 'quantity': 1},
+            {'product_id': self.tea.id, 'quantity': 2},
+        ]}, format='json')
+        self.assertEqual(resp.status_code, 409)
+        self.assertEqual(resp.data['items'][0]['product_id'], self.tea.id)
+        self.milk.refresh_from_db()
+        self.assertEqual(self.milk.quantity, 5)
+        self.assertFalse(Invoice.objects.exists())
+
+    def test_checkout_validates_cart(self):
+        self.assertEqual(self.client.post('/api/invoices/checkout/', {'items': []}, format='json').status_code, 400)
+        resp = self.client.post('/api/invoices/checkout/', {'items': [{'product_id': 999, 'quantity': 1}]}, format='json')
+        self.assertEqual(resp.status_code, 400)
+
+
+class ConcurrentCheckoutTest(TransactionTestCase):
+    def test_no_overselling(self):
+        customer = Customer.objects.create(first_name='Ada', last_name='Lovelace')
+        product = Product.objects.create(name='Hot Item', price='1.00', quantity=5, barcode='hot')
+        results = []
+
+        def buy():
+            try:
+                place_order(customer, [(product.id, 1)])
+                results.append('ok')
+            except InsufficientStock:
+                results.append('short')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy) for _ in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual(results.count('ok'), 5)
+        self.assertEqual(results.count('short'), 7)
+        self.assertEqual(product.quantity, 0)
+        self.assertEqual(InvoiceItem.objects.count(), 5)
+
+
+class RollupSnapshotTest(TransactionTestCase):
+    def test_failed_write_leaves_no_stale_snapshot(self):
+        customer = Customer.objects.create(first_name='Ada', last_name='Lovelace')
+        milk = Product.objects.create(name='Milk', category='Dairy', price='2.00', quantity=10, barcode='1')
+        invoice = Invoice.objects.create(customer=customer, total='2.00')
+        InvoiceItem.objects.create(invoice=invoice, product=milk, quantity=1, price='2.00')
+
+        # pre_save snapshots the invoice, then the insert fails and post_save never runs
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            InvoiceItem.objects.create(invoice=invoice, product=milk, quantity=1, price=None)
+
+        def other_writer():
+            try:
+                with transaction.atomic():
+                    InvoiceItem.objects.create(invoice=invoice, product=milk, quantity=2, price='2.00')
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=other_writer)
+        thread.start()
+        thread.join()
+
+        with transaction.atomic():
+            InvoiceItem.objects.create(invoice=invoice, product=milk, quantity=3, price='2.00')
+
+        rows = lambda: sorted(SalesRollup.objects.values_list('period', 'dimension', 'key', 'revenue', 'units', 'invoice_count'))
+        incremental = rows()
+        rollups.rebuild()
+        self.assertEqual(incremental, rows())
+
+
+class SparseFieldsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.admin = User.objects.create_user(username='admin', password='pass')
+        UserProfile.objects.create(user=self.admin, role='admin')
+        self.client.force_authenticate(self.admin)
+        customer = Customer.objects.create(first_name='Ada', last_name='Lovelace')
+        for i in range(3):
+            product = Product.objects.create(name=f'P{i}', price='1.00', barcode=f'B{i}', nutritional_info={'fat_100g': i})
+            invoice = Invoice.objects.create(customer=customer, total='1.00')
+            InvoiceItem.objects.create(invoice=invoice, product=product, quantity=1, price='1.00')
+
+    def test_product_fields(self):
+        resp = self.client.get('/api/products/', {'fields': 'id,name,price'})
+        self.assertEqual(set(resp.data['results'][0]), {'id', 'name', 'price'})
+        resp = self.client.get('/api/products/')
+        self.assertIn('nutritional_info', resp.data['results'][0])
+
+    def test_invoice_items_are_slim_unless_expanded(self):
+        with self.assertNumQueries(4):  # profile, invoices joined to customers, items, product names
+            resp = self.client.get('/api/invoices/')
+        item = resp.data['results'][0]['items'][0]
+        self.assertEqual(set(item), {'id', 'product_id', 'product_name', 'quantity', 'price'})
+
+        resp = self.client.get('/api/invoices/', {'expand': 'product', 'fields': 'id,items'})
+        self.assertEqual(set(resp.data['results'][0]), {'id', 'items'})
+        self.assertEqual(resp.data['results'][0]['items'][0]['product']['nutritional_info'], {'fat_100g': 2})
+
+
+class FastReadPathTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.admin = User.objects.create_user(username='admin', password='pass')
+        UserProfile.objects.create(user=self.admin, role='admin')
+        self.client.force_authenticate(self.admin)
+        customer = Customer.objects.create(first_name='Zoë', last_name='Lovelace')
+        for i in range(4):
+            product = Product.objects.create(
+                name=f'Crème {i}', price=f'{i}.5', barcode=f'B{i}', nutrition_score='B' if i % 2 else '',
+                nutritional_info={'fat_100g': 0.1 * i, 'note': 'löw ✓'} if i else None,
+            )
+            invoice = Invoice.objects.create(customer=customer, total=f'{i}.25', status='pending')
+            InvoiceItem.objects.create(invoice=invoice, product=product, quantity=i + 1, price=product.price)
+            InvoiceItem.objects.create(invoice=invoice, product=None, quantity=1, price='1.00')
+
+    def assertSameBytes(self, url, params):
+        cache.clear()
+        slow = self.client.get(url, params)
+        cache.clear()
+        with self.settings(FAST_READ_ENDPOINTS={'products', 'invoices'}):
+            fast = self.client.get(url, params)
+        self.assertEqual(slow.status_code, 200)
+        self.assertEqual(slow.content, fast.content)
+
+    def test_fast_path_is_byte_identical(self):
+        for params in ({}, {'page_size': 2}, {'fields': 'id,name,price'}, {'search': 'crème', 'nutrition_score': 'B'}):
+            self.assertSameBytes('/api/products/', params)
+        for params in ({}, {'page_size': 3}, {'fields': 'id,total,items'}, {'expand': 'product'}):
+            self.assertSameBytes('/api/invoices/', params)
+
+    def test_fast_path_skips_serializers(self):
+        with self.settings(FAST_READ_ENDPOINTS={'invoices'}):
+            with self.assertNumQueries(3):  # profile, invoices joined to customers, items joined to products
+                self.client.get('/api/invoices/')
+
+
+class RoleResolutionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='ada', password='pass')
+        self.profile = UserProfile.objects.create(user=self.user, role='customer')
+        customer = Customer.objects.create(user=self.user, first_name='Ada', last_name='Lovelace')
+        Invoice.objects.create(customer=customer, total='1.00')
+        Invoice.objects.create(customer=Customer.objects.create(first_name='Bob', last_name='B'), total='2.00')
+
+    def test_token_role_claim_needs_no_profile_query(self):
+        access = self.client.post('/api/token/', {'username': 'ada', 'password': 'pass'}, format='json').data['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        with self.settings(FAST_READ_ENDPOINTS={'invoices'}):
+            with self.assertNumQueries(3):  # user, invoices joined to customers, items
+                resp = self.client.get('/api/invoices/')
+        self.assertEqual([invoice['total'] for invoice in resp.data['results']], ['1.00'])
+
+        # the stateless authentication skips the user row as well
+        with mock.patch.object(InvoiceViewSet, 'authentication_classes', [JWTStatelessUserAuthentication]):
+            with self.settings(FAST_READ_ENDPOINTS={'invoices'}), self.assertNumQueries(2):
+                resp = self.client.get('/api/invoices/')
+        self.assertEqual(len(resp.data['results']), 1)
+
+    def test_refresh_rereads_role_and_customer(self):
+        refresh = self.client.post('/api/token/', {'username': 'ada', 'password': 'pass'}, format='json').data['refresh']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.role = 'admin'
+            self.profile.save()
+            Customer.objects.filter(user=self.user).update(user=None)
+        resp = self.client.post('/api/token/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(resp.status_code, 200)
+        access = AccessToken(resp.data['access'])
+        self.assertEqual((access['role'], access['customer_id'], access['username']), ('admin', 0, 'ada'))
+
+        self.user.delete()
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': refresh}, format='json').status_code, 401)
+
+    def test_claims_user_loads_the_row_on_demand(self):
+        token = AccessToken.for_user(self.user)
+        token['role'] = 'customer'
+        user = ClaimsUser(token)
+        with self.assertNumQueries(0):
+            self.assertEqual((user.id, user.pk, user.role, user.is_authenticated), (self.user.id, self.user.id, 'customer', True))
+        with self.assertNumQueries(1):
+            self.assertEqual((user.user, user.email, user.date_joined), (self.user, self.user.email, self.user.date_joined))
+
+    def test_login_reads_role_with_the_user(self):
+        admin = User.objects.create_user(username='root', password='pass')
+        UserProfile.objects.create(user=admin, role='admin')
+        with self.assertNumQueries(1):
+            resp = self.client.post('/api/token/', {'username': 'root', 'password': 'pass'}, format='json')
+        self.assertEqual((resp.data['role'], resp.data['username']), ('admin', 'root'))
+        self.assertEqual(AccessToken(resp.data['access'])['role'], 'admin')
+
+        User.objects.create_user(username='nobody', password='pass')
+        resp = self.client.post('/api/token/', {'username': 'nobody', 'password': 'pass'}, format='json')
+        self.assertEqual(resp.data['role'], 'customer')
+        # the claim agrees with the profile lookup: a user without a profile has no role
+        self.assertEqual(AccessToken(resp.data['access'])['role'], NO_PROFILE)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {resp.data["access"]}')
+        self.assertEqual(self.client.get('/api/invoices/').data['results'], [])
+        self.client.credentials()
+        self.assertEqual(self.client.post('/api/token/', {'username': 'root', 'password': 'nope'}, format='json').status_code, 401)
+
+        out = StringIO()
+        with self.settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']):
+            call_command('benchmark_login', '--logins', '2', stdout=out)
+        self.assertIn(' 1 queries per login', out.getvalue())
+        self.assertFalse(User.objects.filter(username__startswith='benchmark-').exists())
+
+    def test_hasher_cost_comes_from_settings(self):
+        fast = ['api.hashers.TunedScryptPasswordHasher', 'api.hashers.TunedPBKDF2PasswordHasher']
+        with self.settings(PASSWORD_HASHERS=fast, SCRYPT_WORK_FACTOR=2 ** 10, PBKDF2_ITERATIONS=1000):
+            self.assertTrue(make_password('secret').startswith('scrypt$1024$'))
+            old = TunedPBKDF2PasswordHasher().encode('secret', 'salt')
+            self.assertTrue(old.startswith('pbkdf2_sha256$1000$'))
+            # an old hash still verifies and is upgraded to the preferred hasher
+            self.assertTrue(check_password('secret', old, setter=lambda raw: self.user.set_password(raw)))
+            self.assertTrue(self.user.password.startswith('scrypt$1024$'))
+
+    def test_login_is_refused_while_hashing_slots_are_taken(self):
+        slots = hashers._semaphore()
+        taken = 0
+        while slots.acquire(blocking=False):
+            taken += 1
+        try:
+            with self.settings(PASSWORD_HASH_WAIT=0):
+                resp = self.client.post('/api/token/', {'username': 'ada', 'password': 'pass'}, format='json')
+        finally:
+            for _ in range(taken):
+                slots.release()
+        self.assertEqual((resp.status_code, resp.data['detail']), (503, 'auth_busy'))
+        self.assertEqual(self.client.post('/api/token/', {'username': 'ada', 'password': 'pass'}, format='json').status_code, 200)
+
+    def test_fallback_is_cached_until_the_profile_changes(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(len(self.client.get('/api/invoices/').data['results']), 1)
+        with self.assertNumQueries(2):  # invoices, items
+            self.client.get('/api/invoices/')
+        self.assertEqual(self.client.get('/api/stats/').status_code, 403)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.role = 'admin'
+            self.profile.save()
+        self.assertEqual(len(self.client.get('/api/invoices/').data['results']), 2)
+        self.assertEqual(self.client.get('/api/stats/').status_code, 200)
+
+
+class RegistrationTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        hashers = self.settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+        hashers.enable()
+        self.addCleanup(hashers.disable)
+
+    def register(self, **data):
+        return self.client.post('/api/register/', {'password': 'pass', **data}, format='json')
+
+    def test_registration_creates_user_profile_and_customer(self):
+        # an admin-created customer whose id the new user will get stays unlinked
+        stranger = Customer.objects.create(first_name='Bob', last_name='B')
+        Invoice.objects.create(customer=stranger, total='1.00')
+        with self.assertNumQueries(5):  # savepoint, user, profile, customer, release
+            resp = self.register(username='ada', email='ada@example.com', first_name='Ada', last_name='Lovelace')
+        self.assertEqual(resp.status_code, 201)
+        user = User.objects.select_related('profile', 'customer').get(username='ada')
+        self.assertEqual(user.profile.role, 'customer')
+        self.assertTrue(user.check_password('pass'))
+        self.assertEqual(user.customer.last_name, 'Lovelace')
+        self.assertNotEqual(user.customer.id, stranger.id)
+
+        access = self.client.post('/api/token/', {'username': 'ada', 'password': 'pass'}, format='json').data['access']
+        self.assertEqual(AccessToken(access)['customer_id'], user.customer.id)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(self.client.get('/api/invoices/').data['results'], [])
+
+    def test_duplicates_map_to_the_existing_messages(self):
+        self.register(username='ada', email='ada@example.com')
+        self.assertEqual(self.register(username='ada', email='other@example.com').data, {'error': 'Username already exists'})
+        self.assertEqual(self.register(username='bob', email='ada@example.com').data, {'error': 'Email already exists'})
+        self.assertEqual(self.register(username='bob').status_code, 400)
+        self.assertEqual(User.objects.count(), 1)
+        self.assertEqual(Customer.objects.count(), 1)
+
+
+class ConditionalRequestTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='ada', password='pass')
+        self.client.force_authenticate(self.user)
+        self.product = Product.objects.create(name='Milk', price='2.00', barcode='1')
+
+    def test_list_etag_round_trip(self):
+        resp = self.client.get('/api/products/')
+        etag = resp['ETag']
+
+        with self.assertNumQueries(0):
+            resp = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp['ETag'], etag)
+
+        # a different filter is a different representation
+        self.assertEqual(self.client.get('/api/products/?category=Dairy', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = '2.50'
+            self.product.save()
+        resp = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp['ETag'], etag)
+
+    def test_retrieve_etag(self):
+        url = f'/api/products/{self.product.id}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.patch(url, {'quantity': 3}, format='json')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get('/api/products/999/').status_code, 404)
+
+
+class CatalogCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='ada', password='pass')
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product = Product.objects.create(name='Milk', price='2.00', quantity=5, barcode='1')
+
+    def test_cached_until_catalog_changes(self):
+        first = self.client.get('/api/products/')
+        with self.assertNumQueries(0):
+            cached = self.client.get('/api/products/')
+        self.assertEqual(first.content, cached.content)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.patch(f'/api/products/{self.product.id}/', {'name': 'Oat Milk'}, format='json')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.client.get('/api/products/').data['results'][0]['name'], 'Oat Milk')
+
+    def test_checkout_invalidates_stock_levels(self):
+        self.client.get(f'/api/products/{self.product.id}/')
+        customer = Customer.objects.create(first_name='Ada', last_name='Lovelace')
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(customer, [(self.product.id, 2)])
+        self.assertEqual(self.client.get(f'/api/products/{self.product.id}/').data['quantity'], 3)
+
+
+class StubOpenFoodFacts(BaseHTTPRequestHandler):
+    """Answers searches with one product named after the query; 'flaky' fails once, 'down' always"""
+    calls = []
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.startswith('/api/v2/product/'):
+            code = url.path.rsplit('/', 1)[1].removesuffix('.json')
+            self.calls.append(code)
+            if code != '123':
+                return self.reply(404, {'status': 0})
+            return self.reply(200, {'status': 1, 'product': {'code': code, 'product_name': 'Butter'}})
+
+        terms = parse_qs(url.query)['search_terms'][0]
+        self.calls.append(terms)
+        if terms == 'down' or (terms == 'flaky' and self.calls.count('flaky') == 1):
+            self.send_response(503)
+            self.send_header('Retry-After', '0')
+            self.end_headers()
+            return
+        self.reply(200, {'products': [{'product_name': terms, 'nutriments': {'fat_100g': 1}}]})
+
+    def reply(self, status, document):
+        body = json.dumps(document).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_openfoodfacts(test):
+    StubOpenFoodFacts.calls = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubOpenFoodFacts)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    test.addCleanup(server.server_close)
+    test.addCleanup(server.shutdown)
+    return f'http://127.0.0.1:{server.server_port}'
+
+
+class OpenFoodFactsClientTest(TestCase):
+    def setUp(self):
+        self.base_url = start_stub_openfoodfacts(self)
+        self.client = OpenFoodFactsClient(base_url=self.base_url, rate=0, concurrency=4, retries=2)
+
+    def test_search_many_keeps_order_and_retries(self):
+        queries = ['milk', 'flaky', 'bread', 'down']
+        results = list(self.client.search_many(queries))
+        self.assertEqual([query for query, _, _ in results], queries)
+        self.assertEqual(results[0][1][0]['product_name'], 'milk')
+        self.assertEqual(results[1][1][0]['product_name'], 'flaky')
+        self.assertIsInstance(results[3][2], OpenFoodFactsError)
+        self.assertEqual(StubOpenFoodFacts.calls.count('flaky'), 2)
+        self.assertEqual(StubOpenFoodFacts.calls.count('down'), 3)
+
+    def test_unexpected_failures_surface_as_openfoodfacts_errors(self):
+        with mock.patch.object(self.client.session, 'get', side_effect=requests.TooManyRedirects('loop')):
+            with self.assertRaises(OpenFoodFactsError):
+                self.client.search('milk')
+        with mock.patch.object(self.client, 'get', return_value=['not', 'a', 'document']):
+            [(_, product, error)] = list(self.client.product_many(['123']))
+        self.assertIsNone(product)
+        self.assertIsInstance(error, OpenFoodFactsError)
+        self.assertIsInstance(error.__cause__, AttributeError)
+
+    def test_token_bucket_paces_requests(self):
+        client = OpenFoodFactsClient(base_url=self.base_url, rate=20, burst=1)
+        started = time.monotonic()
+        list(client.search_many(['a', 'b', 'c', 'd', 'e']))
+        # one token up front, then four more at 20/s
+        self.assertGreaterEqual(time.monotonic() - started, 0.19)
+
+    def test_cache_answers_repeat_lookups(self):
+        client = OpenFoodFactsClient(
+            base_url=self.base_url, rate=0, retries=0, cache=ResponseCache(ttl=3600, stale_ttl=3600, max_entries=100),
+        )
+        list(client.search_many(['Butter', ' butter', 'milk', 'down']))
+        self.assertEqual(client.product('123')['product_name'], 'Butter')
+        self.assertIsNone(client.product('999'))
+        self.assertEqual(sorted(StubOpenFoodFacts.calls), ['123', '999', 'butter', 'down', 'milk'])
+
+        # errors are not cached, misses (404) are
+        results = list(client.search_many(['BUTTER', 'milk', 'down']))
+        self.assertEqual(results[0][1][0]['product_name'], 'butter')
+        self.assertIsNone(client.product('999'))
+        self.assertEqual(StubOpenFoodFacts.calls.count('down'), 2)
+        self.assertEqual(len(StubOpenFoodFacts.calls), 6)
+        self.assertEqual(OpenFoodFactsCacheEntry.objects.get(query='butter').hits, 1)
+        self.assertEqual(client.stats['hits'], 3)
+
+    def test_cache_evicts_least_recently_used(self):
+        cache = ResponseCache(ttl=3600, stale_ttl=3600, max_entries=2)
+        client = OpenFoodFactsClient(base_url=self.base_url, rate=0, cache=cache)
+        list(client.search_many(['a', 'b']))
+        list(client.search_many(['a']))
+        list(client.search_many(['c']))
+        self.assertEqual(sorted(OpenFoodFactsCacheEntry.objects.values_list('query', flat=True)), ['a', 'c'])
+
+    def test_cache_culls_once_per_batch_of_writes(self):
+        cache = ResponseCache(ttl=3600, stale_ttl=3600, max_entries=2, cull_every=3)
+        client = OpenFoodFactsClient(base_url=self.base_url, rate=0, cache=cache)
+        with mock.patch.object(cache, 'cull', wraps=cache.cull) as cull:
+            list(client.search_many(['a', 'b']))
+            cull.assert_not_called()
+            list(client.search_many(['c']))
+            cull.assert_called_once()
+        self.assertEqual(OpenFoodFactsCacheEntry.objects.count(), 2)
+
+
+class OpenFoodFactsRevalidationTest(TransactionTestCase):
+    def test_stale_entry_is_served_then_refreshed(self):
+        base_url = start_stub_openfoodfacts(self)
+        client = OpenFoodFactsClient(base_url=base_url, rate=0, cache=ResponseCache(ttl=60, stale_ttl=3600, max_entries=100))
+        client.search('milk')
+        entry = OpenFoodFactsCacheEntry.objects.get()
+        entry.payload = {'products': [{'product_name': 'old milk'}]}
+        entry.fetched_at = timezone.now() - timedelta(minutes=5)
+        entry.save()
+
+        self.assertEqual(client.search('milk')[0]['product_name'], 'old milk')
+        pool = client.pool
+        client.wait()
+        # only this caller's work is waited for; the shared pool stays up
+        self.assertIs(client.pool, pool)
+        entry.refresh_from_db()
+        self.assertEqual(entry.payload['products'][0]['product_name'], 'milk')
+        self.assertEqual(StubOpenFoodFacts.calls, ['milk', 'milk'])
+        self.assertEqual(client.stats['stale'], 1)
+
+
+class OpenFoodFactsDumpImportTest(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+    def write_dump(self, name, lines):
+        path = os.path.join(self.dir.name, name)
+        with gzip.open(path, 'wt') as f:
+            f.write(''.join(line + '\n' for line in lines))
+        return path
+
+    def import_dump(self, *args):
+        call_command('import_openfoodfacts_dump', *args, stdout=StringIO())
+
+    def test_jsonl_import_resumes_from_checkpoint(self):
+        Product.objects.create(name='Existing', price='1.00', barcode='1')
+        rows = [json.dumps({
+            'code': str(code), 'product_name': f'Product {code}', 'brands': 'Acme', 'categories': 'Dairy, Milks',
+            'nutriscore_grade': 'b', 'nutriments': {'energy-kcal_100g': 42, 'fat_100g': '1.5'},
+        }) for code in range(1, 6)]
+        rows[2:2] = ['{not json', json.dumps({'code': '99', 'product_name': ''})]
+        path = self.write_dump('products.jsonl.gz', rows)
+        checkpoint = os.path.join(self.dir.name, 'offset')
+
+        # the third parsed row is the nameless one
+        self.import_dump(path, '--batch-size', '2', '--limit', '3', '--checkpoint', checkpoint)
+        self.assertEqual(Product.objects.count(), 2)
+        self.import_dump(path, '--batch-size', '2', '--checkpoint', checkpoint)
+
+        self.assertEqual(sorted(Product.objects.values_list('barcode', flat=True)), ['1', '2', '3', '4', '5'])
+        existing = Product.objects.get(barcode='1')
+        self.assertEqual((existing.name, existing.price), ('Product 1', Decimal('1.00')))
+        product = Product.objects.get(barcode='4')
+        self.assertEqual((product.category, product.nutrition_score), ('Dairy', 'B'))
+        self.assertEqual(product.nutritional_info['energy_kcal_100g'], 42)
+        self.assertEqual(product.nutritional_info['fat_100g'], 1.5)
+        with open(checkpoint) as f:
+            self.assertEqual(int(f.read()), sum(len(row) + 1 for row in rows))
+
+    def test_csv_import(self):
+        path = self.write_dump('products.csv.gz', [
+            'code\tproduct_name\tbrands\tnutriscore_grade\tproteins_100g\tsodium_100g\tfat_100g',
+            '10\tOat Milk\tOatly\ta\t1.0\t0.4\t',
+            '11\tshort row',
+        ])
+        self.import_dump(path)
+        product = Product.objects.get()
+        self.assertEqual((product.name, product.brand, product.nutrition_score), ('Oat Milk', 'Oatly', 'A'))
+        self.assertEqual(product.nutritional_info['proteins_100g'], 1.0)
+        # missing nutrients stay unknown instead of 0, so salt still comes from sodium
+        self.assertNotIn('fat_100g', product.nutritional_info)
+        self.assertEqual((product.fat_100g, product.salt_100g), (None, 1.0))
+
+
+class NutritionColumnsTest(TestCase):
+    def test_canonicalizes_every_importer_shape(self):
+        seed = canonical_nutrients({'energy': 52, 'protein': 0.3, 'sugar': 10.4, 'salt': 0.002})
+        self.assertEqual((seed['energy_kcal_100g'], seed['proteins_100g'], seed['sugars_100g']), (52, 0.3, 10.4))
+        self.assertIsNone(seed['fiber_100g'])
+        self.assertEqual(canonical_nutrients({'energy_kcal': 120, 'protein_g': '8.5'})['proteins_100g'], 8.5)
+        # nested nutriments: bare 'energy' is kJ, salt falls back to sodium
+        nested = canonical_nutrients({'nutriments': {'energy': 1046, 'energy-kj_100g': 1046, 'proteins_100g': 25, 'sodium_100g': 0.4}})
+        self.assertEqual((nested['energy_kcal_100g'], nested['proteins_100g'], nested['salt_100g']), (250.0, 25, 1.0))
+        self.assertEqual(canonical_nutrients({'fat': 'n/a', 'sugars_100g': -1}), dict.fromkeys(nested, None))
+        self.assertEqual(canonical_nutrients(None)['fat_100g'], None)
+
+    def test_imported_nutrients_leave_missing_values_out(self):
+        info = imported_nutrients({'energy-kj_100g': 1046, 'proteins_100g': '25', 'fat_100g': '', 'sodium_100g': 0.4})
+        self.assertEqual(info, {'energy_kj_100g': 1046, 'proteins_100g': 25, 'sodium_100g': 0.4})
+        # so the kJ and sodium fallbacks fill the columns
+        values = canonical_nutrients(info)
+        self.assertEqual((values['energy_kcal_100g'], values['salt_100g'], values['fat_100g']), (250.0, 1.0, None))
+
+    def test_columns_follow_every_write_path(self):
+        milk = Product.objects.create(name='Milk', price='1.00', barcode='1', nutritional_info={'protein': 3.4, 'sugar': 4.8})
+        self.assertEqual((milk.proteins_100g, milk.sugars_100g), (3.4, 4.8))
+        milk.nutritional_info = {'proteins_100g': 30}
+        milk.save(update_fields=['nutritional_info'])
+        milk.refresh_from_db()
+        self.assertEqual((milk.proteins_100g, milk.sugars_100g), (30, None))
+
+        with ProductWriter() as writer:
+            writer.add(Product(barcode='2', name='Whey', price='9.00', nutritional_info={'proteins_100g': 80, 'sugars_100g': 3}))
+            writer.add(Product(barcode='3', name='Candy', price='1.00', nutritional_info={'proteins_100g': 21, 'sugars_100g': 60}))
+        high_protein_low_sugar = Product.objects.filter(proteins_100g__gt=20, sugars_100g__lt=5)
+        self.assertEqual(sorted(high_protein_low_sugar.values_list('name', flat=True)), ['Whey'])
+
+
+class ProductWriterTest(TestCase):
+    def product(self, barcode, name, price='2.00'):
+        return Product(barcode=barcode, name=name, price=price, quantity=50, nutritional_info={'fat_100g': 1})
+
+    def test_upserts_by_barcode(self):
+        with ProductWriter() as seed:
+            seed.add(self.product('1', 'Milk', price='3.00'))
+            seed.add(self.product('2', 'Bread', price='1.00'))
+        Product.objects.filter(barcode='2').update(quantity=4)
+
+        writer = ProductWriter(batch_size=10)
+        for product in [self.product('1', 'Milk'), self.product('2', 'Rye Bread'), self.product('3', 'Eggs')]:
+            writer.add(product)
+        # one lookup, one upsert; the transaction adds a savepoint pair under TestCase
+        with self.assertNumQueries(4):
+            writer.flush()
+
+        self.assertEqual(dict(writer.counts), {'inserted': 1, 'updated': 1, 'unchanged': 1})
+        bread = Product.objects.get(barcode='2')
+        # catalog fields are refreshed, price and stock are kept
+        self.assertEqual((bread.name, bread.price, bread.quantity), ('Rye Bread', Decimal('1.00'), 4))
+        self.assertEqual(Product.objects.get(barcode='3').quantity, 50)
+
+        with ProductWriter() as again:
+            again.add(self.product('2', 'Rye Bread'))
+            again.add(self.product('3', 'Eggs'))
+        self.assertEqual(again.summary(), '0 inserted, 0 updated, 2 unchanged')
+
+
+class CatalogSyncTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='ada', password='pass'))
+
+    def sync(self, *names, source='feed'):
+        with self.captureOnCommitCallbacks(execute=True):
+            writer = ProductWriter(sync=True, source=source)
+            for name in names:
+                writer.add(Product(barcode=name.lower(), name=name, price='2.00', quantity=10))
+            writer.retire_missing()
+        return writer
+
+    def test_sync_retires_instead_of_deleting(self):
+        # products added by hand or by another feed are not this sync's to retire
+        Product.objects.create(name='Cake', price='4.00', barcode='cake')
+        self.sync('Tea', source='other')
+        self.sync('Milk', 'Bread')
+        bread = Product.objects.get(barcode='bread')
+        customer = Customer.objects.create(first_name='Ada', last_name='Lovelace')
+        invoice = Invoice.objects.create(customer=customer, total='2.00')
+        InvoiceItem.objects.create(invoice=invoice, product=bread, quantity=1, price='2.00')
+
+        writer = self.sync('Milk', 'Eggs')
+        self.assertEqual(dict(writer.counts), {'inserted': 1, 'updated': 0, 'unchanged': 1, 'retired': 1})
+        bread.refresh_from_db()
+        self.assertIsNotNone(bread.retired_at)
+        # unchanged rows are stamped too, which is what keeps them live
+        self.assertEqual(Product.objects.get(barcode='milk').last_seen_at, writer.started)
+        self.assertEqual(invoice.items.get().product_id, bread.id)
+
+        listed = [p['name'] for p in self.client.get('/api/products/').data['results']]
+        self.assertEqual(sorted(listed), ['Cake', 'Eggs', 'Milk', 'Tea'])
+        self.assertEqual(self.client.get(f'/api/products/{bread.id}/').status_code, 200)
+        with self.assertRaises(ValidationError):
+            place_order(customer, [(bread.id, 1)])
+
+        # a product that comes back is un-retired
+        writer = self.sync('Milk', 'Eggs', 'Bread')
+        self.assertEqual(writer.counts['updated'], 1)
+        bread.refresh_from_db()
+        self.assertIsNone(bread.retired_at)
+
+
+class BackfillNutritionTest(TestCase):
+    def setUp(self):
+        base_url = start_stub_openfoodfacts(self)
+        overrides = self.settings(
+            OPENFOODFACTS_BASE_URL=base_url, OPENFOODFACTS_RATE_LIMIT=0, OPENFOODFACTS_RETRIES=0,
+            OPENFOODFACTS_CACHE_MAX_ENTRIES=0,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.checkpoint = os.path.join(self.dir.name, 'checkpoint')
+
+    def backfill(self, *args):
+        call_command('backfill_nutrition', '--workers', '2', '--chunk-size', '2', '--checkpoint', self.checkpoint, *args, stdout=StringIO())
+
+    def test_backfill_resumes_from_checkpoint(self):
+        done = Product.objects.create(name='done', price='1.00', barcode='0', nutritional_info={'fat_100g': 2})
+        names = ['milk', 'down', 'bread', 'eggs']
+        products = [Product.objects.create(name=name, price='1.00', barcode=name, nutritional_info={}) for name in names]
+
+        self.backfill('--limit', '2')
+        with open(self.checkpoint) as f:
+            self.assertEqual(int(f.read()), products[1].id)
+        self.assertEqual(sorted(StubOpenFoodFacts.calls), ['down', 'milk'])
+
+        self.backfill()
+        self.assertEqual(sorted(StubOpenFoodFacts.calls[2:]), ['bread', 'eggs'])
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+        info = dict(Product.objects.values_list('name', 'nutritional_info'))
+        self.assertEqual(info['bread']['product_name'], 'bread')
+        self.assertEqual(info['down'], {})
+        self.assertEqual(info['done'], done.nutritional_info)
+
+
+class EnrichmentQueueTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='ada', password='pass'))
+        self.milk = Product.objects.create(name='Milk', price='1.00', barcode='123')
+        self.off = OpenFoodFactsClient(base_url=start_stub_openfoodfacts(self), rate=0, retries=0)
+
+    def test_enrich_returns_job_without_calling_upstream(self):
+        resp = self.client.post(f'/api/products/{self.milk.id}/enrich/', {'query': 'milk'}, format='json')
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(resp.data['status'], 'pending')
+        self.assertTrue(resp['Location'].endswith(f'/api/enrichment-jobs/{resp.data["id"]}/'))
+
+        again = self.client.post(f'/api/products/{self.milk.id}/enrich/', {'query': ' milk '}, format='json')
+        self.assertEqual(again.data['id'], resp.data['id'])
+        self.assertEqual(StubOpenFoodFacts.calls, [])
+
+        created = self.client.post('/api/products/', {'name': 'Bread', 'price': '2.00', 'barcode': '456', 'openfood_query': 'bread'}, format='json')
+        self.assertEqual(created.status_code, 201)
+        self.assertEqual(created.data['enrichment_job']['query'], 'bread')
+        job_url = f'/api/enrichment-jobs/{resp.data["id"]}/'
+        self.assertEqual(self.client.get(job_url).status_code, 403)
+        self.assertEqual(self.client.get('/api/enrichment-jobs/').status_code, 403)
+        admin = User.objects.create_user(username='admin', password='pass')
+        UserProfile.objects.create(user=admin, role='admin')
+        self.client.force_authenticate(admin)
+        self.assertEqual(self.client.get(job_url).data['status'], 'pending')
+
+    def test_enqueue_retries_when_the_conflicting_job_already_finished(self):
+        create = EnrichmentJob.objects.create
+        # the job that won the insert race was done before we looked for it again
+        raced = [IntegrityError('enrichment_job_active_unique'), None]
+
+        def create_after_race(**fields):
+            error = raced.pop(0)
+            if error:
+                raise error
+            return create(**fields)
+
+        with mock.patch.object(EnrichmentJob.objects, 'create', side_effect=create_after_race):
+            job, created = enrichment.enqueue(self.milk, 'milk')
+        self.assertTrue(created)
+        self.assertEqual((job.status, EnrichmentJob.objects.count()), ('pending', 1))
+
+    def test_worker_processes_retries_and_fails(self):
+        bread = Product.objects.create(name='Bread', price='1.00', barcode='456')
+        jobs = [
+            enrichment.enqueue(self.milk, 'milk')[0],
+            enrichment.enqueue(bread, 'milk')[0],
+            enrichment.enqueue(bread, 'down')[0],
+            enrichment.enqueue(self.milk)[0],  # by barcode
+        ]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(enrichment.run_once(client=self.off), 4)
+        # identical queries are fetched once
+        self.assertEqual(sorted(StubOpenFoodFacts.calls), ['123', 'down', 'milk'])
+        statuses = {job.id: (job.status, job.attempts) for job in EnrichmentJob.objects.all()}
+        self.assertEqual(statuses[jobs[0].id], ('succeeded', 1))
+        self.assertEqual(statuses[jobs[2].id], ('pending', 1))
+        self.assertEqual(statuses[jobs[3].id], ('succeeded', 1))
+        bread.refresh_from_db()
+        self.assertEqual(bread.nutritional_info['product_name'], 'milk')
+
+        # not due yet, then retried until it gives up
+        self.assertEqual(enrichment.run_once(client=self.off), 0)
+        EnrichmentJob.objects.filter(id=jobs[2].id).update(run_after=timezone.now())
+        with self.settings(ENRICHMENT_MAX_ATTEMPTS=2):
+            enrichment.run_once(client=self.off)
+        failed = EnrichmentJob.objects.get(id=jobs[2].id)
+        self.assertEqual((failed.status, failed.attempts), ('failed', 2))
+        self.assertIn('503', failed.last_error)
+
+    def test_enrich_batch_streams_results_and_writes_once(self):
+        self.assertEqual(self.client.post('/api/products/enrich-batch/', {'ids': [self.milk.id]}, format='json').status_code, 403)
+        admin = User.objects.create_user(username='admin', password='pass')
+        UserProfile.objects.create(user=admin, role='admin')
+        self.client.force_authenticate(admin)
+        bread = Product.objects.create(name='Bread', price='1.00', barcode='456', category='Bakery')
+        cake = Product.objects.create(name='Cake', price='1.00', barcode='789', category='Bakery')
+
+        payload = {'ids': [self.milk.id], 'items': [{'id': bread.id, 'query': 'milk'}, {'id': cake.id, 'query': 'down'}], 'category': 'Bakery'}
+        with mock.patch('api.enrichment.get_client', return_value=self.off), self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post('/api/products/enrich-batch/', payload, format='json')
+            lines = [json.loads(line) for line in b''.join(resp.streaming_content).splitlines()]
+        self.assertEqual(resp['Content-Type'], 'application/x-ndjson')
+        self.assertEqual({line['id']: line['status'] for line in lines[:-1]}, {self.milk.id: 'succeeded', bread.id: 'succeeded', cake.id: 'failed'})
+        self.assertEqual(lines[-1], {'summary': {'succeeded': 2, 'not_found': 0, 'failed': 1}})
+        # 'Milk' and 'milk' are one upstream search
+        self.assertEqual(sorted(StubOpenFoodFacts.calls), ['down', 'milk'])
+        bread.refresh_from_db()
+        self.assertEqual((bread.nutritional_info['product_name'], bread.fat_100g), ('milk', 1))
+
+        self.assertEqual(self.client.post('/api/products/enrich-batch/', {}, format='json').status_code, 400)
+        self.assertEqual(self.client.post('/api/products/enrich-batch/', {'ids': [999999]}, format='json').status_code, 400)
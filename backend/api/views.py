@@ -1,38 +1,34 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.views import APIView
-from .models import Product, Customer, Invoice, UserProfile
-from .serializers import ProductSerializer, CustomerSerializer, InvoiceSerializer, CustomTokenObtainPairSerializer, UserSerializer
-from rest_framework_simplejwt.views import TokenObtainPairView
-from django.contrib.auth.models import User
-import requests
-import jwt
-from django.conf import settings
+from . import enrichment
+from .accounts import DuplicateAccount, register_customer
+from .models import Product, Customer, EnrichmentJob, Invoice, InvoiceItem, SalesRollup
+from .caching import CachedResponseMixin, ConditionalGetMixin
+from .checkout import InsufficientStock, place_order
+from .fastpath import FastListMixin
+from .filters import filter_products, nutrient_ordering, search_products
+from .pagination import IdCursorPagination, ProductCursorPagination
+from .permissions import IsAdminRole
+from .roles import request_customer_id, request_role
+from .serializers import query_param_list, ProductSerializer, CustomerSerializer, EnrichmentJobSerializer, InvoiceSerializer, CheckoutSerializer, EnrichBatchSerializer, CustomTokenObtainPairSerializer, CustomTokenRefreshSerializer
+from .stats import dashboard_stats
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+import json
 
 class CustomTokenObtainPairView(TokenObtainPairView):
+    # The serializer adds role and username to the token pair
     serializer_class = CustomTokenObtainPairSerializer
-    
-    def post(self, request, *args, **kwargs):
-        response = super().post(request, *args, **kwargs)
-        
-        # Extract role from token payload
-        if response.status_code == 200 and 'access' in response.data:
-            try:
-                # Decode the access token to get the role
-                token = response.data['access']
-                decoded = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
-                role = decoded.get('role', 'customer')
-                username = decoded.get('username', '')
-                
-                # Add role to response
-                response.data['role'] = role
-                response.data['username'] = username
-            except Exception as e:
-                print(f'Error decoding token: {e}')
-                response.data['role'] = 'customer'
-        
-        return response
+
+class CustomTokenRefreshView(TokenRefreshView):
+    # Refreshed access tokens carry the user's current role and customer, not the login-time ones
+    serializer_class = CustomTokenRefreshSerializer
 
 class RegisterCustomerView(APIView):
     """Register a new customer user"""
@@ -50,30 +46,13 @@ class RegisterCustomerView(APIView):
                 'error': 'username, email, and password are required'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        if User.objects.filter(username=username).exists():
-            return Response({
-                'error': 'Username already exists'
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-        if User.objects.filter(email=email).exists():
+        try:
+            user = register_customer(username, email, password, first_name, last_name)
+        except DuplicateAccount as e:
             return Response({
-                'error': 'Email already exists'
+                'error': str(e)
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        user = User.objects.create_user(
-            username=username,
-            email=email,
-            password=password,
-            first_name=first_name,
-            last_name=last_name
-        )
-        
-        # Create profile with customer role
-        profile = UserProfile.objects.create(
-            user=user,
-            role='customer'
-        )
-        
         return Response({
             'id': user.id,
             'username': user.username,
@@ -82,17 +61,85 @@ class RegisterCustomerView(APIView):
             'message': 'Customer registered successfully'
         }, status=status.HTTP_201_CREATED)
 
-class ProductViewSet(viewsets.ModelViewSet):
+class DashboardStatsView(APIView):
+    """Aggregated KPIs for the admin dashboard"""
+    permission_classes = [IsAdminRole]
+
+    def get(self, request):
+        try:
+            threshold = int(request.query_params.get('low_stock', 10))
+        except ValueError:
+            return Response({'detail': 'low_stock must be an integer'}, status=400)
+        return Response(dashboard_stats(low_stock_threshold=threshold))
+
+class SalesRollupView(APIView):
+    """Sales series read from the pre-aggregated rollup table"""
+    permission_classes = [IsAdminRole]
+
+    def get(self, request):
+        period = request.query_params.get('period', 'month')
+        dimension = request.query_params.get('dimension', 'total')
+        if period not in dict(SalesRollup.PERIOD_CHOICES):
+            return Response({'detail': 'period must be day or month'}, status=400)
+        if dimension not in dict(SalesRollup.DIMENSION_CHOICES):
+            return Response({'detail': 'dimension must be total, product, category or customer'}, status=400)
+
+        rows = SalesRollup.objects.filter(period=period, dimension=dimension)
+        try:
+            if request.query_params.get('start'):
+                rows = rows.filter(period_start__gte=request.query_params['start'])
+            if request.query_params.get('end'):
+                rows = rows.filter(period_start__lte=request.query_params['end'])
+            if request.query_params.get('key'):
+                rows = rows.filter(key=request.query_params['key'])
+            results = list(rows.values('period_start', 'key', 'revenue', 'units', 'invoice_count'))
+        except ValidationError:
+            return Response({'detail': 'start and end must be YYYY-MM-DD dates'}, status=400)
+
+        for row in results:
+            row['revenue'] = str(row['revenue'])
+        return Response({'period': period, 'dimension': dimension, 'results': results})
+
+PRODUCT_COLUMNS = {f.attname for f in Product._meta.concrete_fields}
+
+class ProductViewSet(ConditionalGetMixin, CachedResponseMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    pagination_class = ProductCursorPagination
+    fast_read_name = 'products'
+    cache_prefix = 'products'
+    use_catalog_version = True
     
     def get_permissions(self):
         if self.action == 'list' or self.action == 'retrieve':
             permission_classes = [permissions.IsAuthenticated]
+        elif self.action == 'enrich_batch':
+            permission_classes = [IsAdminRole]
         else:
             permission_classes = [permissions.IsAuthenticated]
         return [permission() for permission in permission_classes]
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'search'):
+            # Retired products stay reachable by id for old invoices but leave the catalog
+            queryset = queryset.filter(retired_at__isnull=True)
+        if self.action == 'list':
+            queryset = filter_products(queryset, self.request.query_params)
+        fields = query_param_list(self.request, 'fields') & PRODUCT_COLUMNS
+        if fields:
+            # Skip unrequested columns (notably nutritional_info); keep the cursor ordering columns
+            ordering = nutrient_ordering(self.request.query_params) or ()
+            queryset = queryset.only('id', 'created_at', *fields, *(column.lstrip('-') for column in ordering))
+        return queryset
+
+    def create(self, request, *args, **kwargs):
+        self.enrichment_job = None
+        response = super().create(request, *args, **kwargs)
+        if self.enrichment_job is not None:
+            response.data['enrichment_job'] = EnrichmentJobSerializer(self.enrichment_job).data
+        return response
+
     def perform_create(self, serializer):
         product = serializer.save()
         query = None
@@ -102,68 +149,146 @@ class ProductViewSet(viewsets.ModelViewSet):
             query = None
 
         if query:
-            of = self._fetch_openfoodfacts_first(query)
-            if of:
-                product.nutritional_info = of
-                product.save()
+            # Looked up by the enrichment worker; the job is returned with the product
+            self.enrichment_job, _ = enrichment.enqueue(product, query)
 
         return product
 
-    def _fetch_openfoodfacts_first(self, query):
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Ranked full-text and typo-tolerant product search"""
+        query = (request.query_params.get('q') or '').strip()
+        if not query:
+            return Response({'detail': 'q is required'}, status=400)
         try:
-            resp = requests.get('https://world.openfoodfacts.org/cgi/search.pl', params={
-                'search_terms': query,
-                'search_simple': 1,
-                'json': 1,
-                'page_size': 1
-            }, timeout=10)
-            resp.raise_for_status()
-            data = resp.json()
-            products = data.get('products') or []
-            if not products:
-                return None
-            p = products[0]
-            return {'nutriments': p.get('nutriments', {}), 'serving_size': p.get('serving_size'), 'product_name': p.get('product_name')}
-        except Exception as e:
-            print('OpenFoodFacts fetch error:', e)
-            return None
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+        except ValueError:
+            return Response({'detail': 'limit must be an integer'}, status=400)
+
+        products = search_products(self.get_queryset(), query)[:limit]
+        serializer = self.get_serializer(products, many=True)
+        return Response({'results': serializer.data})
+
+    @action(detail=False, methods=['get'])
+    def categories(self, request):
+        """Distinct categories of the live catalog, the values ?category= matches"""
+        def render():
+            live = Product.objects.filter(retired_at__isnull=True).exclude(category='')
+            return Response(list(live.order_by('category').values_list('category', flat=True).distinct()))
+        return self._cached(request, render)
 
     @action(detail=True, methods=['post'])
     def enrich(self, request, pk=None):
+        """Queue an OpenFoodFacts lookup and answer with the job"""
         product = self.get_object()
         query = request.data.get('query') or request.data.get('openfood_query')
-        if not query:
+        # Without a query the worker looks the product up by its own barcode
+        if not query and not product.barcode:
             return Response({'detail': 'query is required'}, status=400)
-        
-        of = self._fetch_openfoodfacts_first(query)
-        if not of:
-            return Response({'detail': 'no_openfoodfacts_result'}, status=404)
-        
-        product.nutritional_info = of
-        product.save(update_fields=['nutritional_info'])
-        return Response({'detail': 'enriched', 'nutritional_info': of})
+
+        job, _ = enrichment.enqueue(product, query)
+        location = reverse('enrichment-job-detail', args=[job.id], request=request)
+        return Response(EnrichmentJobSerializer(job).data, status=status.HTTP_202_ACCEPTED, headers={'Location': location})
+
+    @action(detail=False, methods=['post'], url_path='enrich-batch')
+    def enrich_batch(self, request):
+        """Enrich many products now, streaming one NDJSON line per product in request order"""
+        serializer = EnrichBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        # Explicit queries win; otherwise search by name like the backfill does
+        queries = {item['id']: (item.get('query') or '').strip() for item in data.get('items', [])}
+        for product_id in data.get('ids', []):
+            queries.setdefault(product_id, '')
+        live = Product.objects.filter(retired_at__isnull=True)
+        products = dict(live.filter(id__in=queries).values_list('id', 'name'))
+        if data.get('category'):
+            limit = EnrichBatchSerializer.MAX_PRODUCTS - len(products)
+            in_category = live.filter(category=data['category']).exclude(id__in=products).order_by('id')
+            for product_id, name in in_category.values_list('id', 'name')[:max(limit, 0)]:
+                products[product_id] = name
+                queries.setdefault(product_id, '')
+        missing = sorted(set(queries) - set(products))
+        if missing:
+            return Response({'detail': f'Unknown products: {missing}'}, status=400)
+
+        targets = [(product_id, queries[product_id] or products[product_id]) for product_id in products]
+        lines = (json.dumps(item) + '\n' for item in enrichment.enrich_now(targets))
+        return StreamingHttpResponse(lines, content_type='application/x-ndjson')
+
+class EnrichmentJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Status of queued product enrichment jobs"""
+    queryset = EnrichmentJob.objects.all()
+    serializer_class = EnrichmentJobSerializer
+    # Jobs span the whole catalog, so only admins may list or read them
+    permission_classes = [IsAdminRole]
 
 class CustomerViewSet(viewsets.ModelViewSet):
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = IdCursorPagination
 
-class InvoiceViewSet(viewsets.ModelViewSet):
+class InvoiceViewSet(FastListMixin, viewsets.ModelViewSet):
     serializer_class = InvoiceSerializer
     permission_classes = [permissions.IsAuthenticated]
+    fast_read_name = 'invoices'
     
     def get_queryset(self):
-        user = self.request.user
+        role = request_role(self.request)
+        # Admin sees all invoices
+        if role == 'admin':
+            return self._with_items(Invoice.objects.all())
+        # Customer sees only their invoices
+        if role == 'customer':
+            return self._with_items(Invoice.objects.filter(customer_id=request_customer_id(self.request)))
+        return Invoice.objects.none()
+
+    # One transaction per write, so the rollup snapshot taken before it can lock the invoice
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            serializer.save()
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            serializer.save()
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+
+    def _with_items(self, queryset):
+        queryset = queryset.select_related('customer')
+        if 'product' in query_param_list(self.request, 'expand'):
+            products = Product.objects.all()
+        else:
+            # Slim line items only need the product name
+            products = Product.objects.only('id', 'name')
+        return queryset.prefetch_related(
+            Prefetch('items', queryset=InvoiceItem.objects.order_by('pk')),
+            Prefetch('items__product', queryset=products),
+        )
+
+    @action(detail=False, methods=['post'])
+    def checkout(self, request):
+        """Turn a cart into a completed invoice and decrement stock atomically"""
+        serializer = CheckoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        if request_role(request) == 'admin':
+            customer = serializer.validated_data.get('customer')
+            if customer is None:
+                return Response({'customer': ['This field is required.']}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            customer = Customer.objects.filter(id=request_customer_id(request)).first()
+            if customer is None:
+                return Response({'detail': 'no_customer_record'}, status=status.HTTP_400_BAD_REQUEST)
+
+        lines = [(item['product_id'], item['quantity']) for item in serializer.validated_data['items']]
         try:
-            profile = UserProfile.objects.get(user=user)
-            # Admin sees all invoices
-            if profile.role == 'admin':
-                return Invoice.objects.all().prefetch_related('items', 'items__product')
-            # Customer sees only their invoices
-            else:
-                customer = Customer.objects.filter(id=profile.user.id).first()
-                if customer:
-                    return Invoice.objects.filter(customer=customer).prefetch_related('items', 'items__product')
-                return Invoice.objects.none()
-        except UserProfile.DoesNotExist:
-            return Invoice.objects.none()
+            invoice = place_order(customer, lines)
+        except InsufficientStock as e:
+            return Response({'detail': 'insufficient_stock', 'items': e.items}, status=status.HTTP_409_CONFLICT)
+        invoice = self._with_items(Invoice.objects.filter(pk=invoice.pk)).get()
+        return Response(self.get_serializer(invoice).data, status=status.HTTP_201_CREATED)
@@ -20,6 +20,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'corsheaders',
     'drf_spectacular',
@@ -76,23 +77,104 @@ DATABASES = {
     }
 }
 
+# Redis in production (REDIS_URL, e.g. redis://redis:6379/0), per-process memory otherwise
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
+    }
+
+# Seconds a cached catalog response lives; writes invalidate earlier via the catalog version
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', '300'))
+# Seconds a user's role is cached for requests without a role claim; profile writes invalidate it
+ROLE_CACHE_TIMEOUT = int(os.getenv('ROLE_CACHE_TIMEOUT', '600'))
+
 AUTH_PASSWORD_VALIDATORS = []
 
+# Fetches the profile with the user so that login reads the role without a second query
+AUTHENTICATION_BACKENDS = ['api.authentication.ProfileModelBackend']
+
+# Hasher for new passwords (api.hashers): pbkdf2, scrypt (memory-hard) or argon2 (memory-hard, pip install argon2-cffi).
+# Costs of 0 keep Django's defaults; passwords are rehashed with the current hasher and cost at the next login.
+PASSWORD_HASHER = os.getenv('PASSWORD_HASHER', 'pbkdf2')
+PBKDF2_ITERATIONS = int(os.getenv('PBKDF2_ITERATIONS', '0'))
+SCRYPT_WORK_FACTOR = int(os.getenv('SCRYPT_WORK_FACTOR', '0'))  # power of two
+SCRYPT_BLOCK_SIZE = int(os.getenv('SCRYPT_BLOCK_SIZE', '0'))
+SCRYPT_PARALLELISM = int(os.getenv('SCRYPT_PARALLELISM', '0'))
+ARGON2_TIME_COST = int(os.getenv('ARGON2_TIME_COST', '0'))
+ARGON2_MEMORY_COST = int(os.getenv('ARGON2_MEMORY_COST', '0'))  # KiB
+ARGON2_PARALLELISM = int(os.getenv('ARGON2_PARALLELISM', '0'))
+_PASSWORD_HASHERS = {
+    'pbkdf2': 'api.hashers.TunedPBKDF2PasswordHasher',
+    'scrypt': 'api.hashers.TunedScryptPasswordHasher',
+    'argon2': 'api.hashers.TunedArgon2PasswordHasher',
+}
+PASSWORD_HASHERS = [
+    _PASSWORD_HASHERS[PASSWORD_HASHER],
+    *(hasher for name, hasher in _PASSWORD_HASHERS.items() if name != PASSWORD_HASHER),
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+# Passwords hashed at once per process; logins and registrations wait up to PASSWORD_HASH_WAIT seconds, then get 503
+PASSWORD_HASH_CONCURRENCY = int(os.getenv('PASSWORD_HASH_CONCURRENCY', str(os.cpu_count() or 1)))
+PASSWORD_HASH_WAIT = float(os.getenv('PASSWORD_HASH_WAIT', '5'))
+
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
 
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# "stateless" authenticates from the token claims and loads the User row only when a view needs it
+JWT_AUTHENTICATION = os.getenv('JWT_AUTHENTICATION', 'database')
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'rest_framework_simplejwt.authentication.JWTStatelessUserAuthentication'
+        if JWT_AUTHENTICATION == 'stateless'
+        else 'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.CreatedAtCursorPagination',
+    'PAGE_SIZE': int(os.getenv('API_PAGE_SIZE', '50')),
 }
 
+# List endpoints served by the serializer-free read path (api.fastpath), e.g. "products,invoices"
+FAST_READ_ENDPOINTS = {name.strip() for name in os.getenv('FAST_READ_ENDPOINTS', '').split(',') if name.strip()}
+
+# Longest a checkout waits for a locked product row before answering 503
+CHECKOUT_LOCK_TIMEOUT = os.getenv('CHECKOUT_LOCK_TIMEOUT', '2s')
+
+# Shared OpenFoodFacts client (api.openfoodfacts); point the base URL at a stub server in tests
+OPENFOODFACTS_BASE_URL = os.getenv('OPENFOODFACTS_BASE_URL', 'https://world.openfoodfacts.org')
+OPENFOODFACTS_RATE_LIMIT = float(os.getenv('OPENFOODFACTS_RATE_LIMIT', '2'))  # requests per second
+OPENFOODFACTS_BURST = int(os.getenv('OPENFOODFACTS_BURST', '10'))
+OPENFOODFACTS_CONCURRENCY = int(os.getenv('OPENFOODFACTS_CONCURRENCY', '4'))
+OPENFOODFACTS_RETRIES = int(os.getenv('OPENFOODFACTS_RETRIES', '4'))
+OPENFOODFACTS_TIMEOUT = float(os.getenv('OPENFOODFACTS_TIMEOUT', '15'))
+# Responses are served from the database cache for CACHE_TTL seconds, then served stale while
+# they are refreshed for up to CACHE_STALE_TTL more; MAX_ENTRIES=0 disables the cache
+OPENFOODFACTS_CACHE_TTL = int(os.getenv('OPENFOODFACTS_CACHE_TTL', str(7 * 24 * 3600)))
+OPENFOODFACTS_CACHE_STALE_TTL = int(os.getenv('OPENFOODFACTS_CACHE_STALE_TTL', str(30 * 24 * 3600)))
+OPENFOODFACTS_CACHE_MAX_ENTRIES = int(os.getenv('OPENFOODFACTS_CACHE_MAX_ENTRIES', '50000'))
+
+# Enrichment job queue (api.enrichment): attempts before a job fails, base retry delay and worker lease, in seconds
+ENRICHMENT_MAX_ATTEMPTS = int(os.getenv('ENRICHMENT_MAX_ATTEMPTS', '5'))
+ENRICHMENT_RETRY_DELAY = int(os.getenv('ENRICHMENT_RETRY_DELAY', '30'))
+ENRICHMENT_LEASE = int(os.getenv('ENRICHMENT_LEASE', '300'))
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
+    # User built from the claims by the stateless authentication
+    'TOKEN_USER_CLASS': 'api.authentication.ClaimsUser',
 }
 
 # drf-spectacular (OpenAPI / Swagger)
@@ -4,4 +4,6 @@ set -e
 python manage.py migrate --noinput
 python manage.py collectstatic --noinput || true
 
-exec gunicorn backend.wsgi:application --bind 0.0.0.0:8000
+# Threaded workers: while some threads hash passwords (bounded by PASSWORD_HASH_CONCURRENCY), others keep serving
+exec gunicorn backend.wsgi:application --bind 0.0.0.0:8000 \
+    --worker-class gthread --workers "${GUNICORN_WORKERS:-2}" --threads "${GUNICORN_THREADS:-8}"
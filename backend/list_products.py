@@ -41,11 +41,10 @@ for score in ['A', 'B', 'C', 'D', 'E', '']:
         print("-" * 100)
         for idx, p in enumerate(products_in_score, 1):
             nutrition = ""
-            if p.nutritional_info:
-                kcal = p.nutritional_info.get('energy_kcal')
-                protein = p.nutritional_info.get('protein_g')
-                if kcal and protein:
-                    nutrition = f" | {kcal} kcal, {protein}g protein"
+            kcal = p.energy_kcal_100g
+            protein = p.proteins_100g
+            if kcal is not None and protein is not None:
+                nutrition = f" | {kcal:g} kcal, {protein:g}g protein"
             print(f"  {idx}. {p.name}")
             print(f"     Brand: {p.brand:30} | Category: {p.category:25} | Price: ${p.price:6}{nutrition}")
 
@@ -1,13 +1,16 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { getProducts, getInvoices } from '../services/api';
+import { getProducts, getProductCategories, getInvoices, getNextPage, checkout } from '../services/api';
 import '../styles/CustomerDashboard.css';
 import html2pdf from 'html2pdf.js';
 
 export default function CustomerDashboard() {
   const navigate = useNavigate();
   const [products, setProducts] = useState([]);
-  const [filteredProducts, setFilteredProducts] = useState([]);
+  const [categories, setCategories] = useState(['All']);
+  const [productsPage, setProductsPage] = useState(null);
+  const [invoicesPage, setInvoicesPage] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
   const [searchTerm, setSearchTerm] = useState('');
@@ -19,11 +22,13 @@ export default function CustomerDashboard() {
   const [invoices, setInvoices] = useState([]);
   const [selectedInvoice, setSelectedInvoice] = useState(null);
   const [showInvoiceModal, setShowInvoiceModal] = useState(false);
+  // Bumped per product query so a slow response cannot overwrite a newer filter's results
+  const productsRequest = useRef(0);
 
   const username = localStorage.getItem('username') || 'Customer';
 
   useEffect(() => {
-    loadDashboardData();
+    loadCategories();
     loadInvoices();
     // Load cart from localStorage
     const savedCart = localStorage.getItem('customer_cart');
@@ -32,19 +37,59 @@ export default function CustomerDashboard() {
     }
   }, []);
 
-  const loadDashboardData = async () => {
+  // The server filters; a new search or category starts again from the first page
+  useEffect(() => {
+    // Debounced so typing does not send a request per keystroke
+    const timer = setTimeout(() => loadDashboardData(searchTerm, selectedCategory), searchTerm ? 300 : 0);
+    return () => clearTimeout(timer);
+  }, [searchTerm, selectedCategory]);
+
+  const loadDashboardData = async (search = searchTerm, category = selectedCategory) => {
+    const request = ++productsRequest.current;
+    const params = {};
+    if (search.trim()) params.search = search.trim();
+    if (category !== 'All') params.category = category;
     try {
       setLoading(true);
-      const response = await getProducts();
+      const response = await getProducts(params);
+      if (request !== productsRequest.current) return;
       setProducts(Array.isArray(response.data) ? response.data : []);
+      setProductsPage(response);
       setError('');
-      filterProducts(response.data, '', 'All');
     } catch (err) {
+      if (request !== productsRequest.current) return;
       console.error('Load products error:', err);
       setError('Failed to load products');
       setProducts([]);
+      setProductsPage(null);
+    } finally {
+      if (request === productsRequest.current) setLoading(false);
+    }
+  };
+
+  const loadCategories = async () => {
+    try {
+      const response = await getProductCategories();
+      setCategories(['All', ...response.data]);
+    } catch (err) {
+      console.error('Load categories error:', err);
+    }
+  };
+
+  const loadMoreProducts = async () => {
+    const request = productsRequest.current;
+    try {
+      setLoadingMore(true);
+      // The next link carries the current search and category
+      const response = await getNextPage(productsPage);
+      if (request !== productsRequest.current) return;
+      setProducts(prev => [...prev, ...response.data]);
+      setProductsPage(response);
+    } catch (err) {
+      console.error('Load more products error:', err);
+      setError('Failed to load more products');
     } finally {
-      setLoading(false);
+      setLoadingMore(false);
     }
   };
 
@@ -52,11 +97,25 @@ export default function CustomerDashboard() {
     try {
       const response = await getInvoices();
       setInvoices(Array.isArray(response.data) ? response.data : []);
+      setInvoicesPage(response);
     } catch (err) {
       console.error('Load invoices error:', err);
     }
   };
 
+  const loadMoreInvoices = async () => {
+    try {
+      setLoadingMore(true);
+      const response = await getNextPage(invoicesPage);
+      setInvoices(prev => [...prev, ...response.data]);
+      setInvoicesPage(response);
+    } catch (err) {
+      console.error('Load more invoices error:', err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const addToCart = (product) => {
     const existingItem = cart.find(item => item.id === product.id);
     
@@ -98,26 +157,32 @@ export default function CustomerDashboard() {
     return cart.reduce((total, item) => total + (parseFloat(item.price) * item.quantity), 0);
   };
 
-  const checkoutCart = () => {
+  const checkoutCart = async () => {
     if (cart.length === 0) {
       alert('Your cart is empty!');
       return;
     }
     
-    // Create a new invoice
-    const newInvoice = {
-      id: Date.now(),
-      items: cart,
-      total: getCartTotal(),
-      created_at: new Date().toLocaleString(),
-      status: 'Completed'
-    };
-    
-    setInvoices([newInvoice, ...invoices]);
-    setCart([]);
-    localStorage.removeItem('customer_cart');
-    setActiveTab('invoices');
-    alert('✅ Purchase successful! Your invoice has been created.');
+    try {
+      // The server prices the cart, checks stock and creates the invoice in one transaction
+      const response = await checkout(cart.map(item => ({ product_id: item.id, quantity: item.quantity })));
+      setInvoices([response.data, ...invoices]);
+      setCart([]);
+      localStorage.removeItem('customer_cart');
+      setActiveTab('invoices');
+      loadDashboardData();
+      alert('✅ Purchase successful! Your invoice has been created.');
+    } catch (err) {
+      console.error('Checkout error:', err);
+      if (err.response?.status === 409) {
+        const names = err.response.data.items
+          .map(short => cart.find(item => item.id === short.product_id)?.name || `#${short.product_id}`)
+          .join(', ');
+        alert(`❌ Not enough stock for: ${names}`);
+      } else {
+        alert('❌ Checkout failed, please try again.');
+      }
+    }
   };
 
   const downloadInvoicePDF = (invoice) => {
@@ -148,7 +213,7 @@ export default function CustomerDashboard() {
           <tbody>
             ${invoice.items.map(item => `
               <tr>
-                <td style="border: 1px solid #ddd; padding: 10px;">${item.name} (${item.brand})</td>
+                <td style="border: 1px solid #ddd; padding: 10px;">${item.product_name ?? item.name}</td>
                 <td style="border: 1px solid #ddd; padding: 10px; text-align: center;">${item.quantity}</td>
                 <td style="border: 1px solid #ddd; padding: 10px; text-align: right;">$${parseFloat(item.price).toFixed(2)}</td>
                 <td style="border: 1px solid #ddd; padding: 10px; text-align: right;">$${(parseFloat(item.price) * item.quantity).toFixed(2)}</td>
@@ -160,7 +225,7 @@ export default function CustomerDashboard() {
         <hr style="border: 1px solid #ddd; margin-top: 20px;">
         
         <div style="text-align: right; margin-top: 20px;">
-          <h3>Total: $${invoice.total.toFixed(2)}</h3>
+          <h3>Total: $${parseFloat(invoice.total).toFixed(2)}</h3>
         </div>
         
         <hr style="border: 1px solid #ddd;">
@@ -222,29 +287,12 @@ export default function CustomerDashboard() {
     return 'Other';
   };
 
-  const filterProducts = (productList, search, category) => {
-    let result = productList.filter(p => {
-      const matchesSearch = p.name.toLowerCase().includes(search.toLowerCase()) ||
-        (p.brand && p.brand.toLowerCase().includes(search.toLowerCase())) ||
-        (p.category && p.category.toLowerCase().includes(search.toLowerCase()));
-      
-      const productCategory = categorizeProduct(p);
-      const matchesCategory = category === 'All' || productCategory === category;
-      
-      return matchesSearch && matchesCategory;
-    });
-    
-    setFilteredProducts(result);
-  };
-
   const handleSearch = (value) => {
     setSearchTerm(value);
-    filterProducts(products, value, selectedCategory);
   };
 
   const handleCategoryFilter = (category) => {
     setSelectedCategory(category);
-    filterProducts(products, searchTerm, category);
   };
 
   const openNutritionModal = (product) => {
@@ -288,8 +336,6 @@ export default function CustomerDashboard() {
     navigate('/login');
   };
 
-  const categories = ['All', 'Fruits and vegetables', 'Grains and cereals', 'Meat and poultry', 'Fish and seafood', 'Dairy and dairy alternatives', 'Fats and oils', 'Sugars and confectionery', 'Beverages', 'Ready-to-eat and convenience foods', 'Condiments, sauces, and spices'];
-
   return (
     <div className="customer-dashboard">
       {/* Tab Navigation */}
@@ -310,7 +356,7 @@ export default function CustomerDashboard() {
           className={`tab-btn ${activeTab === 'invoices' ? 'active' : ''}`}
           onClick={() => setActiveTab('invoices')}
         >
-          🧾 Invoices ({invoices.length})
+          🧾 Invoices ({invoices.length}{invoicesPage?.next ? '+' : ''})
         </button>
       </div>
 
@@ -324,7 +370,7 @@ export default function CustomerDashboard() {
             <div className="search-container">
               <input
                 type="text"
-                placeholder="Search products by name, brand, or category..."
+                placeholder="Search products by name, brand, or barcode..."
                 value={searchTerm}
                 onChange={(e) => handleSearch(e.target.value)}
                 className="search-input"
@@ -349,12 +395,12 @@ export default function CustomerDashboard() {
 
             {loading ? (
               <div className="loading">Loading products...</div>
-            ) : filteredProducts.length === 0 ? (
+            ) : products.length === 0 ? (
               <div className="no-products">No products found</div>
             ) : (
               <>
                 <div className="products-grid">
-                  {filteredProducts.map(product => (
+                  {products.map(product => (
                     <div key={product.id} className="product-card">
                       <div className="product-image">
                         {product.picture ? (
@@ -398,8 +444,13 @@ export default function CustomerDashboard() {
                   ))}
                 </div>
                 <div className="products-count">
-                  Showing {filteredProducts.length} product(s)
+                  Showing {products.length} product(s)
                 </div>
+                {productsPage?.next && (
+                  <button className="btn-continue-shopping" onClick={loadMoreProducts} disabled={loadingMore}>
+                    {loadingMore ? 'Loading...' : 'Load more products'}
+                  </button>
+                )}
               </>
             )}
           </>
@@ -514,7 +565,7 @@ export default function CustomerDashboard() {
                       <td>#{invoice.id}</td>
                       <td>{invoice.created_at}</td>
                       <td>{invoice.items.length} items</td>
-                      <td>${invoice.total.toFixed(2)}</td>
+                      <td>${parseFloat(invoice.total).toFixed(2)}</td>
                       <td><span className="status-badge completed">{invoice.status}</span></td>
                       <td>
                         <button 
@@ -535,6 +586,11 @@ export default function CustomerDashboard() {
                 </tbody>
               </table>
             )}
+            {invoicesPage?.next && (
+              <button className="btn-continue-shopping" onClick={loadMoreInvoices} disabled={loadingMore}>
+                {loadingMore ? 'Loading...' : 'Load more invoices'}
+              </button>
+            )}
           </div>
         )}
       </div>
@@ -665,7 +721,7 @@ export default function CustomerDashboard() {
                 <tbody>
                   {selectedInvoice.items.map(item => (
                     <tr key={item.id}>
-                      <td>{item.name} ({item.brand})</td>
+                      <td>{item.product_name ?? item.name}</td>
                       <td>{item.quantity}</td>
                       <td>${parseFloat(item.price).toFixed(2)}</td>
                       <td>${(parseFloat(item.price) * item.quantity).toFixed(2)}</td>
@@ -675,7 +731,7 @@ export default function CustomerDashboard() {
               </table>
 
               <div className="invoice-total">
-                <h3>Total: ${selectedInvoice.total.toFixed(2)}</h3>
+                <h3>Total: ${parseFloat(selectedInvoice.total).toFixed(2)}</h3>
               </div>
 
               <div className="invoice-actions">
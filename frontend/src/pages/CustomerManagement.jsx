@@ -1,9 +1,11 @@
 import React, { useState, useEffect } from 'react';
-import { getCustomers, createCustomer, updateCustomer, deleteCustomer } from '../services/api';
+import { getCustomers, getNextPage, createCustomer, updateCustomer, deleteCustomer } from '../services/api';
 
 export default function CustomerManagement() {
   const [customers, setCustomers] = useState([]);
+  const [lastPage, setLastPage] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState('');
   const [showModal, setShowModal] = useState(false);
   const [editingCustomer, setEditingCustomer] = useState(null);
@@ -27,16 +29,32 @@ export default function CustomerManagement() {
       setLoading(true);
       const response = await getCustomers();
       setCustomers(Array.isArray(response.data) ? response.data : []);
+      setLastPage(response);
       setError('');
     } catch (err) {
       console.error('Load customers error:', err);
       setError('Failed to load customers');
       setCustomers([]);
+      setLastPage(null);
     } finally {
       setLoading(false);
     }
   };
 
+  const loadMoreCustomers = async () => {
+    try {
+      setLoadingMore(true);
+      const response = await getNextPage(lastPage);
+      setCustomers(prev => [...prev, ...response.data]);
+      setLastPage(response);
+    } catch (err) {
+      console.error('Load more customers error:', err);
+      setError('Failed to load more customers');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleSubmit = async (e) => {
     e.preventDefault();
     try {
@@ -198,6 +216,16 @@ export default function CustomerManagement() {
         </tbody>
       </table>
 
+      {lastPage?.next && (
+        <button
+          onClick={loadMoreCustomers}
+          disabled={loadingMore}
+          style={{ marginTop: '15px', padding: '10px 20px', cursor: 'pointer', backgroundColor: '#007bff', color: 'white', border: 'none', borderRadius: '4px' }}
+        >
+          {loadingMore ? 'Loading...' : 'Load more'}
+        </button>
+      )}
+
       {showModal && (
         <div style={{
           position: 'fixed',
@@ -1,5 +1,5 @@
-import React, { useState, useEffect } from 'react';
-import { getProducts, getCustomers, getInvoices } from '../services/api';
+import React, { useState, useEffect, useRef } from 'react';
+import { getProducts, getProductCategories, getInvoices, getNextPage, getStats } from '../services/api';
 import './Dashboard.css';
 
 export default function Dashboard() {
@@ -14,7 +14,9 @@ export default function Dashboard() {
     topProducts: []
   });
   const [products, setProducts] = useState([]);
-  const [filteredProducts, setFilteredProducts] = useState([]);
+  const [categories, setCategories] = useState(['All']);
+  const [productsPage, setProductsPage] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [searchTerm, setSearchTerm] = useState('');
   const [selectedCategory, setSelectedCategory] = useState('All');
   const [selectedProduct, setSelectedProduct] = useState(null);
@@ -22,20 +24,8 @@ export default function Dashboard() {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
 
-  // Product categories
-  const categories = [
-    'All',
-    'Fruits and vegetables',
-    'Grains and cereals',
-    'Meat and poultry',
-    'Fish and seafood',
-    'Dairy and dairy alternatives',
-    'Fats and oils',
-    'Sugars and confectionery',
-    'Beverages',
-    'Ready-to-eat and convenience foods',
-    'Condiments, sauces, and spices'
-  ];
+  // Bumped per product query so a slow response cannot overwrite a newer filter's results
+  const productsRequest = useRef(0);
 
   // Categorize products based on keywords
   const categorizeProduct = (product) => {
@@ -70,70 +60,40 @@ export default function Dashboard() {
     loadDashboardData();
   }, []);
 
-  // Filter products based on search and category
+  // The server filters; a new search or category starts again from the first page
   useEffect(() => {
-    let filtered = products;
-
-    // Category filter
-    if (selectedCategory !== 'All') {
-      filtered = filtered.filter(p => categorizeProduct(p) === selectedCategory);
-    }
-
-    // Search filter
-    if (searchTerm) {
-      filtered = filtered.filter(p =>
-        p.name.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        p.brand.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        p.category.toLowerCase().includes(searchTerm.toLowerCase())
-      );
-    }
-
-    setFilteredProducts(filtered);
-  }, [searchTerm, selectedCategory, products]);
+    // Debounced so typing does not send a request per keystroke
+    const timer = setTimeout(() => loadProducts(searchTerm, selectedCategory), searchTerm ? 300 : 0);
+    return () => clearTimeout(timer);
+  }, [searchTerm, selectedCategory]);
 
   const loadDashboardData = async () => {
     try {
       setLoading(true);
       
-      const [productsRes, customersRes, invoicesRes] = await Promise.all([
-        getProducts(),
-        getCustomers(),
-        getInvoices()
+      const [statsRes, recentRes, categoriesRes] = await Promise.all([
+        getStats(),
+        getInvoices({ page_size: 5 }),
+        getProductCategories()
       ]);
 
-      const productsData = Array.isArray(productsRes.data) ? productsRes.data : [];
-      const customers = Array.isArray(customersRes.data) ? customersRes.data : [];
-      const invoices = Array.isArray(invoicesRes.data) ? invoicesRes.data : [];
+      const stats = statsRes.data;
 
-      setProducts(productsData);
-      setFilteredProducts(productsData);
+      setCategories(['All', ...categoriesRes.data]);
 
-      // Calculate KPIs
-      const totalRevenue = invoices.reduce((sum, inv) => sum + parseFloat(inv.total), 0);
-      const averageInvoiceAmount = invoices.length > 0 ? totalRevenue / invoices.length : 0;
-      const inventoryValue = productsData.reduce((sum, prod) => sum + (parseFloat(prod.price) * prod.quantity), 0);
-      
-      const recentInvoices = invoices
-        .sort((a, b) => new Date(b.created_at) - new Date(a.created_at))
-        .slice(0, 5);
-
-      const topProducts = productsData
-        .map(p => ({
+      // KPIs are aggregated server-side by /api/stats/
+      setKpis({
+        totalRevenue: parseFloat(stats.invoices.total_revenue),
+        totalProducts: stats.products.count,
+        totalCustomers: stats.customers.count,
+        totalInvoices: stats.invoices.count,
+        averageInvoiceAmount: parseFloat(stats.invoices.average_amount),
+        inventoryValue: parseFloat(stats.products.inventory_value),
+        recentInvoices: Array.isArray(recentRes.data) ? recentRes.data : [],
+        topProducts: stats.top_products.map(p => ({
           ...p,
-          inventoryValue: parseFloat(p.price) * p.quantity
+          inventoryValue: parseFloat(p.inventory_value)
         }))
-        .sort((a, b) => b.inventoryValue - a.inventoryValue)
-        .slice(0, 5);
-
-      setKpis({
-        totalRevenue,
-        totalProducts: productsData.length,
-        totalCustomers: customers.length,
-        totalInvoices: invoices.length,
-        averageInvoiceAmount,
-        inventoryValue,
-        recentInvoices,
-        topProducts
       });
 
       setError('');
@@ -145,6 +105,40 @@ export default function Dashboard() {
     }
   };
 
+  const loadProducts = async (search, category) => {
+    const request = ++productsRequest.current;
+    const params = {};
+    if (search.trim()) params.search = search.trim();
+    if (category !== 'All') params.category = category;
+    try {
+      const response = await getProducts(params);
+      if (request !== productsRequest.current) return;
+      setProducts(Array.isArray(response.data) ? response.data : []);
+      setProductsPage(response);
+    } catch (err) {
+      if (request !== productsRequest.current) return;
+      console.error('Load products error:', err);
+      setError('Failed to load products: ' + err.message);
+    }
+  };
+
+  const loadMoreProducts = async () => {
+    const request = productsRequest.current;
+    try {
+      setLoadingMore(true);
+      // The next link carries the current search and category
+      const response = await getNextPage(productsPage);
+      if (request !== productsRequest.current) return;
+      setProducts(prev => [...prev, ...response.data]);
+      setProductsPage(response);
+    } catch (err) {
+      console.error('Load more products error:', err);
+      setError('Failed to load more products: ' + err.message);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const formatCurrency = (amount) => {
     return `$${parseFloat(amount).toFixed(2)}`;
   };
@@ -257,7 +251,7 @@ export default function Dashboard() {
         <div className="search-container">
           <input
             type="text"
-            placeholder="🔍 Search products by name, brand, or category..."
+            placeholder="🔍 Search products by name, brand, or barcode..."
             value={searchTerm}
             onChange={(e) => setSearchTerm(e.target.value)}
             className="search-input"
@@ -282,10 +276,10 @@ export default function Dashboard() {
 
         {/* Products Grid */}
         <div className="products-grid">
-          {filteredProducts.length === 0 ? (
+          {products.length === 0 ? (
             <p className="no-products">No products found matching your criteria.</p>
           ) : (
-            filteredProducts.map(product => (
+            products.map(product => (
               <div key={product.id} className="product-card">
                 <div className="product-image">
                   {product.picture ? (
@@ -326,8 +320,13 @@ export default function Dashboard() {
           )}
         </div>
         
-        {filteredProducts.length > 0 && (
-          <p className="products-count">Showing {filteredProducts.length} of {products.length} products</p>
+        {products.length > 0 && (
+          <p className="products-count">Showing {products.length} product(s)</p>
+        )}
+        {productsPage?.next && (
+          <button className="btn-load-more" onClick={loadMoreProducts} disabled={loadingMore}>
+            {loadingMore ? 'Loading...' : 'Load more products'}
+          </button>
         )}
       </div>
 
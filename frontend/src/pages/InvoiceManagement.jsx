@@ -1,11 +1,13 @@
 import React, { useState, useEffect } from 'react';
-import { getInvoices, createInvoice, updateInvoice, deleteInvoice, getCustomers, getProducts } from '../services/api';
+import { getInvoices, getNextPage, getAllPages, createInvoice, updateInvoice, deleteInvoice, getCustomers, getProducts } from '../services/api';
 import jsPDF from 'jspdf';
 
 export default function InvoiceManagement() {
   const [invoices, setInvoices] = useState([]);
+  const [lastPage, setLastPage] = useState(null);
   const [customers, setCustomers] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState('');
   const [showModal, setShowModal] = useState(false);
   const [editingInvoice, setEditingInvoice] = useState(null);
@@ -24,25 +26,42 @@ export default function InvoiceManagement() {
       setLoading(true);
       const [invoicesRes, customersRes] = await Promise.all([
         getInvoices(),
-        getCustomers()
+        // Every invoice's customer name and the form's select need the whole list
+        getAllPages(getCustomers())
       ]);
       
       const invoicesData = Array.isArray(invoicesRes.data) ? invoicesRes.data : [];
       const customersData = Array.isArray(customersRes.data) ? customersRes.data : [];
       
       setInvoices(invoicesData);
+      setLastPage(invoicesRes);
       setCustomers(customersData);
       setError('');
     } catch (err) {
       console.error('Load error:', err);
       setError('Failed to load data');
       setInvoices([]);
+      setLastPage(null);
       setCustomers([]);
     } finally {
       setLoading(false);
     }
   };
 
+  const loadMoreInvoices = async () => {
+    try {
+      setLoadingMore(true);
+      const response = await getNextPage(lastPage);
+      setInvoices(prev => [...prev, ...response.data]);
+      setLastPage(response);
+    } catch (err) {
+      console.error('Load more invoices error:', err);
+      setError('Failed to load more invoices');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleSubmit = async (e) => {
     e.preventDefault();
     try {
@@ -236,6 +255,16 @@ export default function InvoiceManagement() {
         </tbody>
       </table>
 
+      {lastPage?.next && (
+        <button
+          onClick={loadMoreInvoices}
+          disabled={loadingMore}
+          style={{ marginTop: '15px', padding: '10px 20px', cursor: 'pointer', backgroundColor: '#007bff', color: 'white', border: 'none', borderRadius: '4px' }}
+        >
+          {loadingMore ? 'Loading...' : 'Load more'}
+        </button>
+      )}
+
       {showModal && (
         <div style={{
           position: 'fixed',
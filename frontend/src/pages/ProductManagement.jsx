@@ -1,9 +1,11 @@
 import React, { useState, useEffect } from 'react';
-import { getProducts, createProduct, updateProduct, deleteProduct, searchOpenFoodFacts } from '../services/api';
+import { getProducts, getNextPage, createProduct, updateProduct, deleteProduct, searchOpenFoodFacts } from '../services/api';
 
 export default function ProductManagement() {
   const [products, setProducts] = useState([]);
+  const [lastPage, setLastPage] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState('');
   const [showModal, setShowModal] = useState(false);
   const [editingProduct, setEditingProduct] = useState(null);
@@ -31,17 +33,33 @@ export default function ProductManagement() {
       setLoading(true);
       const response = await getProducts();
       setProducts(Array.isArray(response.data) ? response.data : []);
+      setLastPage(response);
       setError('');
       setSelectedProducts(new Set());
     } catch (err) {
       console.error('Load products error:', err);
       setError('Failed to load products');
       setProducts([]);
+      setLastPage(null);
     } finally {
       setLoading(false);
     }
   };
 
+  const loadMoreProducts = async () => {
+    try {
+      setLoadingMore(true);
+      const response = await getNextPage(lastPage);
+      setProducts(prev => [...prev, ...response.data]);
+      setLastPage(response);
+    } catch (err) {
+      console.error('Load more products error:', err);
+      setError('Failed to load more products');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleSubmit = async (e) => {
     e.preventDefault();
     try {
@@ -369,8 +387,14 @@ export default function ProductManagement() {
           </div>
 
           <div className="products-count">
-            Total: {filteredProducts.length} product(s)
+            Total: {filteredProducts.length} product(s){lastPage?.next && ' loaded'}
           </div>
+
+          {lastPage?.next && (
+            <button className="btn-primary" onClick={loadMoreProducts} disabled={loadingMore}>
+              {loadingMore ? 'Loading...' : 'Load more'}
+            </button>
+          )}
         </>
       )}
 
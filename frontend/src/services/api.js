@@ -76,26 +76,57 @@ export const logout = () => {
   localStorage.removeItem('username');
 };
 
+// List endpoints are cursor-paginated ({ next, previous, results });
+// expose the current page as `data` and keep the cursor links alongside it
+const unwrapPage = (response) => ({
+  ...response,
+  data: response.data.results,
+  next: response.data.next,
+  previous: response.data.previous,
+});
+
+// Fetch the page after `page` (a result of one of the list getters below);
+// `next` already carries the cursor and the original filters
+export const getNextPage = (page) => api
+  .get(page.config.url, { params: Object.fromEntries(new URL(page.next).searchParams) })
+  .then(unwrapPage);
+
+// Follow `next` until the last page, for lists that must be complete (e.g. a select's options)
+export const getAllPages = async (firstPage) => {
+  let page = await firstPage;
+  const data = [...page.data];
+  while (page.next) {
+    page = await getNextPage(page);
+    data.push(...page.data);
+  }
+  return { ...page, data, next: null };
+};
+
 // Products
-export const getProducts = () => api.get('/products/');
+export const getProducts = (params) => api.get('/products/', { params }).then(unwrapPage);
+export const getProductCategories = () => api.get('/products/categories/');
 export const getProduct = (id) => api.get(`/products/${id}/`);
 export const createProduct = (data) => api.post('/products/', data);
 export const updateProduct = (id, data) => api.put(`/products/${id}/`, data);
 export const deleteProduct = (id) => api.delete(`/products/${id}/`);
 
 // Customers
-export const getCustomers = () => api.get('/customers/');
+export const getCustomers = (params) => api.get('/customers/', { params }).then(unwrapPage);
 export const getCustomer = (id) => api.get(`/customers/${id}/`);
 export const createCustomer = (data) => api.post('/customers/', data);
 export const updateCustomer = (id, data) => api.put(`/customers/${id}/`, data);
 export const deleteCustomer = (id) => api.delete(`/customers/${id}/`);
 
 // Invoices
-export const getInvoices = () => api.get('/invoices/');
+export const getInvoices = (params) => api.get('/invoices/', { params }).then(unwrapPage);
 export const getInvoice = (id) => api.get(`/invoices/${id}/`);
 export const createInvoice = (data) => api.post('/invoices/', data);
 export const updateInvoice = (id, data) => api.put(`/invoices/${id}/`, data);
 export const deleteInvoice = (id) => api.delete(`/invoices/${id}/`);
+export const checkout = (items) => api.post('/invoices/checkout/', { items });
+
+// Dashboard
+export const getStats = (params) => api.get('/stats/', { params });
 
 // OpenFoodFacts
 export const searchOpenFoodFacts = async (query) => {